@@ -3,9 +3,16 @@ from pathlib import Path
 from datetime import datetime
 import sys
 import pandas as pd
-import requests
-import json
 import strprofiler.utils as utils
+from strprofiler.shiny_app.clastr_api import (
+    CLASTR_BATCH_URL,
+    BATCH_CHUNK_SIZE,
+    BATCH_MAX_WORKERS,
+    BATCH_RETRIES,
+    _clastr_batch_sheets,
+    _batch_sheets_to_xlsx,
+    _batch_sheets_to_csv_chunks,
+)
 
 
 @click.command(name="clastr")
@@ -92,6 +99,49 @@ import strprofiler.utils as utils
     show_default=True,
     type=bool,
 )
+@click.option(
+    "-cs",
+    "--chunk_size",
+    default=BATCH_CHUNK_SIZE,
+    help="Maximum number of samples submitted to the CLASTR API per request.",
+    show_default=True,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "-w",
+    "--workers",
+    default=BATCH_MAX_WORKERS,
+    help="Maximum number of concurrent requests to the CLASTR API.",
+    show_default=True,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "-rt",
+    "--retries",
+    default=BATCH_RETRIES,
+    help="Number of times to retry a failed request before giving up on its samples.",
+    show_default=True,
+    type=click.IntRange(min=0),
+)
+@click.option(
+    "-cache",
+    "--use_cache",
+    help="""Whether to use the on-disk cache of CLASTR results.
+              Repeat queries are answered from the cache without contacting CLASTR.""",
+    default=True,
+    show_default=True,
+    type=bool,
+)
+@click.option(
+    "-of",
+    "--output_format",
+    default="xlsx",
+    help="""Output format. 'xlsx' writes one sheet per sample,
+              'csv' writes a single table with a 'Query' column identifying the sample,
+              'csv.gz' writes the same table gzip-compressed.""",
+    show_default=True,
+    type=click.Choice(["xlsx", "csv", "csv.gz"]),
+)
 @click.option(
     "-o",
     "--output_dir",
@@ -115,6 +165,11 @@ def clastr_query(
     marker_col="Marker",
     penta_fix=True,
     score_amel=False,
+    chunk_size=BATCH_CHUNK_SIZE,
+    workers=BATCH_MAX_WORKERS,
+    retries=BATCH_RETRIES,
+    use_cache=True,
+    output_format="xlsx",
 ):
     """clastr compares STR profiles to the human Cellosaurus knowledge base via the CLASTR REST API."""
 
@@ -133,7 +188,12 @@ def clastr_query(
     print("Sample column: " + str(sample_col), file=log_file)
     print("Marker column: " + str(marker_col), file=log_file)
     print("Penta fix: " + str(penta_fix), file=log_file)
-    print("Use amelogenin for scoring: " + str(score_amel) + "\n", file=log_file)
+    print("Use amelogenin for scoring: " + str(score_amel), file=log_file)
+    print("Chunk size: " + str(chunk_size), file=log_file)
+    print("Workers: " + str(workers), file=log_file)
+    print("Retries: " + str(retries), file=log_file)
+    print("Use cache: " + str(use_cache), file=log_file)
+    print("Output format: " + str(output_format) + "\n", file=log_file)
     print("Full command:", file=log_file)
 
     print(" ".join(sys.argv) + "\n", file=log_file)
@@ -159,8 +219,6 @@ def clastr_query(
               .format(str(malformed_markers)[1:-1]), file=log_file)
         print("See: https://www.cellosaurus.org/str-search/  for a complete list of compatible marker names", file=log_file)
 
-    url = "https://www.cellosaurus.org/str-search/api/batch/"
-
     clastr_query = [utils._pentafix(item, reverse=True) for item in clastr_query]
     clastr_query = [dict(item, **{"algorithm": search_algorithm}) for item in clastr_query]
     clastr_query = [dict(item, **{"scoringMode": scoring_mode}) for item in clastr_query]
@@ -170,22 +228,35 @@ def clastr_query(
     clastr_query = [dict(item, **{"maxResults": max_results}) for item in clastr_query]
     clastr_query = [dict(item, **{"outputFormat": "xlsx"}) for item in clastr_query]
 
-    print("Querying CLASTR API at: ", url, file=log_file)
-    r = requests.post(url, data=json.dumps(clastr_query))
+    print("Querying CLASTR API at: ", CLASTR_BATCH_URL, file=log_file)
+    sheets, failed = _clastr_batch_sheets(
+        clastr_query, chunk_size=chunk_size, max_workers=workers, retries=retries, use_cache=use_cache
+    )
+
+    for chunk, e in failed:
+        print("Request failed with error: '", e, "' for samples: ",
+              ", ".join(item["description"] for item in chunk), file=log_file)
 
-    try:
-        r.raise_for_status()
-    except requests.exceptions.HTTPError as e:
-        print("Request failed with error: '", e, "'", file=log_file)
-        print("Request failed with error: '", e, "'")
+    n_failed = sum(len(chunk) for chunk, _ in failed)
+    if failed and n_failed == len(clastr_query):
+        print("Request failed with error: '", failed[0][1], "'")
+        log_file.close()
         return ""
+    elif failed:
+        print(str(n_failed) + " of " + str(len(clastr_query)) + " sample(s) failed, see log for details.")
 
-    print("Response from query: ", r.status_code, file=log_file)
+    out_path = Path(output_dir, "strprofiler.clastrQueryResult." + dt_string + "." + output_format)
 
-    with open(Path(output_dir, "strprofiler.clastrQueryResult." + dt_string + ".xlsx"), "wb") as fd:
-        for chunk in r.iter_content(chunk_size=128):
-            fd.write(chunk)
+    # Results are written straight to the file, a sheet at a time for csv.
+    if output_format == "xlsx":
+        _batch_sheets_to_xlsx(sheets, out_path)
+    elif output_format == "csv":
+        with open(out_path, "w", newline="") as fd:
+            fd.writelines(_batch_sheets_to_csv_chunks(sheets))
+    else:
+        with open(out_path, "wb") as fd:
+            fd.writelines(utils._gzip_chunks(_batch_sheets_to_csv_chunks(sheets)))
 
-    print("Results saved: ", Path(output_dir, "strprofiler.clastrQueryResult." + dt_string + ".xlsx"), file=log_file)
+    print("Results saved: ", out_path, file=log_file)
 
     log_file.close()
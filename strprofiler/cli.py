@@ -1,12 +1,36 @@
+import importlib
 import rich_click as click
-from strprofiler.strprofiler import strprofiler, app
-from strprofiler.clastr import clastr_query
 
-@click.group()
+# Subcommands are imported only when invoked, so e.g. `strprofiler compare`
+# does not pay for importing shiny or requests.
+LAZY_COMMANDS = {
+    "compare": "strprofiler.strprofiler:strprofiler",
+    "app": "strprofiler.strprofiler:app",
+    "clastr": "strprofiler.clastr:clastr_query",
+    "matrix": "strprofiler.matrix:matrix",
+    "cluster": "strprofiler.cluster:cluster",
+    "db": "strprofiler.store:db",
+}
+
+
+class LazyGroup(click.RichGroup):
+    """Click group that resolves its subcommands from ``module:attribute`` paths on first use."""
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_commands and cmd_name not in self.commands:
+            module_name, attr = self.lazy_commands[cmd_name].split(":")
+            self.add_command(getattr(importlib.import_module(module_name), attr), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+
+@click.group(cls=LazyGroup, lazy_commands=LAZY_COMMANDS)
 @click.version_option()
 def cli():
     pass
-
-cli.add_command(strprofiler)
-cli.add_command(app)
-cli.add_command(clastr_query)
\ No newline at end of file
@@ -0,0 +1,253 @@
+import rich_click as click
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import strprofiler.utils as utils
+from strprofiler.profiles import ProfileSet
+from strprofiler.matrix import MATRIX_SCORES, _tiles
+
+# Edge criteria: Masters scores are directional, so a pair is linked if either direction passes.
+CLUSTER_SCORES = {
+    "tanabe": ("tanabe_score",),
+    "masters": ("masters_query_score", "masters_ref_score"),
+}
+
+
+class _UnionFind:
+    """Disjoint sets over ``0..n-1``, with path halving and union by size."""
+
+    def __init__(self, n):
+        self.parent = np.arange(n)
+        self.size = np.ones(n, dtype=np.int64)
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+    def roots(self):
+        return np.array([self.find(x) for x in range(len(self.parent))], dtype=np.int64)
+
+
+def similarity_clusters(
+    profiles,
+    score="tanabe",
+    threshold=80,
+    use_amel=False,
+    amel_col="AMEL",
+    n_query=None,
+    memory=512,
+    edges_path=None,
+    block_size=None,
+):
+    """
+    Clusters profiles into connected components of the graph linking pairs that score at or above a threshold.
+
+    Pairs are scored in tiles as for ``matrix.pairwise_matrices``, each unordered pair once and identical
+    profiles once per tile. Only pairs passing the threshold leave the tile, as edges joined with union-find.
+
+    :param profiles: Profiles to cluster. With ``n_query``, the first ``n_query`` are samples and the rest a
+        reference database, and pairs of two database profiles are not compared.
+    :type profiles: strprofiler.profiles.ProfileSet
+    :param score: "tanabe" or "masters" (either direction), defaults to "tanabe"
+    :type score: str, optional
+    :param threshold: Minimum score linking two profiles, defaults to 80
+    :type threshold: float, optional
+    :param use_amel: Whether to include amelogenin in scoring, defaults to False
+    :type use_amel: bool, optional
+    :param amel_col: Name of amelogenin marker, defaults to "AMEL"
+    :type amel_col: str, optional
+    :param n_query: Number of leading sample profiles, defaults to all
+    :type n_query: int, optional
+    :param memory: Approximate working memory for tiles in MB, defaults to 512
+    :type memory: int, optional
+    :param edges_path: csv file to write the edges to, as they are found, defaults to None
+    :type edges_path: pathlib.Path, optional
+    :param block_size: Tile edge in profiles, overriding the one derived from ``memory``
+    :type block_size: int, optional
+    :return: pd.df with one row per profile in a cluster of two or more: ``Cluster`` (numbered from 1, largest
+        first), ``Size``, ``Sample`` and ``Row`` (its row in ``profiles``).
+    :rtype: pd.DataFrame
+    """
+    if score not in CLUSTER_SCORES:
+        raise ValueError(f"Unsupported cluster score: {score}")
+    n = len(profiles)
+    n_query = n if n_query is None else n_query
+    clusters = _UnionFind(n)
+    header = True
+
+    tiles = _tiles(profiles, use_amel=use_amel, amel_col=amel_col, memory=memory, block_size=block_size,
+                   n_rows=n_query)
+    for rows_i, inv_i, rows_j, inv_j, tile, valid in tiles:
+        passed = valid & np.logical_or.reduce([tile[s] >= threshold for s in CLUSTER_SCORES[score]])
+        if not passed.any():
+            continue
+        i, j = np.nonzero(passed[np.ix_(inv_i, inv_j)])
+        a, b = rows_i[i], rows_j[j]
+        # Each pair once, and not between two database profiles.
+        keep = (a < b) & (a < n_query)
+        i, j, a, b = i[keep], j[keep], a[keep], b[keep]
+
+        for x, y in zip(a.tolist(), b.tolist()):
+            clusters.union(x, y)
+
+        if edges_path is not None and len(a):
+            edges = pd.DataFrame({"Sample A": profiles.samples[a], "Sample B": profiles.samples[b]})
+            for s in MATRIX_SCORES:
+                edges[s] = tile[s][inv_i[i], inv_j[j]]
+            edges.to_csv(edges_path, mode="w" if header else "a", header=header, index=False)
+            header = False
+
+    if edges_path is not None and header:
+        pd.DataFrame(columns=["Sample A", "Sample B", *MATRIX_SCORES]).to_csv(edges_path, index=False)
+
+    roots = clusters.roots()
+    sizes = np.bincount(roots, minlength=n)[roots]
+    rows = np.flatnonzero(sizes > 1)
+    # Largest clusters first, ties in order of their first profile.
+    first = {}
+    for r, root in zip(rows.tolist(), roots[rows].tolist()):
+        first.setdefault(root, r)
+    out = pd.DataFrame({
+        "Cluster": [first[r] for r in roots[rows].tolist()],
+        "Size": sizes[rows],
+        "Sample": profiles.samples[rows],
+        "Row": rows,
+    })
+    out.sort_values(["Size", "Cluster", "Row"], ascending=[False, True, True], inplace=True)
+    out["Cluster"] = out["Cluster"].map({c: k + 1 for k, c in enumerate(out["Cluster"].unique())})
+    return out.reset_index(drop=True)
+
+
+@click.command(name="cluster")
+@click.option(
+    "-sc",
+    "--score",
+    default="tanabe",
+    help="Score linking two samples; Masters links a pair if either direction passes.",
+    show_default=True,
+    type=click.Choice(list(CLUSTER_SCORES)),
+)
+@click.option(
+    "-th",
+    "--threshold",
+    default=80,
+    help="Minimum score linking two samples into a cluster.",
+    show_default=True,
+    type=float,
+)
+@click.option(
+    "-db",
+    "--database",
+    help="""Path to an STR database file in csv, xlsx, tsv, or txt format.
+              Samples are compared to each other and to the database, but database profiles are not
+              compared to each other.""",
+    type=click.Path(exists=True),
+)
+@click.option(
+    "-mem",
+    "--memory",
+    default=512,
+    help="Approximate working memory for comparing samples, in MB.",
+    show_default=True,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "-acol",
+    "--amel_col",
+    help="Name of Amelogenin column in STR file(s).",
+    default="AMEL",
+    show_default=True,
+    type=str,
+)
+@click.option(
+    "-scol",
+    "--sample_col",
+    help="Name of sample column in STR file(s).",
+    default="Sample",
+    show_default=True,
+    type=str,
+)
+@click.option(
+    "-mcol",
+    "--marker_col",
+    help="""Name of marker column in STR file(s).
+              Only used if format is 'wide'.""",
+    default="Marker",
+    show_default=True,
+    type=str,
+)
+@click.option(
+    "-pfix",
+    "--penta_fix",
+    help="""Whether to try to harmonize PentaE/D allele spelling.""",
+    default=True,
+    show_default=True,
+    type=bool,
+)
+@click.option(
+    "-amel",
+    "--score_amel",
+    help="""Use Amelogenin for similarity scoring.""",
+    default=False,
+    show_default=True,
+    type=bool,
+)
+@click.option(
+    "-o",
+    "--output_dir",
+    default="./STRprofiler",
+    help="Path to the output directory.",
+    show_default=True,
+    type=click.Path(),
+)
+@click.argument("input_files", required=True, type=click.Path(exists=True), nargs=-1)
+@click.version_option()
+def cluster(
+    input_files,
+    database=None,
+    output_dir="./STRprofiler",
+    score="tanabe",
+    threshold=80,
+    memory=512,
+    amel_col="AMEL",
+    sample_col="Sample",
+    marker_col="Marker",
+    penta_fix=True,
+    score_amel=False,
+):
+    """Clusters STR profiles into groups of likely-identical samples."""
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    df = utils.str_ingress(
+        paths=input_files, sample_col=sample_col, marker_col=marker_col, sample_map=None, penta_fix=penta_fix
+    )
+    df["Source"] = "input"
+    n_query = len(df)
+    if database is not None:
+        db = utils.str_ingress(
+            paths=[database], sample_col=sample_col, marker_col=marker_col, sample_map=None, penta_fix=penta_fix
+        )
+        db["Source"] = "database"
+        df = pd.concat([df, db]).fillna("")
+    sources = df.pop("Source").to_numpy()
+    profiles = ProfileSet.from_frame(df)
+
+    out = similarity_clusters(
+        profiles, score=score, threshold=threshold, use_amel=score_amel, amel_col=amel_col, n_query=n_query,
+        memory=memory, edges_path=Path(output_dir, "edges.strprofiler.csv"),
+    )
+    out.insert(3, "Source", sources[out.pop("Row").to_numpy()])
+    out.to_csv(Path(output_dir, "clusters.strprofiler.csv"), index=False)
+    print(f"Found {out['Cluster'].nunique()} clusters of {len(out)} samples.")
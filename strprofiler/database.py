@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import weakref
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import strprofiler.utils as utils
+from strprofiler.profiles import ProfileSet, Vocabulary
+
+# Bump when the on-disk layout changes so stale compiled databases are rebuilt.
+FORMAT_VERSION = 5
+
+# Arrays of a compiled database, each stored as ``<name>.npy``.
+ARRAYS = ("codes", "samples", "order", "units", "meta")
+
+# Compiled databases unused for this long may be pruned (seconds).
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+
+
+def _file_hash(path):
+    """Returns the sha256 hex digest of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _database_key(path, **ingress_kwargs):
+    """
+    Returns the cache key of a database file: a hash of its contents, the ingest options
+    and the compiled format version.
+    """
+    h = hashlib.sha256()
+    h.update(_file_hash(path).encode())
+    h.update(json.dumps(ingress_kwargs, sort_keys=True, default=str).encode())
+    h.update(str(FORMAT_VERSION).encode())
+    return h.hexdigest()
+
+
+class _Lease:
+    """
+    Shared advisory lock on a compiled database directory, held while a process uses it.
+
+    :func:`prune_databases` only removes directories it can lock exclusively, so a database
+    attached by any worker is never deleted from under it. A no-op where ``fcntl`` is unavailable.
+    """
+
+    def __init__(self, directory):
+        self._fd = None
+        if fcntl is None:
+            return
+        try:
+            self._fd = os.open(Path(directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+        except OSError:
+            self.release()
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class EncodedDatabase(ProfileSet):
+    """
+    Read-only, integer-encoded STR database: a :class:`~strprofiler.profiles.ProfileSet` with a content ``digest``
+    that can be compiled to disk. When loaded from a compiled directory all arrays are memory-mapped, so every
+    worker process attaches to the same physical pages.
+    """
+
+    __slots__ = ("digest", "directory", "_lease")
+
+    def __init__(
+        self, samples, columns, markers, vocab, codes, meta, digest=None, order=None, directory=None, meta_columns=None,
+        units=None,
+    ):
+        super().__init__(
+            samples, columns, markers, vocab, codes, meta, order=order, meta_columns=meta_columns, units=units
+        )
+        self.digest = digest
+        self.directory = directory
+        self._lease = None
+        if directory is not None:
+            self._lease = _Lease(directory)
+            weakref.finalize(self, self._lease.release)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Loads a compiled database written by :meth:`save`, validating its checksums.
+
+        :param directory: Directory holding the compiled database.
+        :type directory: pathlib.Path
+        :param mmap: Whether to memory-map the arrays rather than read them, defaults to True
+        :type mmap: bool, optional
+        :raises ValueError: If the compiled database is incomplete, stale or corrupt.
+        :return: The encoded database.
+        :rtype: EncodedDatabase
+        """
+        directory = Path(directory)
+        try:
+            with open(directory / "meta.json") as f:
+                header = json.load(f)
+            if header.get("version") != FORMAT_VERSION:
+                raise ValueError(f"format version {header.get('version')}")
+            # Plain ndarray views of the maps; np.memmap's subclass hooks make row access much slower.
+            arrays = {a: np.asarray(np.load(directory / f"{a}.npy", mmap_mode="r" if mmap else None)) for a in ARRAYS}
+        except (OSError, ValueError, KeyError) as e:
+            raise ValueError(f"Compiled database in {directory} is unreadable: {e}")
+
+        for a, arr in arrays.items():
+            if hashlib.sha256(np.ascontiguousarray(arr)).hexdigest() != header["checksums"][a]:
+                raise ValueError(f"Compiled database in {directory} failed validation ({a}).")
+
+        # Mark the database as recently used, so pruning keeps it.
+        os.utime(directory)
+
+        return cls(
+            arrays["samples"], header["columns"], header["markers"],
+            Vocabulary.from_alleles(header["markers"], header["alleles"]), arrays["codes"], arrays["meta"],
+            header["digest"], order=arrays["order"], directory=directory, meta_columns=header["meta_columns"],
+            units=arrays["units"],
+        )
+
+    def save(self, directory):
+        """
+        Writes the compiled database to a directory.
+
+        :param directory: Directory to write the ``.npy`` arrays and ``meta.json`` into.
+        :type directory: pathlib.Path
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        checksums = {}
+        for a in ARRAYS:
+            arr = np.ascontiguousarray(getattr(self, a))
+            np.save(directory / f"{a}.npy", arr)
+            checksums[a] = hashlib.sha256(arr).hexdigest()
+        header = {
+            "version": FORMAT_VERSION,
+            "digest": self.digest,
+            "columns": self.columns,
+            "markers": self.markers,
+            "meta_columns": self.meta_columns,
+            "alleles": self.alleles,
+            "checksums": checksums,
+        }
+        with open(directory / "meta.json", "w") as f:
+            json.dump(header, f)
+
+    def close(self):
+        """Releases this process's hold on the compiled directory, allowing it to be pruned once unused."""
+        if self._lease is not None:
+            self._lease.release()
+
+
+def compile_database(path, cache_dir=None, **ingress_kwargs):
+    """
+    Parses a database file and writes its compiled form to the cache, keyed by content hash.
+
+    :param path: STR database file in csv, xlsx, tsv, or txt format.
+    :type path: pathlib.Path
+    :param cache_dir: Directory holding compiled databases, defaults to the user cache dir
+    :type cache_dir: pathlib.Path, optional
+    :param ingress_kwargs: Options passed to ``str_ingress``.
+    :return: Directory of the compiled database.
+    :rtype: pathlib.Path
+    """
+    cache_dir = Path(cache_dir) if cache_dir is not None else utils._user_cache_dir("databases")
+    key = _database_key(path, **ingress_kwargs)
+    target = cache_dir / key
+
+    df = utils.str_ingress([path], **ingress_kwargs)
+    db = EncodedDatabase.from_frame(df, digest=key)
+
+    # Write to a scratch dir and rename into place, so concurrent workers never see a partial database.
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    scratch = Path(tempfile.mkdtemp(dir=cache_dir, prefix=".tmp-"))
+    try:
+        db.save(scratch)
+        if target.exists():
+            shutil.rmtree(target, ignore_errors=True)
+        os.replace(scratch, target)
+    except OSError:
+        # Another process got there first.
+        shutil.rmtree(scratch, ignore_errors=True)
+    return target
+
+
+def load_database(path, cache_dir=None, use_cache=True, **ingress_kwargs):
+    """
+    Loads an STR database, memory-mapping a previously compiled copy when one matches the file's contents.
+
+    The first load of a file compiles it into the cache; later loads (other workers, restarts, resets)
+    skip parsing entirely. Stale or corrupt compiled copies are rebuilt.
+
+    :param path: STR database file in csv, xlsx, tsv, or txt format.
+    :type path: pathlib.Path
+    :param cache_dir: Directory holding compiled databases, defaults to the user cache dir
+    :type cache_dir: pathlib.Path, optional
+    :param use_cache: Whether to read and write compiled databases, defaults to True
+    :type use_cache: bool, optional
+    :param ingress_kwargs: Options passed to ``str_ingress``.
+    :return: The encoded database.
+    :rtype: EncodedDatabase
+    """
+    ingress_kwargs = {
+        "sample_col": "Sample", "marker_col": "Marker", "sample_map": None, "penta_fix": True, **ingress_kwargs
+    }
+    if not use_cache or os.environ.get("STRPROFILER_DB_CACHE") == "0":
+        df = utils.str_ingress([path], **ingress_kwargs)
+        return EncodedDatabase.from_frame(df, digest=_database_key(path, **ingress_kwargs))
+
+    cache_dir = Path(cache_dir) if cache_dir is not None else utils._user_cache_dir("databases")
+    target = cache_dir / _database_key(path, **ingress_kwargs)
+    try:
+        return EncodedDatabase.load(target)
+    except ValueError:
+        pass
+
+    try:
+        target = compile_database(path, cache_dir, **ingress_kwargs)
+        return EncodedDatabase.load(target)
+    except (OSError, ValueError):
+        # Unwritable cache; fall back to an in-memory database.
+        df = utils.str_ingress([path], **ingress_kwargs)
+        return EncodedDatabase.from_frame(df, digest=_database_key(path, **ingress_kwargs))
+
+
+def prune_databases(cache_dir=None, max_age=DEFAULT_MAX_AGE, keep=()):
+    """
+    Removes compiled databases that no process has attached and that have not been loaded for ``max_age`` seconds,
+    e.g. custom databases uploaded to the app. Abandoned partial writes are removed too.
+
+    :param cache_dir: Directory holding compiled databases, defaults to the user cache dir
+    :type cache_dir: pathlib.Path, optional
+    :param max_age: Minimum idle time in seconds before a compiled database is removed, defaults to 7 days
+    :type max_age: float, optional
+    :param keep: Digests of compiled databases to keep regardless of age.
+    :type keep: iterable of str, optional
+    :return: Number of compiled databases removed.
+    :rtype: int
+    """
+    if fcntl is None:
+        return 0
+    cache_dir = Path(cache_dir) if cache_dir is not None else utils._user_cache_dir("databases")
+    if not cache_dir.exists():
+        return 0
+
+    removed = 0
+    now = time.time()
+    for entry in cache_dir.iterdir():
+        try:
+            if not entry.is_dir() or entry.name in keep or now - entry.stat().st_mtime < max_age:
+                continue
+            fd = os.open(entry / ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            continue
+        try:
+            # Any worker still attached holds a shared lock, so this fails and the database stays.
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        os.close(fd)
+        removed += 1
+    return removed
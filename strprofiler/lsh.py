@@ -0,0 +1,231 @@
+import time
+import numpy as np
+import pandas as pd
+from strprofiler.profiles import ProfileSet
+from strprofiler.scoring import PreparedQuery, score_profiles
+
+# Modulus of the MinHash permutations (a Mersenne prime), and the signature of a profile without alleles.
+_PRIME = (1 << 31) - 1
+_EMPTY = _PRIME
+
+
+class MinHashIndex:
+    """
+    Approximate index of a :class:`~strprofiler.profiles.ProfileSet` for candidate selection, with MinHash
+    signatures over each profile's (marker, allele) tokens and LSH banding.
+
+    Profiles whose token sets have Jaccard similarity ``s`` share at least one band with probability
+    ``1 - (1 - s ** rows) ** bands``: more bands (or fewer rows per band) raise recall at the cost of more
+    candidates to rescore. Candidates are rescored exactly, so approximate search can only miss matches,
+    never misscore them.
+
+    :param profiles: Reference profiles.
+    :type profiles: strprofiler.profiles.ProfileSet
+    :param bands: Number of LSH bands, defaults to 32
+    :type bands: int, optional
+    :param rows: MinHash values per band, defaults to 4
+    :type rows: int, optional
+    :param use_amel: Whether amelogenin alleles are tokens, defaults to False
+    :type use_amel: bool, optional
+    :param amel_col: Name of amelogenin marker, defaults to "AMEL"
+    :type amel_col: str, optional
+    :param seed: Seed of the hash permutations, defaults to 0
+    :type seed: int, optional
+    """
+
+    def __init__(self, profiles, bands=32, rows=4, use_amel=False, amel_col="AMEL", seed=0):
+        self.profiles = profiles
+        self.bands = bands
+        self.rows = rows
+        self.use_amel = use_amel
+        self.amel_col = amel_col
+
+        rng = np.random.default_rng(seed)
+        n_hashes = bands * rows
+        self._a = rng.integers(1, _PRIME, size=n_hashes, dtype=np.int64)
+        self._b = rng.integers(0, _PRIME, size=n_hashes, dtype=np.int64)
+        self._mix = rng.integers(1, 2**63, size=rows, dtype=np.uint64) | np.uint64(1)
+
+        # Tokens are numbered per marker, from the allele codes known when the index is built.
+        self._markers = [j for j, m in enumerate(profiles.markers) if use_amel or m != amel_col]
+        self._sizes = [len(a) for a in profiles.alleles]
+        self._offsets = np.concatenate([[0], np.cumsum(self._sizes)]).astype(np.int64)
+        self._table = self._hash(np.arange(self._offsets[-1]))
+
+        # Identical profiles share a signature, so only one per scoring unit is hashed.
+        units = profiles.units
+        first = np.unique(units, return_index=True)[1]
+        order = np.argsort(units, kind="stable")
+        self._unit_rows = order
+        self._unit_starts = np.concatenate([[0], np.cumsum(np.bincount(units, minlength=len(first)))])
+
+        keys = self._band_keys(self._signatures(first))
+        self._band_order = np.argsort(keys, axis=1, kind="stable")
+        self._sorted_keys = np.take_along_axis(keys, self._band_order, axis=1)
+
+    def _hash(self, tokens):
+        """``(hashes, tokens)`` values of each MinHash permutation."""
+        return (self._a[:, None] * np.asarray(tokens, dtype=np.int64)[None, :] + self._b[:, None]) % _PRIME
+
+    def _signatures(self, rows, chunk=512):
+        """``(hashes, rows)`` MinHash signatures of profiles."""
+        out = np.empty((len(self._a), len(rows)), dtype=np.int64)
+        codes = self.profiles.codes
+        for start in range(0, len(rows), chunk):
+            block = np.asarray(codes[rows[start:start + chunk]])[:, self._markers, :]
+            tokens = block + self._offsets[self._markers][None, :, None]
+            tokens = tokens.reshape(len(block), -1)
+            hashes = np.where(block.reshape(len(block), -1) >= 0, self._table[:, np.maximum(tokens, 0)], _EMPTY)
+            out[:, start:start + len(block)] = hashes.min(axis=2)
+        return out
+
+    def _band_keys(self, signatures):
+        """``(bands, profiles)`` keys of each band of the signatures."""
+        sig = signatures.astype(np.uint64).reshape(self.bands, self.rows, -1)
+        return (sig * self._mix[None, :, None]).sum(axis=1, dtype=np.uint64)
+
+    def signature(self, query):
+        """
+        MinHash signature of a query, its alleles tokenized against the index.
+
+        :param query: Prepared query, with the same Amelogenin setting as the index.
+        :type query: PreparedQuery
+        :rtype: numpy.ndarray
+        """
+        profiles = self.profiles
+        marker_index = {m: j for j, m in enumerate(profiles.markers)}
+        known, unknown = [], 0
+        for m, alleles in query.alleles.items():
+            j = marker_index.get(m)
+            index = profiles.allele_index[j] if j is not None else {}
+            for a in alleles:
+                c = index.get(a)
+                if c is None or c >= self._sizes[j]:
+                    # Never in a reference profile, but still part of the query's token set.
+                    unknown += 1
+                else:
+                    known.append(self._offsets[j] + c)
+        tokens = np.array(known + list(range(self._offsets[-1], self._offsets[-1] + unknown)), dtype=np.int64)
+        if not len(tokens):
+            return np.full(len(self._a), _EMPTY, dtype=np.int64)
+        return self._hash(tokens).min(axis=1)
+
+    def candidates(self, query):
+        """
+        Rows of the profiles sharing at least one LSH band with the query.
+
+        :param query: Alleles for the query sample, or a PreparedQuery.
+        :type query: dict or PreparedQuery
+        :return: Sorted row numbers.
+        :rtype: numpy.ndarray
+        """
+        if not isinstance(query, PreparedQuery):
+            query = PreparedQuery(query, use_amel=self.use_amel, amel_col=self.amel_col)
+        keys = self._band_keys(self.signature(query)[:, None])[:, 0]
+        hits = []
+        for band, key in enumerate(keys):
+            lo = np.searchsorted(self._sorted_keys[band], key, side="left")
+            hi = np.searchsorted(self._sorted_keys[band], key, side="right")
+            hits.append(self._band_order[band, lo:hi])
+        units = np.unique(np.concatenate(hits))
+        rows = [self._unit_rows[self._unit_starts[u]:self._unit_starts[u + 1]] for u in units.tolist()]
+        return np.sort(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int64)
+
+
+def approximate_scores(query, index):
+    """
+    Scores a query against the LSH candidates of an index only, exactly as ``score_profiles`` would.
+
+    :param query: Alleles for the query sample, or a PreparedQuery.
+    :type query: dict or PreparedQuery
+    :param index: Index of the reference profiles.
+    :type index: MinHashIndex
+    :return: Candidate row numbers, and the dictionary of ``SCORE_FIELDS`` arrays (plus ``valid``) aligned with them.
+    :rtype: tuple
+    """
+    if not isinstance(query, PreparedQuery):
+        query = PreparedQuery(query, use_amel=index.use_amel, amel_col=index.amel_col)
+    rows = index.candidates(query)
+    return rows, score_profiles(query, index.profiles.take(rows))
+
+
+def _synthetic_profiles(n, rng, n_markers=16):
+    """Random profiles of one or two alleles per marker, drawn from skewed per-marker allele frequencies."""
+    markers = [f"M{k}" for k in range(n_markers)]
+    out = {}
+    weights = [rng.dirichlet(np.full(12, 0.6)) for _ in markers]
+    for i in range(n):
+        profile = {}
+        for m, w in zip(markers, weights):
+            alleles = rng.choice(12, size=rng.integers(1, 3), p=w)
+            profile[m] = ",".join(str(a + 6) for a in sorted(set(alleles.tolist())))
+        out[f"S{i}"] = profile
+    return out
+
+
+def _mutate(profile, rng, rate=0.1):
+    """Copy of a profile with roughly ``rate`` of its markers changed or dropped."""
+    out = dict(profile)
+    for m in out:
+        if rng.random() < rate:
+            out[m] = "" if rng.random() < 0.3 else str(rng.integers(6, 18))
+    return out
+
+
+def benchmark(n_profiles=20000, n_queries=50, settings=((4, 8), (8, 6), (16, 4), (32, 4), (32, 3)), threshold=60,
+              seed=0):
+    """
+    Recall and latency of approximate search against exact search, on synthetic profiles.
+
+    Queries are copies of random reference profiles with 10-40% of markers changed or dropped. Recall is the
+    fraction of references scoring at least ``threshold`` (Tanabe) in an exact scan that approximate search
+    also returns.
+
+    :param n_profiles: Number of reference profiles, defaults to 20000
+    :type n_profiles: int, optional
+    :param n_queries: Number of queries, defaults to 50
+    :type n_queries: int, optional
+    :param settings: ``(bands, rows)`` pairs to index with
+    :type settings: tuple, optional
+    :param threshold: Tanabe score defining a match, defaults to 60
+    :type threshold: float, optional
+    :param seed: Random seed, defaults to 0
+    :type seed: int, optional
+    :return: pd.df with one row per mode: bands, rows, recall, mean candidates, ms per query, and index build time.
+    :rtype: pd.DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    reference = _synthetic_profiles(n_profiles, rng)
+    profiles = ProfileSet.from_dict(reference)
+    names = list(reference)
+    queries = [
+        PreparedQuery(_mutate(reference[names[i]], rng, rng.uniform(0.1, 0.4)))
+        for i in rng.choice(n_profiles, n_queries, replace=False)
+    ]
+
+    profiles.prepared
+    start = time.perf_counter()
+    truth = []
+    for q in queries:
+        scores = score_profiles(q, profiles)
+        truth.append(set(np.flatnonzero(scores["valid"] & (scores["tanabe_score"] >= threshold)).tolist()))
+    exact_ms = (time.perf_counter() - start) * 1000 / n_queries
+    results = [{"mode": "exact", "bands": None, "rows": None, "recall": 1.0, "candidates": float(n_profiles),
+                "ms_per_query": exact_ms, "build_s": 0.0}]
+
+    for bands, rows in settings:
+        start = time.perf_counter()
+        index = MinHashIndex(profiles, bands=bands, rows=rows, seed=seed)
+        build = time.perf_counter() - start
+        found, total, n_candidates = 0, 0, 0
+        start = time.perf_counter()
+        for q, expected in zip(queries, truth):
+            cand, scores = approximate_scores(q, index)
+            hits = set(cand[scores["valid"] & (scores["tanabe_score"] >= threshold)].tolist())
+            found += len(hits & expected)
+            total += len(expected)
+            n_candidates += len(cand)
+        ms = (time.perf_counter() - start) * 1000 / n_queries
+        results.append({"mode": "lsh", "bands": bands, "rows": rows, "recall": found / total if total else 1.0,
+                        "candidates": n_candidates / n_queries, "ms_per_query": ms, "build_s": build})
+    return pd.DataFrame(results)
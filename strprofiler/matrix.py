@@ -0,0 +1,278 @@
+import json
+import rich_click as click
+import numpy as np
+from pathlib import Path
+from strprofiler.profiles import ProfileSet
+
+# Matrices that can be written, as named by ``utils.score_query``.
+MATRIX_SCORES = ("tanabe_score", "masters_query_score", "masters_ref_score")
+
+# Stand-in for pairs without shared markers in uint8 matrices (NaN in float32 ones).
+UINT8_MISSING = 255
+
+
+def _one_hot(profiles, rows, markers, offsets, width):
+    """``(rows, width)`` float32 indicator of which (marker, allele) pairs each profile carries."""
+    out = np.zeros((len(rows), width), dtype=np.float32)
+    r = np.arange(len(rows))
+    for j in markers:
+        codes = np.asarray(profiles.codes[rows, j, :])
+        for k in range(codes.shape[1]):
+            has = codes[:, k] >= 0
+            out[r[has], offsets[j] + codes[has, k]] = 1
+    return out
+
+
+def _block(units, start, size):
+    """Rows of a tile edge, the unit of each within the edge, and a representative row per unit."""
+    rows = np.arange(start, min(start + size, len(units)))
+    first, inverse = np.unique(units[rows], return_index=True, return_inverse=True)[1:]
+    return rows, inverse.reshape(-1), rows[first]
+
+
+def _block_size(memory, width, n):
+    """Largest tile edge whose working set (two indicator blocks plus ~64 bytes per tile cell) fits ``memory`` MB."""
+    budget = memory * 2**20
+    b = int((-8 * width + np.sqrt((8 * width) ** 2 + 4 * 64 * budget)) / (2 * 64))
+    return max(1, min(b, n))
+
+
+def _tile_scores(a_i, a_j, p_i, p_j, c_i, c_j):
+    """Counts and scores of one tile, with the same operation order (and floats) as ``score_query``."""
+    n_markers = p_i @ p_j.T
+    shared = (a_i @ a_j.T).astype(np.float64)
+    n_query = (c_i @ p_j.T).astype(np.float64)
+    n_ref = (p_i @ c_j.T).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = {
+            "tanabe_score": 100 * ((2 * shared) / (n_query + n_ref)),
+            "masters_query_score": 100 * (shared / n_query),
+            "masters_ref_score": 100 * (shared / n_ref),
+        }
+    return scores, n_markers > 0
+
+
+def _quantize(score, valid, dtype):
+    if dtype == "uint8":
+        return np.where(valid, np.rint(np.nan_to_num(score)), UINT8_MISSING).astype(np.uint8)
+    return np.where(valid, score, np.nan).astype(np.float32)
+
+
+# Transposing a tile swaps the roles of query and reference.
+MIRROR = {
+    "tanabe_score": "tanabe_score",
+    "masters_query_score": "masters_ref_score",
+    "masters_ref_score": "masters_query_score",
+}
+
+
+def _tiles(profiles, use_amel=False, amel_col="AMEL", memory=512, block_size=None, n_rows=None):
+    """
+    Scores profiles pairwise in square tiles on and above the diagonal, sized to fit ``memory`` MB.
+
+    Each tile is scored between the distinct profiles (``ProfileSet.units``) of its row and column ranges.
+    Yields ``(rows_i, inv_i, rows_j, inv_j, scores, valid)``: the tile's row and column numbers, the index of
+    each into the unit axes of ``scores`` (dictionary of ``MATRIX_SCORES`` arrays, rows as query) and of
+    ``valid`` (False where no markers are shared). Only tiles starting before ``n_rows`` (defaults to all)
+    are scored.
+    """
+    n = len(profiles)
+    markers = [j for j, m in enumerate(profiles.markers) if use_amel or m != amel_col]
+    sizes = [len(a) for a in profiles.alleles]
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    width = int(offsets[-1])
+    counts = profiles.allele_counts[:, markers].astype(np.float32)
+    present = (counts > 0).astype(np.float32)
+    units = profiles.units
+
+    b = block_size or _block_size(memory, width, n)
+    for i0 in range(0, n if n_rows is None else n_rows, b):
+        rows_i, inv_i, rep_i = _block(units, i0, b)
+        a_i = _one_hot(profiles, rep_i, markers, offsets, width)
+        for j0 in range(i0, n, b):
+            if j0 == i0:
+                rows_j, inv_j, rep_j, a_j = rows_i, inv_i, rep_i, a_i
+            else:
+                rows_j, inv_j, rep_j = _block(units, j0, b)
+                a_j = _one_hot(profiles, rep_j, markers, offsets, width)
+            scores, valid = _tile_scores(a_i, a_j, present[rep_i], present[rep_j], counts[rep_i], counts[rep_j])
+            yield rows_i, inv_i, rows_j, inv_j, scores, valid
+
+
+def pairwise_matrices(
+    profiles,
+    output_dir,
+    use_amel=False,
+    amel_col="AMEL",
+    memory=512,
+    dtype="float32",
+    scores=MATRIX_SCORES,
+    block_size=None,
+):
+    """
+    Writes the all-vs-all score matrices of a set of profiles to memory-mapped ``.npy`` files.
+
+    The matrices are computed in square tiles of rows against columns, each tile from (marker, allele) indicator
+    blocks with matrix products, so only the tiles in flight are held in memory. Tiles below the diagonal are
+    written from their mirror image, and identical profiles (``ProfileSet.units``) are scored once per tile.
+
+    Entry ``[i, j]`` of each matrix is the score of profile ``i`` as query against profile ``j`` as reference,
+    as ``utils.score_query`` computes it. Pairs sharing no markers are NaN (float32) or 255 (uint8); uint8
+    matrices hold scores rounded to whole percents.
+
+    :param profiles: Profiles to compare.
+    :type profiles: strprofiler.profiles.ProfileSet
+    :param output_dir: Directory to write ``<score>.npy``, ``samples.txt`` and ``matrix.json`` into.
+    :type output_dir: pathlib.Path
+    :param use_amel: Whether to include amelogenin in scoring, defaults to False
+    :type use_amel: bool, optional
+    :param amel_col: Name of amelogenin marker, defaults to "AMEL"
+    :type amel_col: str, optional
+    :param memory: Approximate working memory for tiles in MB, defaults to 512
+    :type memory: int, optional
+    :param dtype: Matrix dtype, "float32" or "uint8", defaults to "float32"
+    :type dtype: str, optional
+    :param scores: Matrices to write, from ``MATRIX_SCORES``, defaults to all
+    :type scores: tuple, optional
+    :param block_size: Tile edge in profiles, overriding the one derived from ``memory``
+    :type block_size: int, optional
+    :return: Paths of the written matrices, by score.
+    :rtype: dict
+    """
+    if dtype not in ("float32", "uint8"):
+        raise ValueError(f"Unsupported matrix dtype: {dtype}")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    n = len(profiles)
+    paths = {s: output_dir / f"{s}.npy" for s in scores}
+    out = {s: np.lib.format.open_memmap(p, mode="w+", dtype=dtype, shape=(n, n)) for s, p in paths.items()}
+
+    tiles = _tiles(profiles, use_amel=use_amel, amel_col=amel_col, memory=memory, block_size=block_size)
+    for rows_i, inv_i, rows_j, inv_j, tile, valid in tiles:
+        # Expand unit-by-unit scores to the profiles of the tile.
+        cells = np.ix_(inv_i, inv_j)
+        valid = valid[cells]
+        i, j = slice(rows_i[0], rows_i[-1] + 1), slice(rows_j[0], rows_j[-1] + 1)
+        for s in scores:
+            out[s][i, j] = _quantize(tile[s][cells], valid, dtype)
+            if rows_j[0] != rows_i[0]:
+                out[s][j, i] = _quantize(tile[MIRROR[s]][cells], valid, dtype).T
+
+    for m in out.values():
+        m.flush()
+    del out
+
+    with open(output_dir / "samples.txt", "w") as f:
+        f.writelines(s + "\n" for s in profiles.samples.tolist())
+    header = {
+        "samples": n,
+        "scores": list(scores),
+        "dtype": dtype,
+        "missing": UINT8_MISSING if dtype == "uint8" else "nan",
+        "markers": [m for m in profiles.markers if use_amel or m != amel_col],
+        "use_amel": use_amel,
+    }
+    with open(output_dir / "matrix.json", "w") as f:
+        json.dump(header, f, indent=1)
+    return paths
+
+
+@click.command(name="matrix")
+@click.option(
+    "-mem",
+    "--memory",
+    default=512,
+    help="Approximate working memory for computing tiles, in MB.",
+    show_default=True,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "-dt",
+    "--dtype",
+    default="float32",
+    help="Matrix dtype; uint8 stores scores rounded to whole percents.",
+    show_default=True,
+    type=click.Choice(["float32", "uint8"]),
+)
+@click.option(
+    "-s",
+    "--scores",
+    default=MATRIX_SCORES,
+    help="Score matrices to write.",
+    show_default=True,
+    multiple=True,
+    type=click.Choice(MATRIX_SCORES),
+)
+@click.option(
+    "-acol",
+    "--amel_col",
+    help="Name of Amelogenin column in STR file(s).",
+    default="AMEL",
+    show_default=True,
+    type=str,
+)
+@click.option(
+    "-scol",
+    "--sample_col",
+    help="Name of sample column in STR file(s).",
+    default="Sample",
+    show_default=True,
+    type=str,
+)
+@click.option(
+    "-mcol",
+    "--marker_col",
+    help="""Name of marker column in STR file(s).
+              Only used if format is 'wide'.""",
+    default="Marker",
+    show_default=True,
+    type=str,
+)
+@click.option(
+    "-pfix",
+    "--penta_fix",
+    help="""Whether to try to harmonize PentaE/D allele spelling.""",
+    default=True,
+    show_default=True,
+    type=bool,
+)
+@click.option(
+    "-amel",
+    "--score_amel",
+    help="""Use Amelogenin for similarity scoring.""",
+    default=False,
+    show_default=True,
+    type=bool,
+)
+@click.option(
+    "-o",
+    "--output_dir",
+    default="./STRprofiler",
+    help="Path to the output directory.",
+    show_default=True,
+    type=click.Path(),
+)
+@click.argument("input_files", required=True, type=click.Path(exists=True), nargs=-1)
+@click.version_option()
+def matrix(
+    input_files,
+    output_dir="./STRprofiler",
+    memory=512,
+    dtype="float32",
+    scores=MATRIX_SCORES,
+    amel_col="AMEL",
+    sample_col="Sample",
+    marker_col="Marker",
+    penta_fix=True,
+    score_amel=False,
+):
+    """Writes all-vs-all similarity score matrices of STR profiles as memory-mapped .npy files."""
+    profiles = ProfileSet.from_files(
+        input_files, sample_col=sample_col, marker_col=marker_col, sample_map=None, penta_fix=penta_fix
+    )
+    paths = pairwise_matrices(
+        profiles, output_dir, use_amel=score_amel, amel_col=amel_col, memory=memory, dtype=dtype,
+        scores=tuple(dict.fromkeys(scores)),
+    )
+    print(f"Wrote {len(profiles)} x {len(profiles)} matrices: " + ", ".join(str(p) for p in paths.values()))
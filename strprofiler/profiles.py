@@ -0,0 +1,384 @@
+import sys
+import threading
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+import strprofiler.utils as utils
+from strprofiler.scoring import PreparedQuery, PreparedReference
+
+# Non-marker columns carried alongside the STR profiles.
+META_COLUMNS = ("Center", "Passage")
+
+
+def _is_meta(column):
+    return any(m in column for m in META_COLUMNS)
+
+
+class Vocabulary:
+    """
+    Interned marker names and per-marker allele code tables.
+
+    Every :class:`ProfileSet` encoded against the same vocabulary uses the same marker IDs and allele codes,
+    so query files and databases can be compared code-to-code. Vocabularies only ever grow, so codes handed
+    out stay valid while other profiles are encoded.
+    """
+
+    __slots__ = ("markers", "alleles", "_marker_ids", "_codes", "_lock")
+
+    def __init__(self):
+        self.markers = []
+        self.alleles = []
+        self._marker_ids = {}
+        self._codes = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_alleles(cls, markers, alleles):
+        """
+        Builds a vocabulary from per-marker allele lists, each allele's code being its position.
+
+        :param markers: Marker names.
+        :type markers: list
+        :param alleles: For each marker, the list of distinct alleles indexed by code.
+        :type alleles: list of list
+        :rtype: Vocabulary
+        """
+        vocab = cls()
+        for m, a in zip(markers, alleles):
+            i = vocab.marker_id(m)
+            vocab.alleles[i].extend(sys.intern(x) for x in a)
+            vocab._codes[i].update((x, c) for c, x in enumerate(vocab.alleles[i]))
+        return vocab
+
+    def marker_id(self, marker):
+        """Returns the ID of a marker, adding it if new."""
+        i = self._marker_ids.get(marker)
+        if i is None:
+            with self._lock:
+                i = self._marker_ids.get(marker)
+                if i is None:
+                    i = len(self.markers)
+                    self.markers.append(sys.intern(marker))
+                    self.alleles.append([])
+                    self._codes.append({})
+                    self._marker_ids[self.markers[i]] = i
+        return i
+
+    def allele_codes(self, marker):
+        """Returns the ``{allele: code}`` table of a marker. Treat as read-only; use :meth:`encode` to add alleles."""
+        return self._codes[self.marker_id(marker)]
+
+    def encode(self, marker, values):
+        """
+        Encodes one marker column, adding new alleles to the vocabulary.
+        Alleles are compared as sets, so repeats within a cell are dropped; first-seen order is kept.
+
+        :param marker: Marker name.
+        :type marker: str
+        :param values: Comma-separated alleles of each cell, "" for none.
+        :type values: iterable of str
+        :return: Number of alleles in each cell, and the concatenated codes of all cells.
+        :rtype: tuple of numpy.ndarray
+        """
+        i = self.marker_id(marker)
+        codes, alleles = self._codes[i], self.alleles[i]
+        lengths = []
+        flat = []
+        with self._lock:
+            for v in values:
+                v = str(v)
+                cell = {}
+                if v != "":
+                    for a in v.split(","):
+                        c = codes.get(a)
+                        if c is None:
+                            c = codes[a] = len(alleles)
+                            alleles.append(sys.intern(a))
+                        cell[c] = None
+                lengths.append(len(cell))
+                flat.extend(cell)
+        return np.array(lengths, dtype=np.int64), np.array(flat, dtype=np.int16)
+
+    def __len__(self):
+        return len(self.markers)
+
+    def __repr__(self):
+        return f"<Vocabulary: {len(self)} markers, {sum(map(len, self.alleles))} alleles>"
+
+
+class ProfileSet(Mapping):
+    """
+    Compact, array-backed set of STR profiles.
+
+    Behaves like the ``{sample: {column: alleles}}`` dictionary produced by
+    ``str_ingress(...).to_dict(orient="index")``, but holds sample names in a fixed-width string array and each
+    cell's alleles as codes from a :class:`Vocabulary`, in a single ``(samples, markers, max alleles)`` int16 array
+    (-1 padded). Center/Passage values are kept as a ``(samples, meta columns)`` string array. Rows are decoded back
+    to comma-separated strings on access.
+
+    :param samples: Sample names.
+    :type samples: numpy.ndarray
+    :param columns: All columns, in their original order.
+    :type columns: list
+    :param markers: Marker columns, in the order of the ``codes`` second axis.
+    :type markers: list
+    :param vocab: Vocabulary the allele codes refer to.
+    :type vocab: Vocabulary
+    :param codes: ``(samples, markers, max alleles)`` allele codes, -1 padded.
+    :type codes: numpy.ndarray
+    :param meta: ``(samples, meta columns)`` Center/Passage values.
+    :type meta: numpy.ndarray
+    :param order: Permutation sorting ``samples``, computed when first needed if not given.
+    :type order: numpy.ndarray, optional
+    :param meta_columns: Columns held in ``meta`` rather than scored, defaults to those named Center or Passage.
+    :type meta_columns: list, optional
+    :param units: Scoring unit of each sample (see ``units``), computed when first needed if not given.
+    :type units: numpy.ndarray, optional
+    """
+
+    __slots__ = (
+        "samples", "columns", "markers", "vocab", "marker_ids", "codes", "meta", "meta_columns",
+        "_order", "_units", "_allele_counts", "_prepared", "__weakref__",
+    )
+
+    def __init__(self, samples, columns, markers, vocab, codes, meta, order=None, meta_columns=None, units=None):
+        self.samples = samples
+        self.columns = [sys.intern(c) for c in columns]
+        self.vocab = vocab
+        self.marker_ids = np.array([vocab.marker_id(m) for m in markers], dtype=np.int32)
+        self.markers = [vocab.markers[i] for i in self.marker_ids]
+        self.codes = codes
+        self.meta = meta
+        if meta_columns is None:
+            meta_columns = [c for c in self.columns if _is_meta(c)]
+        self.meta_columns = [sys.intern(c) for c in meta_columns]
+        self._order = order
+        self._units = units
+        self._allele_counts = None
+        self._prepared = None
+
+    @classmethod
+    def from_frame(cls, df, vocab=None, meta_columns=None, **kwargs):
+        """
+        Encodes a DataFrame of STR profiles, as returned by ``str_ingress``.
+
+        :param df: STR profiles indexed by sample, one column per marker (plus any Center/Passage columns).
+        :type df: pandas.DataFrame
+        :param vocab: Vocabulary to encode against, e.g. a database's so that codes line up, defaults to a new one
+        :type vocab: Vocabulary, optional
+        :param meta_columns: Columns to hold as metadata rather than encode as markers,
+            defaults to those named Center or Passage
+        :type meta_columns: list, optional
+        :param kwargs: Further arguments for the constructor.
+        :return: The encoded profiles.
+        :rtype: ProfileSet
+        """
+        if vocab is None:
+            vocab = Vocabulary()
+        columns = [str(c) for c in df.columns]
+        if meta_columns is None:
+            meta_columns = [c for c in columns if _is_meta(c)]
+        markers = [c for c in columns if c not in meta_columns]
+        n = len(df.index)
+
+        encoded = [vocab.encode(m, df[m].astype(str).tolist()) for m in markers]
+        width = max([int(lengths.max()) for lengths, _ in encoded if len(lengths)] + [1])
+        codes = np.full((n, len(markers), width), -1, dtype=np.int16)
+        for j, (lengths, flat) in enumerate(encoded):
+            # Scatter each cell's codes into its row, at positions 0..len-1.
+            rows = np.repeat(np.arange(n), lengths)
+            starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+            codes[rows, j, np.arange(len(flat)) - starts] = flat
+
+        samples = np.array([str(s) for s in df.index], dtype=str)
+        meta = np.array(df[meta_columns].astype(str).values, dtype=str).reshape(n, len(meta_columns))
+
+        return cls(samples, columns, markers, vocab, codes, meta, meta_columns=meta_columns, **kwargs)
+
+    @classmethod
+    def from_dict(cls, profiles, vocab=None, **kwargs):
+        """
+        Encodes a ``{sample: {column: alleles}}`` dictionary. Columns missing from a profile are left empty.
+
+        :param profiles: STR profiles, as from ``str_ingress(...).to_dict(orient="index")``.
+        :type profiles: dict
+        :param vocab: Vocabulary to encode against, defaults to a new one
+        :type vocab: Vocabulary, optional
+        :param kwargs: Further arguments for the constructor.
+        :return: The encoded profiles.
+        :rtype: ProfileSet
+        """
+        columns = list(dict.fromkeys(c for p in profiles.values() for c in p))
+        df = pd.DataFrame.from_dict(profiles, orient="index", columns=columns).fillna("")
+        return cls.from_frame(df, vocab=vocab, **kwargs)
+
+    @classmethod
+    def from_files(cls, paths, vocab=None, **ingress_kwargs):
+        """
+        Reads STR profile files with ``str_ingress`` and encodes them.
+
+        :param paths: STR profile files to read in.
+        :type paths: list of pathlib.Path
+        :param vocab: Vocabulary to encode against, e.g. a database's so that codes line up, defaults to a new one
+        :type vocab: Vocabulary, optional
+        :param ingress_kwargs: Options passed to ``str_ingress``.
+        :return: The encoded profiles.
+        :rtype: ProfileSet
+        """
+        return cls.from_frame(utils.str_ingress(paths, **ingress_kwargs), vocab=vocab)
+
+    def _decode_column(self, j):
+        """Decodes marker column j, returning its distinct cell strings and each row's position among them."""
+        cells, inverse = np.unique(self.codes[:, j, :], axis=0, return_inverse=True)
+        alleles = self.vocab.alleles[self.marker_ids[j]]
+        strings = [",".join([alleles[c] for c in cell if c >= 0]) for cell in cells.tolist()]
+        return strings, inverse.reshape(-1)
+
+    def to_frame(self, categorical=False):
+        """
+        Decodes the profiles into a DataFrame indexed by sample, as returned by ``str_ingress``.
+        Each distinct cell is decoded once.
+
+        :param categorical: Whether to return marker and Center/Passage columns as category dtype, which
+            stores every distinct value once, defaults to False
+        :type categorical: bool, optional
+        :rtype: pandas.DataFrame
+        """
+        data = {}
+        for k, c in enumerate(self.meta_columns):
+            data[c] = pd.Categorical(self.meta[:, k]) if categorical else self.meta[:, k].tolist()
+        for j, m in enumerate(self.markers):
+            strings, inverse = self._decode_column(j)
+            if categorical:
+                data[m] = pd.Categorical.from_codes(inverse, strings)
+            else:
+                data[m] = np.array(strings, dtype=object)[inverse] if len(inverse) else []
+        index = pd.Index(self.samples.tolist(), name="Sample")
+        return pd.DataFrame(data, index=index, columns=self.columns)
+
+    def to_dict(self):
+        """
+        Decodes the profiles into a ``{sample: {column: alleles}}`` dictionary.
+
+        :rtype: dict
+        """
+        return self.to_frame().to_dict(orient="index")
+
+    def take(self, rows):
+        """
+        Returns the profiles at the given row numbers, sharing this set's vocabulary.
+
+        :param rows: Row numbers (or a boolean mask) to keep.
+        :type rows: array-like
+        :rtype: ProfileSet
+        """
+        rows = np.asarray(rows)
+        return ProfileSet(
+            self.samples[rows], self.columns, self.markers, self.vocab, self.codes[rows], self.meta[rows],
+            meta_columns=self.meta_columns,
+        )
+
+    @property
+    def order(self):
+        """Permutation that sorts the sample names, used for lookups."""
+        if self._order is None:
+            self._order = np.argsort(self.samples, kind="stable")
+        return self._order
+
+    @property
+    def units(self):
+        """
+        Scoring unit of each sample: samples with identical alleles at every marker share a unit, numbered in
+        order of first appearance. Each unit is scored once and its scores repeated for all of its samples,
+        which keep their own names and Center/Passage.
+        """
+        if self._units is None:
+            codes = np.asarray(self.codes)
+            cells = np.sort(codes, axis=2).reshape(len(self), codes.shape[1] * codes.shape[2])
+            _, first, inverse = np.unique(cells, axis=0, return_index=True, return_inverse=True)
+            renumber = np.empty(len(first), dtype=np.int32)
+            renumber[np.argsort(first, kind="stable")] = np.arange(len(first), dtype=np.int32)
+            self._units = renumber[inverse.reshape(-1)]
+        return self._units
+
+    @property
+    def alleles(self):
+        """For each marker, the list of alleles indexed by code."""
+        return [self.vocab.alleles[i] for i in self.marker_ids]
+
+    @property
+    def allele_index(self):
+        """Per-marker ``{allele: code}`` lookups."""
+        return [self.vocab.allele_codes(m) for m in self.markers]
+
+    @property
+    def allele_counts(self):
+        """``(samples, markers)`` number of alleles in each cell, built on first use."""
+        if self._allele_counts is None:
+            self._allele_counts = (np.asarray(self.codes) >= 0).sum(axis=2, dtype=np.int16)
+        return self._allele_counts
+
+    @property
+    def prepared(self):
+        """Scoring-ready form of the profiles (a ``scoring.PreparedReference``), built on first use."""
+        if self._prepared is None:
+            self._prepared = PreparedReference(self)
+        return self._prepared
+
+    @property
+    def nbytes(self):
+        """Bytes held by the sample, code and metadata arrays."""
+        return self.samples.nbytes + self.codes.nbytes + self.meta.nbytes
+
+    def find_identical(self, query, use_amel=False, amel_col="AMEL"):
+        """
+        Samples whose profile is identical to the query's over the scored markers, found via the hash index
+        rather than by scoring every profile. These are the samples the query matches at 100% on every score.
+
+        :param query: Query profile, or one already prepared (whose Amelogenin setting then applies).
+        :type query: dict or PreparedQuery
+        :param use_amel: Whether amelogenin is compared, defaults to False
+        :type use_amel: bool, optional
+        :param amel_col: Name of amelogenin marker, defaults to "AMEL"
+        :type amel_col: str, optional
+        :rtype: list
+        """
+        if not isinstance(query, PreparedQuery):
+            query = PreparedQuery(query, use_amel=use_amel, amel_col=amel_col)
+        return self.samples[self.prepared.find_identical(query)].tolist()
+
+    def index(self, sample):
+        """Returns the row number of a sample, raising KeyError if absent."""
+        i = np.searchsorted(self.samples, sample, sorter=self.order)
+        if i < len(self.order) and self.samples[self.order[i]] == sample:
+            return int(self.order[i])
+        raise KeyError(sample)
+
+    def row(self, i):
+        """Decodes the i-th sample back into a ``{column: alleles}`` dictionary."""
+        row = self.codes[i].tolist()
+        decoded = dict(zip(self.meta_columns, self.meta[i].tolist()))
+        for j, (m, alleles) in enumerate(zip(self.markers, self.alleles)):
+            decoded[m] = ",".join([alleles[c] for c in row[j] if c >= 0])
+        return {c: decoded[c] for c in self.columns}
+
+    def __getitem__(self, sample):
+        return self.row(self.index(sample))
+
+    def __iter__(self):
+        return iter(self.samples.tolist())
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __contains__(self, sample):
+        try:
+            self.index(sample)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __repr__(self):
+        return f"<{type(self).__name__}: {len(self)} samples, {len(self.markers)} markers>"
@@ -0,0 +1,348 @@
+import hashlib
+
+import numpy as np
+
+# Score fields produced by ``utils.score_query``, in order.
+SCORE_FIELDS = (
+    "n_shared_markers",
+    "query_sample",
+    "n_shared_alleles",
+    "n_query_alleles",
+    "n_reference_alleles",
+    "tanabe_score",
+    "masters_query_score",
+    "masters_ref_score",
+)
+
+
+class IncrementalScorer:
+    """
+    Scores one query against every profile of a :class:`~strprofiler.profiles.ProfileSet`,
+    keeping per-marker partial counts so that editing a single marker only recomputes that marker.
+
+    Counts follow ``utils.score_query`` exactly: alleles are compared as sets of comma-separated
+    tokens, only markers non-empty in both query and reference are scored, and Amelogenin is
+    skipped unless ``use_amel`` is set.
+
+    :param database: Encoded reference profiles, e.g. an ``EncodedDatabase``.
+    :type database: strprofiler.profiles.ProfileSet
+    :param use_amel: Whether to include amelogenin in scoring, defaults to False
+    :type use_amel: bool, optional
+    :param amel_col: Name of amelogenin marker, defaults to "Amelogenin"
+    :type amel_col: str, optional
+    """
+
+    def __init__(self, database, use_amel=False, amel_col="Amelogenin"):
+        self.database = database
+        self.use_amel = use_amel
+        self.amel_col = amel_col
+        self.query = {}
+
+        self._reference = database.prepared
+        n_markers, n_samples = len(database.markers), len(self._reference)
+
+        # Per-marker contributions, and their running totals over all markers.
+        self._markers = np.zeros((n_markers, n_samples), dtype=np.int8)
+        self._shared = np.zeros((n_markers, n_samples), dtype=np.int16)
+        self._n_query = np.zeros((n_markers, n_samples), dtype=np.int16)
+        self._n_ref = np.zeros((n_markers, n_samples), dtype=np.int16)
+        self._totals = {k: np.zeros(n_samples, dtype=np.int64) for k in ("markers", "shared", "n_query", "n_ref")}
+
+    def set_marker(self, marker, alleles):
+        """
+        Sets the alleles of one query marker, updating only that marker's contribution.
+
+        :param marker: Marker name. Markers absent from the database are kept but never scored.
+        :type marker: str
+        :param alleles: Comma-separated alleles, "" for none.
+        :type alleles: str
+        """
+        self.query[marker] = alleles
+        ref = self._reference
+        j = ref.marker_index.get(marker)
+        if j is None:
+            return
+
+        tokens = set(alleles.split(",")) if alleles != "" else set()
+        if not tokens or (marker == self.amel_col and not self.use_amel):
+            new = (0, 0, 0, 0)
+        else:
+            index = ref.allele_index[j]
+            codes = [index[t] for t in tokens if t in index]
+            present = ref.present[j]
+            # Empty reference cells hold only -1 padding, so they share and count nothing.
+            shared = np.isin(ref.codes[:, j, :], codes).sum(axis=1) if codes else 0
+            new = (present, shared, present * len(tokens), ref.counts[j])
+
+        for part, total, value in zip(
+            (self._markers, self._shared, self._n_query, self._n_ref),
+            ("markers", "shared", "n_query", "n_ref"),
+            new,
+        ):
+            self._totals[total] -= part[j]
+            part[j] = value
+            self._totals[total] += part[j]
+
+    def update(self, query):
+        """
+        Brings the scorer in line with a full query, recomputing only markers whose alleles changed.
+
+        :param query: Alleles for the query sample.
+        :type query: dict
+        :return: Markers that were recomputed.
+        :rtype: list
+        """
+        changed = [m for m, v in query.items() if self.query.get(m, "") != v]
+        changed += [m for m in self.query if m not in query and self.query[m] != ""]
+        for m in changed:
+            self.set_marker(m, query.get(m, ""))
+        return changed
+
+    def scores(self):
+        """
+        Current scores against every reference, as arrays aligned with the database rows.
+
+        :return: Dictionary of ``SCORE_FIELDS`` arrays, plus ``valid``, which is False where
+            no markers are shared (``score_query`` raises ZeroDivisionError for these).
+        :rtype: dict
+        """
+        t = self._totals
+        scores = _scores(t["markers"].copy(), t["shared"].copy(), t["n_query"].copy(), t["n_ref"].copy())
+        return self._reference.expand(scores)
+
+
+def _scores(n_markers, n_shared, n_query, n_ref):
+    """Scores from per-reference count arrays, as a dictionary of ``SCORE_FIELDS`` arrays plus ``valid``."""
+    valid = n_markers > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Same operation order as score_query, so the floats match exactly.
+        tanabe = 100 * ((2 * n_shared) / (n_query + n_ref))
+        masters_q = 100 * (n_shared / n_query)
+        masters_r = 100 * (n_shared / n_ref)
+    return {
+        "n_shared_markers": n_markers,
+        "query_sample": np.zeros(len(valid), dtype=bool),
+        "n_shared_alleles": n_shared,
+        "n_query_alleles": n_query,
+        "n_reference_alleles": n_ref,
+        "tanabe_score": tanabe,
+        "masters_query_score": masters_q,
+        "masters_ref_score": masters_r,
+        "valid": valid,
+    }
+
+
+def profile_key(alleles):
+    """
+    Canonical text of a profile, from its scored markers' allele sets: markers and alleles both sorted.
+    Profiles with equal keys score 100 against each other on every score.
+
+    :param alleles: Marker to its non-empty collection of alleles.
+    :type alleles: dict
+    :rtype: str
+    """
+    return ";".join(m + "=" + ",".join(sorted(a)) for m, a in sorted(alleles.items()))
+
+
+def profile_hash(key):
+    """Signed 64-bit hash of a ``profile_key``."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little", signed=True)
+
+
+class PreparedReference:
+    """
+    Scoring-ready form of a :class:`~strprofiler.profiles.ProfileSet`, built once and kept with it
+    (see ``ProfileSet.prepared``): per-marker rows of which profiles have alleles and how many, laid out
+    contiguously so scoring a marker reads one row, plus the allele code lookups.
+
+    Identical profiles are collapsed into one scoring unit (``ProfileSet.units``), so arrays here are per unit;
+    ``expand`` repeats unit scores back out to one per profile.
+
+    :param profiles: Reference profiles.
+    :type profiles: strprofiler.profiles.ProfileSet
+    """
+
+    __slots__ = (
+        "codes", "units", "markers", "marker_index", "alleles", "allele_index", "counts", "present", "_hash_indexes",
+    )
+
+    def __init__(self, profiles):
+        units = profiles.units
+        # First profile of each unit; units are numbered in order of first appearance.
+        rows = np.unique(units, return_index=True)[1]
+        if len(rows) == len(units):
+            self.codes, self.units = profiles.codes, None
+            counts = profiles.allele_counts
+        else:
+            self.codes, self.units = np.asarray(profiles.codes)[rows], units
+            counts = profiles.allele_counts[rows]
+        self.markers = list(profiles.markers)
+        self.marker_index = {m: j for j, m in enumerate(self.markers)}
+        self.alleles = profiles.alleles
+        self.allele_index = profiles.allele_index
+        self.counts = np.ascontiguousarray(counts.T)
+        self.present = self.counts > 0
+        self._hash_indexes = {}
+
+    def __len__(self):
+        """Number of scoring units."""
+        return self.codes.shape[0]
+
+    def expand(self, scores):
+        """
+        Repeats per-unit scores for every profile of each unit.
+
+        :param scores: Dictionary of arrays aligned with the scoring units.
+        :type scores: dict
+        :return: Dictionary of arrays aligned with the profiles.
+        :rtype: dict
+        """
+        if self.units is None:
+            return scores
+        return {k: v[self.units] for k, v in scores.items()}
+
+    def hash_index(self, use_amel=False, amel_col="AMEL"):
+        """
+        Index of the profiles by ``profile_hash``, for the given Amelogenin setting; built on first use.
+        Identical profiles are grouped by first decoding each distinct cell and each distinct row once.
+
+        :param use_amel: Whether amelogenin is scored, defaults to False
+        :type use_amel: bool, optional
+        :param amel_col: Name of amelogenin marker, defaults to "AMEL"
+        :type amel_col: str, optional
+        :return: Dictionary of hash to ``(profile_key, profile row numbers)``. Profiles without alleles are not
+            indexed.
+        :rtype: dict
+        """
+        setting = (bool(use_amel), amel_col)
+        if setting in self._hash_indexes:
+            return self._hash_indexes[setting]
+
+        n = len(self)
+        markers = sorted(m for m in self.markers if use_amel or m != amel_col)
+        cell_ids = np.zeros((n, len(markers)), dtype=np.int64)
+        cell_text = []
+        for k, m in enumerate(markers):
+            j = self.marker_index[m]
+            cells, inverse = np.unique(np.sort(self.codes[:, j, :], axis=1), axis=0, return_inverse=True)
+            alleles = self.alleles[j]
+            cell_text.append([",".join(sorted(alleles[c] for c in cell if c >= 0)) for cell in cells.tolist()])
+            cell_ids[:, k] = inverse.reshape(-1)
+
+        rows, group = np.unique(cell_ids, axis=0, return_inverse=True)
+        group = group.reshape(-1)
+        if self.units is not None:
+            group = group[self.units]
+        order = np.argsort(group, kind="stable")
+        members = np.split(order, np.cumsum(np.bincount(group, minlength=len(rows)))[:-1])
+
+        index = {}
+        for ids, rows_of in zip(rows.tolist(), members):
+            key = ";".join(m + "=" + cell_text[k][c] for k, (m, c) in enumerate(zip(markers, ids)) if cell_text[k][c])
+            if key:
+                index[profile_hash(key)] = (key, rows_of)
+        self._hash_indexes[setting] = index
+        return index
+
+    def find_identical(self, query):
+        """
+        Rows whose scored profile is identical to the query's, looked up in the hash index.
+
+        :param query: Prepared query; its Amelogenin setting selects the index.
+        :type query: PreparedQuery
+        :return: Row numbers, empty if none.
+        :rtype: numpy.ndarray
+        """
+        key, digest = query.key, query.hash
+        if not query.alleles.keys() <= self.marker_index.keys():
+            # Columns the profiles lack are never scored, so they take no part in the comparison.
+            key = profile_key({m: a for m, a in query.alleles.items() if m in self.marker_index})
+            digest = profile_hash(key)
+        entry = self.hash_index(query.use_amel, query.amel_col).get(digest)
+        if entry is None or entry[0] != key:
+            return np.zeros(0, dtype=np.int64)
+        return entry[1]
+
+
+class PreparedQuery:
+    """
+    A query parsed once for scoring against any number of references: its allele sets and allele totals
+    for the markers that count (non-empty, and not Amelogenin unless ``use_amel``), as ``score_query``
+    would derive them for every pair.
+
+    :param query: Alleles for the query sample.
+    :type query: dict
+    :param use_amel: Whether to include amelogenin in scoring, defaults to False
+    :type use_amel: bool, optional
+    :param amel_col: Name of amelogenin marker, defaults to "AMEL"
+    :type amel_col: str, optional
+    """
+
+    __slots__ = ("query", "use_amel", "amel_col", "alleles", "n_alleles", "key", "hash")
+
+    def __init__(self, query, use_amel=False, amel_col="AMEL"):
+        self.query = query
+        self.use_amel = use_amel
+        self.amel_col = amel_col
+        self.alleles = {
+            m: frozenset(v.split(",")) for m, v in query.items() if v != "" and (use_amel or m != amel_col)
+        }
+        self.n_alleles = {m: len(a) for m, a in self.alleles.items()}
+        # Queries with equal keys score identically against any reference.
+        self.key = profile_key(self.alleles)
+        self.hash = profile_hash(self.key)
+
+    def score(self, reference):
+        """
+        Scores the query against every profile of a prepared reference.
+
+        :param reference: Prepared reference profiles.
+        :type reference: PreparedReference
+        :return: Dictionary of ``SCORE_FIELDS`` arrays aligned with the reference's scoring units (see
+            ``PreparedReference.expand``), plus ``valid``, which is False where no markers are shared
+            (``score_query`` raises ZeroDivisionError for these).
+        :rtype: dict
+        """
+        n = len(reference)
+        n_markers = np.zeros(n, dtype=np.int64)
+        n_shared = np.zeros(n, dtype=np.int64)
+        n_query = np.zeros(n, dtype=np.int64)
+        n_ref = np.zeros(n, dtype=np.int64)
+
+        for m, alleles in self.alleles.items():
+            j = reference.marker_index.get(m)
+            if j is None:
+                continue
+            present = reference.present[j]
+            n_markers += present
+            index = reference.allele_index[j]
+            codes = [index[a] for a in alleles if a in index]
+            if codes:
+                n_shared += np.isin(reference.codes[:, j, :], codes).sum(axis=1)
+            n_query += present * self.n_alleles[m]
+            n_ref += reference.counts[j]
+
+        return _scores(n_markers, n_shared, n_query, n_ref)
+
+
+def score_profiles(query, profiles, use_amel=False, amel_col="AMEL"):
+    """
+    Scores one query against every profile of a :class:`~strprofiler.profiles.ProfileSet` at once,
+    with the same counts and floats as ``utils.score_query`` for each pair.
+
+    :param query: Alleles for the query sample, or a PreparedQuery (whose own Amelogenin settings then apply).
+    :type query: dict
+    :param profiles: Reference profiles.
+    :type profiles: strprofiler.profiles.ProfileSet
+    :param use_amel: Whether to include amelogenin in scoring, defaults to False
+    :type use_amel: bool, optional
+    :param amel_col: Name of amelogenin marker, defaults to "AMEL"
+    :type amel_col: str, optional
+    :return: Dictionary of ``SCORE_FIELDS`` arrays aligned with the profiles, plus ``valid``,
+        which is False where no markers are shared (``score_query`` raises ZeroDivisionError for these).
+    :rtype: dict
+    """
+    if not isinstance(query, PreparedQuery):
+        query = PreparedQuery(query, use_amel=use_amel, amel_col=amel_col)
+    reference = profiles.prepared
+    return reference.expand(query.score(reference))
@@ -1,7 +1,102 @@
 import strprofiler.utils as sp
+from strprofiler.scoring import PreparedQuery, score_profiles
+from strprofiler.profiles import ProfileSet
+from strprofiler.store import ProfileStore
+import numpy as np
 import pandas as pd
 from math import nan
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+import hashlib
+import json
+import os
+import threading
+
+# Score column used by each query filter option.
+SCORE_COLUMNS = {
+    "Tanabe": "tanabe_score",
+    "Masters Query": "masters_query_score",
+    "Masters Reference": "masters_ref_score",
+}
+
+# Full comparison scores for a query (or batch of queries), kept so that score type and
+# threshold changes can be served by re-filtering rather than re-scoring. Single query scores
+# also keep the database they were computed against, to join in reference alleles.
+_Scores = namedtuple("_Scores", ["query", "scores", "database"], defaults=[None])
+
+# Number of single query score tables kept process-wide (0 disables the cache).
+SCORE_CACHE_SIZE = int(os.environ.get("STRPROFILER_SCORE_CACHE_SIZE", 64))
+
+# Minimum (marker, allele) pairs a SQLite store reference must share with a query to be scored. 1 misses no
+# reference scoring above 0; higher values trade recall of weak matches for speed on large stores.
+STORE_MIN_SHARED = int(os.environ.get("STRPROFILER_STORE_MIN_SHARED", 1))
+
+
+class _ScoreCache:
+    """
+    Bounded, thread-safe LRU of ``_score_database`` results shared by every session in the process.
+    Entries are keyed on the database content hash, so a database upload or reset never sees stale
+    scores; entries for databases no longer in use simply age out.
+    """
+
+    def __init__(self, maxsize=SCORE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_score_cache = _ScoreCache()
+
+
+def _score_key(query, digest, use_amel):
+    """
+    Canonical hash of a scoring request. Alleles are compared as sets by ``score_query``, so
+    allele order and repeats do not change the key; marker order does, as it sets the column order.
+    """
+    profile = [[m, sorted(set(v.split(","))) if v != "" else []] for m, v in query.items()]
+    return hashlib.sha256(json.dumps([profile, digest, bool(use_amel)]).encode()).hexdigest()
+
+
+def _cached_score_database(query, str_database, use_amel):
+    """
+    ``_score_database`` through the process-wide score cache. Databases without a content
+    ``digest`` (plain dictionaries) are scored directly.
+
+    :return: pd.df of scores, as from ``_score_database``. Shared; do not modify.
+    :rtype: pd.df
+    """
+    digest = getattr(str_database, "digest", None)
+    if digest is None:
+        return _score_database(query, str_database, use_amel)
+
+    key = _score_key(query, digest, use_amel)
+    scores = _score_cache.get(key)
+    if scores is None:
+        scores = _score_database(query, str_database, use_amel)
+        _score_cache.put(key, scores)
+    return scores
 
 
 def _single_query(
@@ -45,84 +140,169 @@ def _single_query(
     :return: pd.df containing results from similarity comparison.
     :rtype: pd.df
     """
-    if query_filter == "Tanabe":
-        query_filter_name = "tanabe_score"
-        drop_cols = [
-            "masters_query_score",
-            "masters_ref_score",
-            "query_sample",
-            "n_query_alleles",
-            "n_reference_alleles",
-        ]
-    elif query_filter == "Masters Query":
-        query_filter_name = "masters_query_score"
-        drop_cols = [
-            "tanabe_score",
-            "masters_ref_score",
-            "query_sample",
-            "n_query_alleles",
-            "n_reference_alleles",
-        ]
-    elif query_filter == "Masters Reference":
-        query_filter_name = "masters_ref_score"
-        drop_cols = [
-            "tanabe_score",
-            "masters_query_score",
-            "query_sample",
-            "n_query_alleles",
-            "n_reference_alleles",
-        ]
+    return _filter_scores(
+        _cached_score_database(query, str_database, use_amel),
+        query,
+        three_allele_threshold,
+        query_filter,
+        query_filter_threshold,
+        str_database,
+    )
 
-    mixed = sp.mixing_check(
-        alleles=query, three_allele_threshold=three_allele_threshold
+
+def _score_database(query, str_database, use_amel):
+    """
+    Scores a query against every reference in the database, without sorting or filtering.
+    Only the scores are kept; ``_filter_scores`` joins in reference alleles for the rows it returns.
+
+    :param query: dictionary of query sample markers and alleles, as for ``_single_query``.
+    :type query: dict
+    :param str_database: reference database, as for ``_single_query``, or a ProfileSet (scored as arrays) or
+        ProfileStore (only its candidates are scored, and returned).
+    :type str_database: dict
+    :param use_amel: use Amelogenin for similarity scoring
+    :type use_amel: bool
+    :return: pd.df with the query at index 0, then the i-th reference at index i + 1, with all three scores.
+    :rtype: pd.df
+    """
+    if isinstance(str_database, ProfileStore):
+        return _store_frame(query, str_database, use_amel)
+    reference = _reference_profiles(str_database)
+    scores = score_profiles(query, reference, use_amel=use_amel, amel_col="Amelogenin")
+    return _score_frame(reference.samples, scores)
+
+
+def _reference_profiles(str_database):
+    """
+    Returns the database as a ProfileSet. Plain dictionaries are encoded with every column scored,
+    as ``score_query`` compares them.
+    """
+    if isinstance(str_database, ProfileSet):
+        return str_database
+    return ProfileSet.from_dict(str_database, meta_columns=[])
+
+
+def _store_frame(query, store, use_amel, name="Query"):
+    """
+    ``_score_frame`` of a query's candidates in a ProfileStore, indexed by their ids in the store as
+    ``_score_database`` indexes references. Candidates share an allele, so always a marker, with the query.
+    """
+    ids, candidates, scores = store.search(
+        query, use_amel=use_amel, amel_col="Amelogenin", min_shared=STORE_MIN_SHARED
     )
+    out = _score_frame(candidates.samples, scores, name=name)
+    out.index = np.concatenate([[0], ids + 1])
+    return out
+
 
-    q_out = {
-        "Sample": "Query",
-        "mixed": mixed,
-        "query_sample": True,
-        "n_shared_markers": nan,
-        "n_shared_alleles": nan,
-        "n_query_alleles": nan,
-        "n_reference_alleles": nan,
-        "tanabe_score": nan,
-        "masters_query_score": nan,
-        "masters_ref_score": nan,
-        "Center": nan,
-        "Passage": nan
+def _score_frame(samples, scores, rows=None, name="Query"):
+    """
+    Builds the scores table of ``_score_database`` from score arrays, with the query first. References
+    sharing no markers score False throughout, as ``_single_query`` has always reported them.
+
+    :param samples: Reference sample names, aligned with the score arrays.
+    :type samples: numpy.ndarray
+    :param scores: Dictionary of ``SCORE_FIELDS`` arrays plus ``valid``.
+    :type scores: dict
+    :param rows: Reference positions to keep, defaults to all.
+    :type rows: numpy.ndarray, optional
+    :param name: Sample name shown for the query, defaults to "Query"
+    :type name: str, optional
+    :rtype: pd.df
+    """
+    if rows is None:
+        rows = np.arange(len(samples))
+    valid = scores["valid"][rows]
+
+    data = {
+        "Sample": np.concatenate([np.array([name], dtype=object), np.asarray(samples, dtype=object)[rows]]),
+        "mixed": np.array([False] + [nan] * len(rows), dtype=object),
+        "query_sample": np.concatenate([[True], np.zeros(len(rows), dtype=bool)]),
     }
-    q_out.update(query)
-
-    # Put query sample first.
-    samp_comps = [q_out]
-
-    for sa in str_database.keys():
-        r = str_database[sa]
-
-        # catch cases where ref is empty or otherwise invalid.
-        try:
-            scores = sp.score_query(
-                query=query, reference=r, use_amel=use_amel, amel_col="Amelogenin"
-            )
-        except ZeroDivisionError:
-            scores = {'n_shared_markers': False,
-                      'query_sample': False,
-                      'n_shared_alleles': False,
-                      'n_query_alleles': False,
-                      'n_reference_alleles': False,
-                      'tanabe_score': False,
-                      'masters_query_score': False,
-                      'masters_ref_score': False}
-
-        # Create dict of scores for each sample comparison.
-        samp_out = OrderedDict({"Sample": sa})
-        samp_out.update(scores)
-        samp_out.update(r)
-
-        samp_comps.append(samp_out)
-
-    # Create DataFrame of scores for each sample comparison.
-    full_samp_out = pd.DataFrame(samp_comps)
+    for k in ["n_shared_markers", "n_shared_alleles", "n_query_alleles", "n_reference_alleles",
+              "tanabe_score", "masters_query_score", "masters_ref_score"]:
+        values = scores[k][rows]
+        if valid.all():
+            data[k] = np.concatenate([[nan], values.astype(float)])
+        else:
+            values = values.astype(object)
+            values[~valid] = False
+            data[k] = np.concatenate([np.array([nan], dtype=object), values])
+
+    return pd.DataFrame(data, index=np.concatenate([[0], rows + 1]))
+
+
+def _join_alleles(scores, query, str_database):
+    """
+    Joins the query's and each reference's alleles (and Center/Passage) onto rows of a ``_score_database``
+    table, in the same column layout as a table built with every row's alleles up front.
+    """
+    rows = scores.index[scores.index != 0].to_numpy() - 1
+    head = pd.DataFrame([{"Center": nan, "Passage": nan, **query}], index=[0], dtype=object)
+
+    if isinstance(str_database, ProfileStore):
+        # Profiles removed from the store since scoring are left without alleles.
+        refs = str_database.frame(rows, missing_ok=True).drop(columns="Sample")
+        ref_columns = refs.columns.tolist()
+        refs.index = refs.index + 1
+    elif isinstance(str_database, ProfileSet):
+        ref_columns = str_database.columns
+        refs = str_database.take(rows).to_frame()
+        refs.index = rows + 1
+    else:
+        keys = list(str_database.keys())
+        ref_columns = list(dict.fromkeys(c for r in str_database.values() for c in r))
+        refs = pd.DataFrame([str_database[keys[i]] for i in rows], columns=ref_columns, dtype=object)
+        refs.index = rows + 1
+
+    alleles = pd.concat([head, refs.astype(object)]).reindex(scores.index)
+    alleles = alleles[list(dict.fromkeys(list(head.columns) + list(ref_columns)))]
+    for c in ["Center", "Passage"]:
+        if c not in ref_columns:
+            alleles[c] = alleles[c].astype(float)
+    return pd.concat([scores, alleles], axis=1)
+
+
+def _filter_scores(
+    scores,
+    query,
+    three_allele_threshold,
+    query_filter,
+    query_filter_threshold,
+    str_database,
+):
+    """
+    Builds the single query results table from the output of ``_score_database``.
+    Cheap relative to scoring, so changing the score type or thresholds only repeats this step.
+    Rows are sorted and filtered on the scores alone; alleles are joined in only for the rows returned.
+
+    :param scores: pd.df from ``_score_database``. Not modified.
+    :type scores: pd.df
+    :param query: dictionary of query sample markers and alleles.
+    :type query: dict
+    :param three_allele_threshold: number of markers with >= 2 alleles allowed before a sample is flagged for potential mixing
+    :type three_allele_threshold: int
+    :param query_filter: similiarity score to use. Options are: Tanabe, Masters Query, and Masters Reference
+    :type query_filter: str
+    :param query_filter_threshold: Minimum score to report as potential matches in summary table
+    :type query_filter_threshold: int
+    :param str_database: reference database the scores were computed against.
+    :type str_database: dict
+    :return: pd.df containing results from similarity comparison.
+    :rtype: pd.df
+    """
+    query_filter_name = SCORE_COLUMNS[query_filter]
+    drop_cols = [c for c in SCORE_COLUMNS.values() if c != query_filter_name] + [
+        "query_sample",
+        "n_query_alleles",
+        "n_reference_alleles",
+    ]
+
+    full_samp_out = scores.copy()
+    full_samp_out.iloc[0, full_samp_out.columns.get_loc("mixed")] = sp.mixing_check(
+        alleles=query, three_allele_threshold=three_allele_threshold
+    )
+
     full_samp_out.sort_values(
         by=query_filter_name, ascending=False, inplace=True, na_position="first"
     )
@@ -136,6 +316,8 @@ def _single_query(
         | (full_samp_out.index == 0)
     ]
 
+    full_samp_out = _join_alleles(full_samp_out, query, str_database)
+
     full_samp_out.drop(columns=drop_cols, inplace=True)
 
     full_samp_out.rename(
@@ -153,6 +335,48 @@ def _single_query(
     return full_samp_out
 
 
+def _live_query(
+    scorer,
+    query,
+    three_allele_threshold,
+    query_filter,
+    query_filter_threshold,
+):
+    """
+    Single query through an ``IncrementalScorer``, for live search as the query is edited.
+    Only markers changed since the scorer's last query are rescored, and only references
+    passing the threshold are turned into result rows.
+
+    :param scorer: scorer over the reference database, kept between calls.
+    :type scorer: strprofiler.scoring.IncrementalScorer
+    :param query: dictionary of query sample markers and alleles, as for ``_single_query``.
+    :type query: dict
+    :param three_allele_threshold: number of markers with >= 2 alleles allowed before a sample is flagged for potential mixing
+    :type three_allele_threshold: int
+    :param query_filter: similiarity score to use. Options are: Tanabe, Masters Query, and Masters Reference
+    :type query_filter: str
+    :param query_filter_threshold: Minimum score to report as potential matches in summary table
+    :type query_filter_threshold: int
+    :return: pd.df containing results from similarity comparison, as from ``_single_query``.
+    :rtype: pd.df
+    """
+    scorer.update(query)
+    scores = scorer.scores()
+
+    # References sharing no markers score False (i.e. 0) in _score_database.
+    score = np.where(scores["valid"], scores[SCORE_COLUMNS[query_filter]], 0)
+    hits = np.flatnonzero(np.round(score, 2) >= query_filter_threshold)
+
+    return _filter_scores(
+        _score_frame(scorer.database.samples, scores, hits),
+        query,
+        three_allele_threshold,
+        query_filter,
+        query_filter_threshold,
+        scorer.database,
+    )
+
+
 def _batch_query(
     query_df,
     str_database,
@@ -203,53 +427,101 @@ def _batch_query(
     :return: pd.df containing results from similarity comparison.
     :rtype: pd.df
     """
-    summaries = []
-
-    for s in query_df.keys():
-        q = query_df[s]
-        # Check for sample mixing.
-        mixed = sp.mixing_check(
-            alleles=q, three_allele_threshold=three_allele_threshold
-        )
-
-        q_out = {
-            "Sample": s,
-            "mixed": mixed,
-            "query_sample": True,
-            "n_shared_markers": nan,
-            "n_shared_alleles": nan,
-            "n_query_alleles": nan,
-            "n_reference_alleles": nan,
-            "tanabe_score": nan,
-            "masters_query_score": nan,
-            "masters_ref_score": nan,
-        }
-        q_out.update(q)
+    scores = _batch_scores(query_df, str_database, use_amel)
+    if not isinstance(scores, dict):
+        return scores
+
+    return _summarize_scores(
+        scores,
+        query_df,
+        three_allele_threshold,
+        tan_threshold,
+        mas_q_threshold,
+        mas_r_threshold,
+    )
 
-        # Put query sample first.
-        samp_comps = [q_out]
 
-        for sa in str_database.keys():
-            r = str_database[sa]
+def _batch_scores(query_df, str_database, use_amel):
+    """
+    Scores each query sample against every reference in the database.
 
-            try:
-                scores = sp.score_query(query=q, reference=r, use_amel=use_amel)
-            except ZeroDivisionError:
+    :param query_df: dictonary of query samples, as for ``_batch_query``.
+    :type query_df: dict
+    :param str_database: reference database, as for ``_batch_query``.
+    :type str_database: dict
+    :param use_amel: use Amelogenin for similarity scoring
+    :type use_amel: bool
+    :return: dict of query sample to pd.df of its scores (as from ``_score_database``, with the query
+        named after the sample) sorted by Tanabe score, or the error returned by ``_batch_query``.
+    :rtype: dict
+    """
+    reference = str_database if isinstance(str_database, ProfileStore) else _reference_profiles(str_database)
+    out = {}
+    # Identical queries score identically, so each distinct profile is scored once and its table reused.
+    scored = {}
+
+    for s, q in query_df.items():
+        query = PreparedQuery(q, use_amel=use_amel)
+        if query.key in scored:
+            full_samp_out = scored[query.key].copy()
+            full_samp_out.iloc[0, 0] = s
+            out[s] = full_samp_out
+            continue
+
+        if isinstance(reference, ProfileStore):
+            if not any(m in reference.markers for m in query.alleles):
                 return "No shared markers between query and reference."
-            except Exception:
-                return False
-            # Create dict of scores for each sample comparison.
-            samp_out = OrderedDict({"Sample": sa})
-            samp_out.update(scores)
-            samp_out.update(r)
-
-            samp_comps.append(samp_out)
+            full_samp_out = _store_frame(query, reference, use_amel, name=s)
+        else:
+            scores = score_profiles(query, reference)
+            if not scores["valid"].all():
+                return "No shared markers between query and reference."
+            full_samp_out = _score_frame(reference.samples, scores, name=s)
 
-        # Create DataFrame of scores for each sample comparison.
-        full_samp_out = pd.DataFrame(samp_comps)
+        # Query sample first, then references sorted by Tanabe score.
         full_samp_out.sort_values(
             by="tanabe_score", ascending=False, inplace=True, na_position="first"
         )
+        out[s] = scored[query.key] = full_samp_out
+
+    return out
+
+
+def _summarize_scores(
+    scores,
+    query_df,
+    three_allele_threshold,
+    tan_threshold,
+    mas_q_threshold,
+    mas_r_threshold,
+):
+    """
+    Builds the batch summary table from the output of ``_batch_scores`` or ``_file_scores``.
+    Cheap relative to scoring, so changing thresholds only repeats this step.
+
+    :param scores: dict of query sample to pd.df of comparisons sorted by Tanabe score.
+    :type scores: dict
+    :param query_df: dictonary of query samples.
+    :type query_df: dict
+    :param three_allele_threshold: number of markers with >= 2 alleles allowed before a sample is flagged for potential mixing
+    :type three_allele_threshold: int
+    :param tan_threshold: Minimum Tanabe score to report as potential matches in summary table
+    :type tan_threshold: int
+    :param mas_q_threshold: Minimum Masters (vs. query) score to report as potential matches in summary table
+    :type mas_q_threshold: int
+    :param mas_r_threshold: Minimum Masters (vs. reference) score to report as potential matches in summary table
+    :type mas_r_threshold: int
+    :return: pd.df containing results from similarity comparison.
+    :rtype: pd.df
+    """
+    summaries = []
+
+    for s, full_samp_out in scores.items():
+        q = query_df[s]
+        # Check for sample mixing.
+        mixed = sp.mixing_check(
+            alleles=q, three_allele_threshold=three_allele_threshold
+        )
 
         # Generate summary of scores for given sample.
         summ = sp.make_summary(
@@ -325,84 +597,46 @@ def _file_query(
     :return: pd.df containing results from similarity comparison.
     :rtype: pd.df
     """
-    summaries = []
-
-    for s in query_df.keys():
-        q = query_df[s]
-        # Check for sample mixing.
-        mixed = sp.mixing_check(
-            alleles=q, three_allele_threshold=three_allele_threshold
-        )
-
-        q_out = {
-            "Sample": s,
-            "mixed": mixed,
-            "query_sample": True,
-            "n_shared_markers": nan,
-            "n_shared_alleles": nan,
-            "n_query_alleles": nan,
-            "n_reference_alleles": nan,
-            "tanabe_score": nan,
-            "masters_query_score": nan,
-            "masters_ref_score": nan,
-        }
-        q_out.update(q)
-
-        # Put query sample first.
-        samp_comps = [q_out]
-
-        for sa in query_df.keys():
-            if sa != s:
-                r = query_df[sa]
-                scores = sp.score_query(query=q, reference=r, use_amel=use_amel)
+    return _summarize_scores(
+        _file_scores(query_df, use_amel),
+        query_df,
+        three_allele_threshold,
+        tan_threshold,
+        mas_q_threshold,
+        mas_r_threshold,
+    )
 
-                # Create dict of scores for each sample comparison.
-                samp_out = OrderedDict({"Sample": sa})
-                samp_out.update(scores)
-                samp_out.update(r)
 
-                samp_comps.append(samp_out)
+def _file_scores(query_df, use_amel):
+    """
+    Scores each query sample against every other sample in the file.
 
-        # Create DataFrame of scores for each sample comparison.
-        full_samp_out = pd.DataFrame(samp_comps)
+    :param query_df: dictonary of query samples, as for ``_file_query``.
+    :type query_df: dict
+    :param use_amel: use Amelogenin for similarity scoring
+    :type use_amel: bool
+    :return: dict of query sample to pd.df of its scores against the other samples, as for ``_batch_scores``.
+    :rtype: dict
+    """
+    reference = ProfileSet.from_dict(query_df, meta_columns=[])
+    out = {}
+    # Scores against the whole file are shared by identical samples; only the excluded self differs.
+    scored = {}
+
+    for s, q in query_df.items():
+        others = np.flatnonzero(reference.samples != s)
+        query = PreparedQuery(q, use_amel=use_amel)
+        if query.key not in scored:
+            scored[query.key] = score_profiles(query, reference)
+        scores = scored[query.key]
+        if not scores["valid"][others].all():
+            raise ZeroDivisionError("No shared markers between " + s + " and another sample.")
+
+        # Query sample first, then the other samples sorted by Tanabe score.
+        full_samp_out = _score_frame(reference.samples, scores, rows=others, name=s)
         full_samp_out.sort_values(
             by="tanabe_score", ascending=False, inplace=True, na_position="first"
         )
+        out[s] = full_samp_out
 
-        # Generate summary of scores for given sample.
-        summ = sp.make_summary(
-            samp_df=full_samp_out,
-            alleles=q,
-            tan_threshold=tan_threshold,
-            mas_q_threshold=mas_q_threshold,
-            mas_r_threshold=mas_r_threshold,
-            mixed=mixed,
-            s_name=s,
-        )
-        summaries.append(summ)
-    summaries = pd.DataFrame(summaries)
-
-    summaries_out = summaries[
-        [
-            "Sample",
-            "mixed",
-            "top_hit",
-            "next_best",
-            "tanabe_matches",
-            "masters_query_matches",
-            "masters_ref_matches",
-        ]
-    ]
-
-    summaries_ret = summaries_out.rename(
-        columns={
-            "mixed": "Mixed Sample",
-            "top_hit": "Top Match",
-            "next_best": "Next Best Match",
-            "tanabe_matches": "Tanabe Matches",
-            "masters_query_matches": "Masters Query Matches",
-            "masters_ref_matches": "Masters Ref Matches",
-        }
-    )
-
-    return summaries_ret
+    return out
@@ -1,14 +1,133 @@
 import requests
 import json
 import pandas as pd
-import numpy as np
 import io
+import os
+import re
+import time
+import threading
 import warnings
-from flatten_json import flatten
-from strprofiler.utils import _pentafix, validate_api_markers
+from concurrent.futures import Future, ThreadPoolExecutor
+from strprofiler.utils import _pentafix, validate_api_markers, _csv_chunks
+from strprofiler.shiny_app.clastr_cache import CLASTR_PARAMS, _get_cache, _query_key
 
+CLASTR_BATCH_URL = "https://www.cellosaurus.org/str-search/api/batch/"
 
-def _clastr_query(query, query_filter, include_amelogenin, score_filter):
+# Batch submissions are split into chunks of at most this many profiles,
+# with up to BATCH_MAX_WORKERS chunks in flight at once.
+BATCH_CHUNK_SIZE = 100
+BATCH_MAX_WORKERS = 4
+BATCH_RETRIES = 3
+BATCH_TIMEOUT = 300
+
+# Status codes worth retrying. Anything else in the 4xx range is a problem with the query itself.
+# 429 is retried by _clastr_post alone, so retry layers do not multiply under rate limiting.
+RETRY_STATUS = (500, 502, 503, 504)
+
+# Process-wide limit on requests sent to CLASTR, shared by every session and batch worker.
+# Override with STRPROFILER_CLASTR_RATE (requests per second, 0 for no limit) and STRPROFILER_CLASTR_BURST.
+RATE_LIMIT = float(os.environ.get("STRPROFILER_CLASTR_RATE", 2))
+RATE_BURST = int(os.environ.get("STRPROFILER_CLASTR_BURST", 5))
+RATE_LIMIT_RETRIES = 5
+
+
+class _TokenBucket:
+    """
+    Thread-safe token bucket. acquire() blocks until a token is available rather than failing,
+    so callers are smoothed out under the limit instead of seeing errors.
+
+    :param rate: tokens added per second; 0 disables the limit.
+    :type rate: float
+    :param capacity: maximum tokens held, i.e. the allowed burst.
+    :type capacity: int
+    """
+
+    def __init__(self, rate, capacity):
+        if rate < 0 or capacity < 1:
+            raise ValueError(f"Invalid CLASTR rate limit: {rate} per second, burst {capacity}")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve a token even if it goes negative; the debt sets how long to wait.
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class _SingleFlight:
+    """
+    Coalesce concurrent calls that share a key so only the first runs; the rest wait for
+    and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            return call.result()
+
+        try:
+            call.set_result(fn())
+        except BaseException as e:
+            call.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return call.result()
+
+
+_limiter = _TokenBucket(RATE_LIMIT, RATE_BURST)
+_inflight = _SingleFlight()
+
+
+def _clastr_post(url, query, timeout=None, retries=RATE_LIMIT_RETRIES):
+    """
+    POST a query to CLASTR under the process-wide rate limit.
+    429 responses are retried after the server's Retry-After delay (or exponential backoff).
+
+    :param url: CLASTR endpoint.
+    :type url: str
+    :param query: JSON-serializable query payload.
+    :type query: dict or list
+    :param timeout: request timeout in seconds.
+    :type timeout: float, optional
+    :param retries: number of times to retry a 429 response.
+    :type retries: int
+    :return: post request return.
+    :rtype: requests.Response
+    """
+    for attempt in range(retries + 1):
+        _limiter.acquire()
+        r = requests.post(url, data=json.dumps(query), timeout=timeout)
+        if r.status_code != 429 or attempt == retries:
+            return r
+        try:
+            delay = float(r.headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            delay = 2 ** attempt
+        time.sleep(delay)
+
+
+def _clastr_query(query, query_filter, include_amelogenin, score_filter, use_cache=True):
     """
     :param query: dictionary in the format
         {"Amelogenin": "X,Y",
@@ -23,14 +142,14 @@ def _clastr_query(query, query_filter, include_amelogenin, score_filter):
     :type includeAmelogenin: bool
     :param score_filter: Minimum score to report as potential matches in summary table
     :type score_filter: int
+    :param use_cache: look up and store the response in the on-disk CLASTR cache
+    :type use_cache: bool
     :return: pd.df with parsed json output or pd.df with error message.
     :rtype: pd.df
     """
     url = "https://www.cellosaurus.org/str-search/api/query/"
 
-    dct = {k: [v] for k, v in query.items()}
-    query_df = pd.DataFrame(dct)
-    query_df["accession"] = "Query"
+    profile = dict(query)
 
     if query_filter == "Tanabe":
         query["algorithm"] = 1
@@ -44,7 +163,27 @@ def _clastr_query(query, query_filter, include_amelogenin, score_filter):
     query["includeAmelogenin"] = include_amelogenin
     query["scoreFilter"] = score_filter
 
-    r = requests.post(url, data=json.dumps(query))
+    cache = _get_cache() if use_cache else None
+
+    def _fetch():
+        content = cache.get(cache.key(query)) if cache is not None else None
+        if content is not None:
+            return json.loads(content)
+
+        r = _clastr_post(url, query)
+        r.raise_for_status()
+
+        data = json.loads(r.content)
+        if cache is not None:
+            cache.set_release(data.get("cellosaurusRelease"))
+            cache.put(cache.key(query), r.content)
+        return data
+
+    # Identical queries in flight at the same time (e.g. from several sessions) share one request.
+    try:
+        data = _inflight.do((url, _query_key(query)), _fetch)
+    except requests.exceptions.HTTPError as e:
+        return pd.DataFrame({"Error": [str(e)]})
 
     # JSON response:
     #   'description': '',
@@ -56,100 +195,382 @@ def _clastr_query(query, query_filter, include_amelogenin, score_filter):
     #   'results': [{ ...
     # FULL STRUCTURE OUTLINED BELOW.
 
-    try:
-        r.raise_for_status()
-    except requests.exceptions.HTTPError as e:
-        return pd.DataFrame({"Error": [str(e)]})
+    return _parse_clastr_results(profile, data["results"])
+
+
+def _parse_clastr_results(query, results):
+    """
+    Build the result table for a single CLASTR query in one pass over
+    results -> profiles -> markers -> alleles.
 
-    df = pd.DataFrame.from_dict(r.json()["results"])
+    The query sample is the first row. Each result profile with at least one allele gets a row,
+    with alleles joined per marker in the order returned. Results have at most 2 profiles;
+    when both are returned, the accession is labelled '(Best)' or '(Worst)' by comparing the
+    profile score to the result's bestScore.
 
-    if df.empty:
+    :param query: query sample markers and alleles, as entered.
+    :type query: dict
+    :param results: 'results' list from the CLASTR JSON response.
+    :type results: list
+    :return: pd.df of string values with columns accession, name, species, score, accession_link,
+    problem (if any result has one), then query markers, then any other result markers.
+    :rtype: pd.df
+    """
+    if not results:
         return pd.DataFrame({"No CLASTR Result": []})
 
-    flattened = [flatten(d) for d in r.json()["results"]]
-    df = pd.DataFrame(flattened)
-
-    # profiles[0] has "bestScore" returns, but a second return is possible.
-    # per CLASTR there will be at most 2 returns per profile.
-    # Markers within profiles are split into individual "value":allele pairs.
-    # First select alleles, and then concat alleles by return and marker
-    markers = df.filter(regex="^profiles_*_.*_value").T
-    markers[["A", "profileID", "C", "markerID", "E", "F", "G"]] = markers.index.str.split("_", n=7, expand=False).tolist()
-    markers.drop(["A", "C", "E", "F", "G"], axis=1, inplace=True)
-    # Melt dataframe to: [profileID, markerID, resultID, allele] for cat on profileID/markerID/resultID
-    melted_markers = pd.melt(markers, id_vars=["profileID", "markerID"], var_name="resultID", value_name="allele")
-
-    # each profile has its own score as well. these also need to be tracked to trace "best" and "worst" in multi-return cases.
-    scores = df.filter(regex="^profiles_*_.*_score").T
-    scores[["A", "profileID", "C"]] = scores.index.str.split("_", n=3, expand=False).tolist()
-    scores.drop(["A", "C"], axis=1, inplace=True)
-    melted_scores = pd.melt(scores, id_vars=["profileID"], var_name="resultID", value_name="score").dropna()
-
-    # Join resultID and markerID index to grouped joined allele strings.
-    allele_cat_markers = pd.concat([
-        melted_markers[["resultID", "profileID", "markerID"]],
-        melted_markers.groupby(["resultID", "profileID", "markerID"], as_index=True)
-        .transform(lambda x: ",".join(map(str, x)).replace(",nan", "").replace("nan", ""))
-    ], axis=1).drop_duplicates(subset=["resultID", "profileID", "markerID"])
-
-    pd.merge(allele_cat_markers, melted_scores,  how="inner", on=["profileID", "resultID"])
-
-    # Marker names are not consistant across results. MarkerName[1] != MarkerName[1] in all returns.
-    # We must track marker name by profile, index, and result.
-    # The same logic from above applies, split the compound column name string,
-    # Melt on profileID and markerID, and then merge with concat allele made above.
-    # Finally, pivot into a table and rejoin to higher level results.
-    marker_names = df.filter(regex="^profiles_*_.*_name").T
-    marker_names[["A", "profileID", "C", "markerID", "E"]] = marker_names.index.str.split("_", n=5, expand=False).tolist()
-    marker_names.drop(["A", "C", "E"], axis=1, inplace=True)
-
-    melted_markers = pd.melt(marker_names, id_vars=["profileID", "markerID"],
-                             var_name="resultID", value_name="markerName").dropna().drop_duplicates(subset=["profileID", "markerID", "resultID"])
-
-    markers_names_alleles = pd.merge(allele_cat_markers, melted_markers,  how="inner", on=["profileID", "markerID", "resultID"])
-
-    pivot_markers_names_alleles = markers_names_alleles.pivot(index=["profileID", "resultID"], columns="markerName", values="allele")
+    front = ["accession", "name", "species", "score", "accession_link"]
+    if any("problem" in result for result in results):
+        front.append("problem")
+
+    rows = [dict(query, accession="Query")]
+    result_markers = set()
+
+    for result in results:
+        profiles = []
+        for profile in result["profiles"]:
+            alleles = {
+                marker["name"]: ",".join(str(allele["value"]) for allele in marker["alleles"])
+                for marker in profile["markers"]
+                if marker["alleles"]
+            }
+            if alleles:
+                profiles.append((profile["score"], alleles))
+
+        for score, alleles in profiles:
+            accession = result["accession"]
+            if len(profiles) > 1 and score == result["bestScore"]:
+                accession += " (Best)"
+            elif score != result["bestScore"]:
+                accession += " (Worst)"
+
+            row = {
+                "accession": accession,
+                "name": result["name"],
+                "species": result["species"],
+                "score": "{0:.2f}".format(score),
+                "accession_link": "https://web.expasy.org/cellosaurus/" + result["accession"],
+                "problem": result.get("problem", ""),
+            }
+            result_markers.update(alleles)
+            row.update(_pentafix(alleles))
+            rows.append(row)
+
+    # Markers not in the query follow in name order, with the Penta markers last.
+    extra = _pentafix(dict.fromkeys(sorted(result_markers)))
+    columns = front + [c for c in query if c not in front]
+    columns += [c for c in extra if c not in columns]
+
+    return pd.DataFrame(rows, columns=columns).fillna("")
 
-    try:
-        merged = pd.merge(df[["accession", "name", "species", "bestScore", "problem"]],
-                          pivot_markers_names_alleles, left_index=True, right_on="resultID")
-    except KeyError:
-        merged = pd.merge(df[["accession", "name", "species", "bestScore"]], pivot_markers_names_alleles, left_index=True, right_on="resultID")
 
-    merged["accession_link"] = "https://web.expasy.org/cellosaurus/" + merged["accession"]
+def _post_batch_chunk(chunk, url=CLASTR_BATCH_URL, retries=BATCH_RETRIES, backoff=1):
+    """
+    POST a single chunk of a batch query, retrying transient failures with exponential backoff.
+
+    :param chunk: list of query dictionaries, already carrying the CLASTR search parameters.
+    :type chunk: list
+    :param url: CLASTR batch endpoint.
+    :type url: str
+    :param retries: number of times to retry a failed request.
+    :type retries: int
+    :param backoff: seconds to wait before the first retry, doubled for each following retry.
+    :type backoff: float
+    :return: successful post request return.
+    :rtype: requests.Response
+    :raises requests.exceptions.RequestException: if the chunk still fails after all retries.
+    """
+    for attempt in range(retries + 1):
+        try:
+            r = _clastr_post(url, chunk, timeout=BATCH_TIMEOUT)
+            r.raise_for_status()
+            return r
+        except requests.exceptions.HTTPError as e:
+            if attempt == retries or e.response is None or e.response.status_code not in RETRY_STATUS:
+                raise
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == retries:
+                raise
+        time.sleep(backoff * 2 ** attempt)
+
+
+def _clastr_batch_post(
+    query,
+    url=CLASTR_BATCH_URL,
+    chunk_size=BATCH_CHUNK_SIZE,
+    max_workers=BATCH_MAX_WORKERS,
+    retries=BATCH_RETRIES,
+):
+    """
+    Submit a batch query in size-bounded chunks with bounded concurrency.
+
+    Each chunk is retried on its own, so a transient failure only costs that chunk.
+
+    :param query: list of query dictionaries, already carrying the CLASTR search parameters.
+    Each must have a 'description' key.
+    :type query: list
+    :param url: CLASTR batch endpoint.
+    :type url: str
+    :param chunk_size: maximum number of profiles per request.
+    :type chunk_size: int
+    :param max_workers: maximum number of requests in flight at once.
+    :type max_workers: int
+    :param retries: number of times to retry a failed chunk.
+    :type retries: int
+    :return: list of (chunk, result) tuples in input order, where result is either the
+    successful post request return or the exception that caused the chunk to fail.
+    :rtype: list
+    """
+    chunks = [query[i:i + chunk_size] for i in range(0, len(query), max(chunk_size, 1))]
+
+    def _submit(chunk):
+        try:
+            return _post_batch_chunk(chunk, url=url, retries=retries)
+        except requests.exceptions.RequestException as e:
+            return e
 
-    merged = _pentafix(merged)
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(chunks)), 1)) as executor:
+        results = list(executor.map(_submit, chunks))
 
-    merged_scored = pd.merge(merged, melted_scores, left_on=["profileID", "resultID"], right_on=["profileID", "resultID"])
+    return list(zip(chunks, results))
 
-    # For returns with 2 profiles, annotate which of the pair is best / worst.
-    # group by accession, and mutate a new accession column when multi_return and profile score == bestScore (best)
-    # when multi_return and profile score != bestScore (worst), and all other cases (single returns)
-    merged_scored["multi_group"] = merged_scored.groupby("accession")["accession"].transform("size") > 1
-    merged_scored["new"] = np.where(merged_scored["multi_group"] & (merged_scored["bestScore"] == merged_scored["score"]),
-                                    merged_scored["accession"] + " (Best)",
-                                    np.where(merged_scored["bestScore"] != merged_scored["score"],
-                                             merged_scored["accession"] + " (Worst)",
-                                             merged_scored["accession"]))
-    merged_scored["accession"] = merged_scored["new"]
 
-    # # add the query line to the top of merged_scored, and reorder columns
-    query_added = pd.concat([query_df, merged_scored.drop(["new", "bestScore", "multi_group"], axis=1)]).reset_index(drop=True)
+def _read_batch_sheets(content):
+    """
+    Read every sheet of a CLASTR batch xlsx return.
 
-    query_added["score"] = query_added["score"].map("{0:.2f}".format).replace("nan", "")
+    :param content: xlsx bytes.
+    :type content: bytes
+    :return: list of (sheet name, pd.df) in workbook order.
+    :rtype: list
+    """
+    with warnings.catch_warnings():
+        # read_excel throws noisy "UserWarning: Workbook contains no default style, apply openpyxl's default"
+        warnings.simplefilter("ignore")
+        with io.BytesIO(content) as fh:
+            return list(pd.io.excel.read_excel(fh, sheet_name=None).items())
 
-    if "problem" in query_added.columns:
-        query_added = query_added[["accession", "name", "species", "score", "accession_link", "problem"] +
-                                  [c for c in query_added if c not in
-                                   ["accession", "name", "species", "score", "accession_link", "problem"]]].fillna("")
-    else:
-        query_added = query_added[["accession", "name", "species", "score", "accession_link"] +
-                                  [c for c in query_added if c not in ["accession", "name", "species", "score", "accession_link"]]].fillna("")
 
-    return query_added
+def _batch_profile(item):
+    """Markers of a batch query item, with Penta spelling harmonised to match parsed results."""
+    return _pentafix({k: v for k, v in item.items() if k not in CLASTR_PARAMS and k != "description"})
 
 
-def _clastr_batch_query(query, query_filter, include_amelogenin, score_filter):
+def _sheet_names(names):
+    """
+    Unique, valid Excel sheet names for a list of sample names: characters Excel rejects are replaced,
+    names are cut to 31 characters, and names that then collide get a numbered suffix.
+
+    :param names: sample names.
+    :type names: list
+    :return: list of sheet names, aligned with ``names``.
+    :rtype: list
+    """
+    sheet_names = []
+    seen = set()
+    for name in names:
+        base = re.sub(r"[\[\]:*?/\\]", "_", str(name)).strip("'")[:31] or "Sheet"
+        sheet_name, n = base, 1
+        while sheet_name.lower() in seen:
+            n += 1
+            suffix = f" ({n})"
+            sheet_name = base[:31 - len(suffix)] + suffix
+        seen.add(sheet_name.lower())
+        sheet_names.append(sheet_name)
+    return sheet_names
+
+
+def _match_returns(wanted, names, returns):
+    """
+    Pair each query of a chunk, by name, with the return of that name. Repeated names pair up in order.
+    If the names do not all match but there is one return per query, returns are paired by position.
+
+    :raises ValueError: If the returns are not exactly one per query.
+    :return: list of returns, aligned with the chunk.
+    :rtype: list
+    """
+    if len(returns) != len(wanted):
+        raise ValueError(f"CLASTR returned {len(returns)} results for {len(wanted)} samples")
+    by_name = {}
+    for name, value in zip(names, returns):
+        by_name.setdefault(name, []).append(value)
+    matched = []
+    for name in wanted:
+        values = by_name.get(name)
+        if not values:
+            return list(returns)
+        matched.append(values.pop(0))
+    return matched
+
+
+def _chunk_sheets(chunk, result):
+    """
+    Split one chunk's batch return into per-sample sheets, named by query description.
+
+    JSON returns are parsed with _parse_clastr_results; xlsx returns are read sheet by sheet.
+    Returns are matched to queries by description (sheet name), and by position only when the names do not match.
+    Samples from a failed chunk get a single-cell sheet holding the error message.
+
+    :param chunk: list of query dictionaries submitted together.
+    :type chunk: list
+    :param result: successful post request return, or the exception that caused the chunk to fail.
+    :type result: requests.Response or Exception
+    :raises ValueError: If a successful return does not hold exactly one result per query.
+    :return: tuple of (list of (sheet name, pd.df), list of per-sample cache values, or None if the chunk failed,
+        Cellosaurus release of the return, or None if not known).
+    :rtype: tuple
+    """
+    if isinstance(result, Exception):
+        return [(item["description"], pd.DataFrame({"Error": [str(result)]})) for item in chunk], None, None
+
+    if chunk[0].get("outputFormat") == "xlsx":
+        sheets = _read_batch_sheets(result.content)
+        # Sheet names are descriptions made into valid, unique Excel sheet names.
+        wanted = _sheet_names([item["description"] for item in chunk])
+        dfs = _match_returns(wanted, [name for name, _ in sheets], [df for _, df in sheets])
+        sheets = [(item["description"], df) for item, df in zip(chunk, dfs)]
+        return sheets, [df.to_json(orient="split").encode() for _, df in sheets], None
+
+    entries = json.loads(result.content)
+    entries = _match_returns(
+        [item["description"] for item in chunk], [entry.get("description") for entry in entries], entries
+    )
+    sheets = [
+        (item["description"], _parse_clastr_results(_batch_profile(item), entry["results"]))
+        for item, entry in zip(chunk, entries)
+    ]
+    return sheets, [json.dumps(entry).encode() for entry in entries], entries[0].get("cellosaurusRelease")
+
+
+def _cached_sheet(item, value):
+    """Rebuild a sample's sheet from its cached value, as stored by _chunk_sheets."""
+    if item.get("outputFormat") == "xlsx":
+        df = pd.read_json(io.StringIO(value.decode()), orient="split", dtype=False, convert_axes=False)
+        return item["description"], df
+    return item["description"], _parse_clastr_results(_batch_profile(item), json.loads(value)["results"])
+
+
+def _clastr_batch_sheets(
+    query,
+    chunk_size=BATCH_CHUNK_SIZE,
+    max_workers=BATCH_MAX_WORKERS,
+    retries=BATCH_RETRIES,
+    use_cache=True,
+):
+    """
+    Resolve a batch query to per-sample result sheets in input order.
+
+    Samples found in the on-disk CLASTR cache are served from it; the rest are submitted
+    via _clastr_batch_post and their results cached.
+
+    :param query: list of query dictionaries, already carrying the CLASTR search parameters.
+    Each must have a 'description' key. With outputFormat 'xlsx' the sheets are CLASTR's own,
+    otherwise the JSON return is parsed into the same table as a single query.
+    :type query: list
+    :param chunk_size: maximum number of profiles per request.
+    :type chunk_size: int
+    :param max_workers: maximum number of requests in flight at once.
+    :type max_workers: int
+    :param retries: number of times to retry a failed chunk.
+    :type retries: int
+    :param use_cache: look up and store results in the on-disk CLASTR cache
+    :type use_cache: bool
+    :return: tuple of (list of (sheet name, pd.df), list of (chunk, exception) for failed chunks).
+    :rtype: tuple
+    """
+    cache = _get_cache() if use_cache else None
+    sheets = [None] * len(query)
+
+    if cache is not None:
+        keys = [cache.key(item) for item in query]
+        for i, key in enumerate(keys):
+            value = cache.get(key)
+            if value is not None:
+                sheets[i] = _cached_sheet(query[i], value)
+
+    pending = [i for i, sheet in enumerate(sheets) if sheet is None]
+    chunk_results = _clastr_batch_post(
+        [query[i] for i in pending], chunk_size=chunk_size, max_workers=max_workers, retries=retries
+    ) if pending else []
+
+    failed = []
+    # Chunks are consecutive slices of the pending samples.
+    start = 0
+    for chunk, result in chunk_results:
+        try:
+            chunk_sheets, values, release = _chunk_sheets(chunk, result)
+        except ValueError as e:
+            # A return that does not match the chunk is a failure of the chunk, and is not cached.
+            result = e
+            chunk_sheets, values, release = _chunk_sheets(chunk, result)
+        if isinstance(result, Exception):
+            failed.append((chunk, result))
+        if cache is not None and values is not None:
+            # As for single queries, a new release moves new entries to new keys.
+            cache.set_release(release)
+        for j, sheet in enumerate(chunk_sheets):
+            i = pending[start + j]
+            sheets[i] = sheet
+            if cache is not None and values is not None:
+                cache.put(cache.key(query[i]), values[j])
+        start += len(chunk)
+
+    return [sheet for sheet in sheets if sheet is not None], failed
+
+
+def _batch_sheets_to_xlsx(sheets, fh=None):
+    """
+    Write per-sample sheets to a single xlsx workbook.
+
+    :param sheets: list of (sheet name, pd.df). Names are made into unique, valid Excel sheet names.
+    :type sheets: list
+    :param fh: path or binary file handle to write the workbook to, defaults to None (return bytes)
+    :type fh: str or file-like, optional
+    :return: xlsx bytes, or None if written to ``fh``.
+    :rtype: bytes
+    """
+    if fh is not None:
+        with pd.ExcelWriter(fh, engine="openpyxl") as writer:
+            for name, (_, df) in zip(_sheet_names([name for name, _ in sheets]), sheets):
+                df.to_excel(writer, sheet_name=name, index=False)
+        return None
+    with io.BytesIO() as buf:
+        _batch_sheets_to_xlsx(sheets, buf)
+        return buf.getvalue()
+
+
+def _batch_sheets_to_tidy(sheets):
+    """
+    Stack per-sample sheets into one table with the query sample as the first column.
+
+    :param sheets: list of (sheet name, pd.df).
+    :type sheets: list
+    :return: pd.df of all results.
+    :rtype: pd.df
+    """
+    return pd.concat(
+        [df.assign(Query=name)[["Query"] + list(df.columns)] for name, df in sheets],
+        ignore_index=True,
+    )
+
+
+def _batch_sheets_to_csv_chunks(sheets):
+    """
+    Stream per-sample sheets as one CSV table with the query sample as the first column,
+    as ``_batch_sheets_to_tidy(sheets).to_csv(index=False)`` would write it, one sheet at a time.
+
+    :param sheets: list of (sheet name, pd.df).
+    :type sheets: list
+    :return: Generator of CSV text chunks.
+    :rtype: generator
+    """
+    columns = list(dict.fromkeys(["Query"] + [c for _, df in sheets for c in df.columns]))
+    yield pd.DataFrame(columns=columns).to_csv(index=False)
+    for name, df in sheets:
+        yield from _csv_chunks(df.assign(Query=name), header=False, columns=columns)
+
+
+def _clastr_batch_query(query, query_filter, include_amelogenin, score_filter, use_cache=True):
     """
     :param query: list of dictionaries in the format
         [{
@@ -170,12 +591,13 @@ def _clastr_batch_query(query, query_filter, include_amelogenin, score_filter):
     :type includeAmelogenin: bool
     :param score_filter: Minimum score to report as potential matches in summary table
     :type score_filter: int
-    :return: valid post request return, or pd.df with error message.
-    Valid post request contains bytes in xlsx format accessed via (r.iter_content(chunk_size=128))
-    :rtype: request result or pd.df
+    :param use_cache: look up and store results in the on-disk CLASTR cache
+    :type use_cache: bool
+    :return: dictionary of query sample description to its parsed result table (see _parse_clastr_results),
+    in input order, or pd.df with error message. Samples whose chunk failed get a table with an 'Error' column.
+    Use _batch_sheets_to_xlsx(list(results.items())) to build a workbook.
+    :rtype: dict or pd.df
     """
-    url = "https://www.cellosaurus.org/str-search/api/batch/"
-
     query = [_pentafix(item, reverse=True) for item in query]
 
     if query_filter == "Tanabe":
@@ -187,16 +609,14 @@ def _clastr_batch_query(query, query_filter, include_amelogenin, score_filter):
 
     query = [dict(item, **{"includeAmelogenin": include_amelogenin}) for item in query]
     query = [dict(item, **{"scoreFilter": score_filter}) for item in query]
-    query = [dict(item, **{"outputFormat": "xlsx"}) for item in query]
+    query = [dict(item, **{"outputFormat": "json"}) for item in query]
 
-    r = requests.post(url, data=json.dumps(query))
+    sheets, failed = _clastr_batch_sheets(query, use_cache=use_cache)
 
-    try:
-        r.raise_for_status()
-    except requests.exceptions.HTTPError as e:
-        return pd.DataFrame({"Error": [str(e)]})
+    if failed and sum(len(chunk) for chunk, _ in failed) == len(query):
+        return pd.DataFrame({"Error": [str(failed[0][1])]})
 
-    return r
+    return dict(sheets)
 
 
 if __name__ == "__main__":
@@ -294,17 +714,12 @@ if __name__ == "__main__":
 
     r = _clastr_batch_query(batch_data, "Tanabe", False, 70)
 
-    with warnings.catch_warnings():  # read_excel throws noisy "UserWarning: Workbook contains no default style, apply openpyxl's default"
-        warnings.simplefilter("ignore")
-        with io.BytesIO(r.content) as fh:
-            for i in range(0, len(batch_data)):
-                df = pd.io.excel.read_excel(fh, sheet_name=i)
-                df = df.iloc[:, :-1]
-                print(df)
+    for name, df in r.items():
+        print(name)
+        print(df)
 
     with open("testing.xlsx", "wb") as fd:
-        for chunk in r.iter_content(chunk_size=128):
-            fd.write(chunk)
+        fd.write(_batch_sheets_to_xlsx(list(r.items())))
 
 
 #  JSON data structure:
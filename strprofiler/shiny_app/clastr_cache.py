@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from strprofiler.utils import _clean_element, _pentafix, _user_cache_dir
+
+# Keys of a CLASTR query that are search parameters rather than markers.
+CLASTR_PARAMS = (
+    "algorithm",
+    "scoringMode",
+    "scoreFilter",
+    "includeAmelogenin",
+    "minMarkers",
+    "maxResults",
+    "outputFormat",
+)
+
+DEFAULT_TTL = 30 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+
+
+def _query_key(query, release=None):
+    """
+    Hash a single CLASTR query on its normalized profile and search parameters.
+
+    Markers are reverted to CLASTR's Penta spelling, alleles are cleaned and sorted,
+    empty markers are dropped, and 'description' is ignored, so equivalent queries share a key.
+
+    :param query: query dictionary of markers and search parameters, as posted to CLASTR.
+    :type query: dict
+    :param release: Cellosaurus release to fold into the key, defaults to None
+    :type release: str, optional
+    :return: hex digest.
+    :rtype: str
+    """
+    profile = {k: v for k, v in query.items() if k not in CLASTR_PARAMS and k != "description"}
+    profile = _pentafix(profile, reverse=True)
+    profile = {k: _clean_element(str(v)) for k, v in profile.items()}
+    profile = {k: v for k, v in profile.items() if v != ""}
+    params = {k: query[k] for k in CLASTR_PARAMS if k in query}
+
+    payload = json.dumps([profile, params, release], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ClastrCache:
+    """
+    Persistent on-disk cache of CLASTR responses, backed by SQLite so it can be shared
+    between the CLI, the app, and multiple worker processes.
+
+    Entries are keyed by the normalized query profile, the search parameters, and the
+    most recent Cellosaurus release seen in a live response, so a new release naturally
+    invalidates older entries. Entries expire after ``ttl`` seconds, and the least recently
+    used entries are evicted once the cache grows past ``max_bytes``.
+
+    :param path: SQLite file to use, defaults to clastr_cache.sqlite in the user cache dir.
+    :type path: str or pathlib.Path, optional
+    :param ttl: Seconds before an entry expires, defaults to 30 days.
+    :type ttl: int, optional
+    :param max_bytes: Total size of cached values before LRU eviction kicks in, defaults to 256 MB.
+    :type max_bytes: int, optional
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = Path(path) if path is not None else _user_cache_dir() / "clastr_cache.sqlite"
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, value BLOB, size INTEGER, created REAL, accessed REAL)"
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            con.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    @property
+    def release(self):
+        """Most recent Cellosaurus release seen in a live response, or None."""
+        with self._connect() as con:
+            row = con.execute("SELECT value FROM meta WHERE name = 'release'").fetchone()
+        return row[0] if row else None
+
+    def set_release(self, release):
+        if release is None or release == self.release:
+            return
+        with self._connect() as con:
+            con.execute("INSERT OR REPLACE INTO meta VALUES ('release', ?)", (str(release),))
+
+    def key(self, query):
+        """
+        Build the cache key for a single CLASTR query.
+
+        :param query: query dictionary of markers and search parameters, as posted to CLASTR.
+        'description' is ignored.
+        :type query: dict
+        :return: hex digest.
+        :rtype: str
+        """
+        return _query_key(query, self.release)
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired."""
+        now = time.time()
+        with self._connect() as con:
+            row = con.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                con.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            con.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key, value):
+        """Store value (bytes) under key, evicting least recently used entries if over max_bytes."""
+        now = time.time()
+        with self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            con.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+
+            total = con.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                for old_key, size in con.execute(
+                    "SELECT key, size FROM entries ORDER BY accessed"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    con.execute("DELETE FROM entries WHERE key = ?", (old_key,))
+                    total -= size
+
+    def clear(self):
+        with self._connect() as con:
+            con.execute("DELETE FROM entries")
+
+    def __len__(self):
+        with self._connect() as con:
+            return con.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    """
+    Return the process-wide CLASTR cache, or None if disabled.
+    Set STRPROFILER_CLASTR_CACHE=0 to bypass it; STRPROFILER_CLASTR_CACHE_TTL (seconds) and
+    STRPROFILER_CLASTR_CACHE_SIZE (bytes) override the defaults.
+    """
+    global _cache
+    if os.environ.get("STRPROFILER_CLASTR_CACHE", "1").lower() in ("0", "false", "no", "off"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ClastrCache(
+                ttl=float(os.environ.get("STRPROFILER_CLASTR_CACHE_TTL", DEFAULT_TTL)),
+                max_bytes=int(os.environ.get("STRPROFILER_CLASTR_CACHE_SIZE", DEFAULT_MAX_BYTES)),
+            )
+    return _cache
@@ -2,43 +2,66 @@ import shinyswatch
 from shiny import App, reactive, render, ui, req
 from shiny.types import FileInfo, ImgData
 import pandas as pd
+import numpy as np
 from faicons import icon_svg
+import asyncio
 
 import strprofiler.utils as utils
-from strprofiler.shiny_app.calc_functions import _single_query, _batch_query, _file_query
-from strprofiler.shiny_app.clastr_api import _clastr_query, _clastr_batch_query
+from strprofiler.database import load_database, prune_databases
+from strprofiler.store import ProfileStore, is_store
+from strprofiler.shiny_app.calc_functions import (
+    _Scores,
+    _cached_score_database,
+    _single_query,
+    _filter_scores,
+    _batch_scores,
+    _file_scores,
+    _summarize_scores,
+    _live_query,
+)
+from strprofiler.scoring import IncrementalScorer
+from strprofiler.shiny_app.clastr_api import _clastr_query, _clastr_batch_query, _batch_sheets_to_xlsx
 
 from datetime import date
 import time
 import importlib.resources
 import importlib.metadata
-import io
-import warnings
+import tempfile
 
 version = "v" + importlib.metadata.version("strprofiler")
 
+# Downloads are sent in blocks of this size; larger workbooks spill from memory to a temp file.
+DOWNLOAD_CHUNK_BYTES = 1 << 16
+XLSX_SPOOL_BYTES = 16 << 20
+
 
 def database_load(file):
     """
-    Load a database from a file and return it as a dictionary.
+    Load a database from a file and return it as a read-only mapping of sample to profile.
+
+    A compiled copy of the database is cached by content hash, so reloading the same file
+    (worker start-up, reset) memory-maps it instead of parsing it again. SQLite reference
+    stores (.sqlite, .sqlite3, .db) are opened in place and searched through their index.
 
     Args:
         file (str): Path to the database file.
 
     Returns:
-        str_database: A dictionary of STR profiles in long format.
+        str_database: A mapping of STR profiles in long format.
 
     Raises:
         Exception: If the file fails to load or if sample ID names are duplicated.
     """
     try:
-        str_database = utils.str_ingress(
-            [file],  # expects list
+        if is_store(file):
+            return ProfileStore(file)
+        str_database = load_database(
+            file,
             sample_col="Sample",
             marker_col="Marker",
             sample_map=None,
             penta_fix=True,
-        ).to_dict(orient="index")
+        )
     except Exception as e:
         m = ui.modal(
             ui.HTML(
@@ -61,12 +84,62 @@ def database_load(file):
     return str_database
 
 
-def _highlight_non_matches(s):
+def _highlight_non_matches(df, markers):
     """
-    Highlight the cells that do not match the first row's value in their respective columns.
+    CSS for the marker cells that do not match the first (query) row's value in their respective columns.
+    Computed for a whole page in one vectorized comparison.
     """
-    is_match = s == s.iloc[0]
-    return ["text-align:center;background-color:#ec7a80" if not v else "text-align:center" for v in is_match]
+    values = df[markers].to_numpy()
+    css = np.where(values != values[:1], "text-align:center;background-color:#ec7a80", "text-align:center")
+    return pd.DataFrame(css, index=df.index, columns=markers)
+
+
+def _sort_key(col):
+    # Sort numerically where the column holds numbers (CLASTR scores arrive as strings).
+    numeric = pd.to_numeric(col, errors="coerce")
+    return numeric if numeric.notna().sum() == col.replace("", np.nan).notna().sum() else col.astype(str).str.lower()
+
+
+def _page_results(df, page=1, page_size=50, sort_by=None, descending=True, filter_text="", filter_cols=()):
+    """
+    Server-side paging of a results table. The query (first) row is pinned to the top of every page,
+    the remaining rows are filtered on ``filter_cols`` (case-insensitive substring) and optionally sorted.
+
+    :param df: Results table with the query as the first row.
+    :type df: pandas.DataFrame
+    :param page: 1-based page number, clamped to the available pages, defaults to 1
+    :type page: int, optional
+    :param page_size: Rows per page, excluding the query row, defaults to 50
+    :type page_size: int, optional
+    :param sort_by: Column to sort by, defaults to None (keep the existing order)
+    :type sort_by: str, optional
+    :param descending: Sort direction, defaults to True
+    :type descending: bool, optional
+    :param filter_text: Text to match, defaults to "" (no filter)
+    :type filter_text: str, optional
+    :param filter_cols: Columns searched by the filter, defaults to ()
+    :type filter_cols: iterable of str, optional
+    :return: The page, the number of matching rows, the number of pages and the page number shown.
+    :rtype: tuple(pandas.DataFrame, int, int, int)
+    """
+    query, rest = df.iloc[:1], df.iloc[1:]
+
+    filter_cols = [c for c in filter_cols if c in rest.columns]
+    if filter_text and filter_cols:
+        hit = np.zeros(len(rest), dtype=bool)
+        for c in filter_cols:
+            hit |= rest[c].astype(str).str.contains(filter_text, case=False, regex=False).to_numpy()
+        rest = rest[hit]
+
+    if sort_by in rest.columns:
+        rest = rest.sort_values(sort_by, ascending=not descending, kind="stable", na_position="last", key=_sort_key)
+
+    page_size = max(int(page_size), 1)
+    n_rows = len(rest)
+    n_pages = max(-(-n_rows // page_size), 1)
+    page = min(max(int(page or 1), 1), n_pages)
+
+    return pd.concat([query, rest.iloc[(page - 1) * page_size: page * page_size]]), n_rows, n_pages, page
 
 
 def _link_wrap(name, link, problem):
@@ -78,6 +151,21 @@ def _link_wrap(name, link, problem):
         return ui.tags.a(name, href=str(link), target="_blank")
 
 
+def _task_status(status):
+    """
+    Status line shown next to the results while a CLASTR lookup runs in the background.
+    """
+    if status == "running":
+        return ui.p(
+            ui.tags.span({"class": "spinner-border spinner-border-sm", "role": "status"}),
+            " Querying Cellosaurus (CLASTR)...",
+            style="margin-top:0.5rem",
+        )
+    if status == "cancelled":
+        return ui.p("CLASTR query cancelled. Search again to resubmit.", style="margin-top:0.5rem")
+    return None
+
+
 def notify_modal(marker_list):
     ui.modal_show(
         ui.modal(
@@ -187,6 +275,12 @@ def create_app(db=None):
                                     ),
                                     "Include Amelogenin in similarity scoring"
                                 ),
+                                ui.tooltip(
+                                    ui.input_switch(
+                                        "live_search", "Live Search", value=False
+                                    ),
+                                    "Update STRprofiler Database results as markers are edited, without clicking Search"
+                                ),
                                 ui.row(
                                     ui.column(
                                         6,
@@ -295,8 +389,23 @@ def create_app(db=None):
                 ui.card(
                     ui.row(
                         ui.column(3, ui.tags.h3("Results")),
-                        ui.column(1, ui.p("")),
+                        ui.column(9, ui.output_ui("clastr_status")),
                     ),
+                    ui.row(
+                        ui.column(
+                            3, ui.input_text("result_filter", "Filter Results", placeholder="Sample, accession or name")
+                        ),
+                        ui.column(3, ui.input_select("result_sort", "Sort By", {"": "Score (default)"})),
+                        ui.column(2, ui.input_switch("result_sort_desc", "Descending", value=True)),
+                        ui.column(
+                            2,
+                            ui.input_select(
+                                "result_page_size", "Rows per Page", ["25", "50", "100", "250"], selected="50"
+                            ),
+                        ),
+                        ui.column(2, ui.input_numeric("result_page", "Page", 1, min=1)),
+                    ),
+                    ui.output_text("result_page_info"),
                     ui.column(
                         12,
                         {"id": "res_card"},
@@ -328,6 +437,15 @@ def create_app(db=None):
                                             ),
                                             "Include Amelogenin in similarity scoring"
                                         ),
+                                        ui.panel_conditional(
+                                            "input.search_type_batch !== 'Cellosaurus Database (CLASTR)'",
+                                            ui.tooltip(
+                                                ui.input_switch(
+                                                    "gzip_batch", "Gzip Download", value=False
+                                                ),
+                                                "Compress the CSV download, for large batches"
+                                            ),
+                                        ),
                                     ),
                                     ui.panel_conditional(
                                         "input.search_type_batch === 'STRprofiler Database' | input.search_type_batch === 'Within File Query'",
@@ -434,7 +552,7 @@ def create_app(db=None):
                             ui.panel_main(
                                 ui.row(
                                     ui.column(3, ui.tags.h3("Results")),
-                                    ui.column(6, ui.p("")),
+                                    ui.column(6, ui.output_ui("clastr_batch_status")),
                                 ),
                                 ui.column(
                                     12,
@@ -547,7 +665,65 @@ def create_app(db=None):
         output_df = reactive.value(None)
         demo_vals = reactive.value(None)
         demo_name = reactive.value(None)
-        markers = reactive.value([i for i in list(init_db[next(iter(init_db))].keys()) if not any([e for e in ["Center", "Passage"] if e in i])])
+        # Marker columns (all but Center/Passage), read without touching the profiles.
+        markers = reactive.value(list(init_db.markers))
+
+        # CLASTR lookups run as extended tasks so a slow API call does not block this
+        # session (or others served by the same process). The blocking client, with its
+        # cache, request coalescing and rate limiting, runs in a worker thread.
+        @ui.bind_task_button(button_id="search")
+        @reactive.extended_task
+        async def clastr_task(query, query_filter, score_amel, threshold):
+            return await asyncio.to_thread(_clastr_query, query, query_filter, score_amel, threshold)
+
+        @ui.bind_task_button(button_id="csv_query")
+        @reactive.extended_task
+        async def clastr_batch_task(query, query_filter, score_amel, threshold):
+            return await asyncio.to_thread(_clastr_batch_query, query, query_filter, score_amel, threshold)
+
+        def _resolve(results, task):
+            # A CLASTR search hands back its task; read the result once it has finished.
+            # While running, result() keeps dependent outputs in their progress state.
+            if results is task:
+                return task.result()
+            return results
+
+        @render.ui
+        def clastr_status():
+            return _task_status(clastr_task.status())
+
+        @render.ui
+        def clastr_batch_status():
+            return _task_status(clastr_batch_task.status())
+
+        # Editing the query abandons any CLASTR lookup still in flight for the old one.
+        @reactive.effect
+        def _():
+            [input[m]() for m in markers()]
+            with reactive.isolate():
+                if clastr_task.status() == "running":
+                    clastr_task.cancel()
+
+        @reactive.effect
+        @reactive.event(input.file1)
+        def _():
+            if clastr_batch_task.status() == "running":
+                clastr_batch_task.cancel()
+
+        def _swap_database(db):
+            # Compiled databases are memory-mapped and shared by all workers. Release this
+            # session's hold on a replaced custom database so its compiled copy can be pruned.
+            previous = str_database()
+            str_database.set(db)
+            if previous is not init_db and previous is not db:
+                previous.close()
+
+        def _release_database():
+            with reactive.isolate():
+                if str_database() is not init_db:
+                    str_database().close()
+
+        session.on_ended(_release_database)
 
         @output
         @render.text
@@ -599,9 +775,9 @@ def create_app(db=None):
         @reactive.event(input.reset_db)
         def _():
             file_check.set(not file_check())
-            str_database.set(init_db)
+            _swap_database(init_db)
             db_name.set(init_db_name)
-            markers.set([i for i in list(str_database()[next(iter(str_database()))].keys()) if not any([e for e in ["Center", "Passage"] if e in i])])
+            markers.set(list(str_database().markers))
             ui.remove_ui("#inserted-downloader")
             res_click.set(0)
 
@@ -622,8 +798,10 @@ def create_app(db=None):
                 file: list[FileInfo] | None = req(input.database_upload())
             else:
                 return
-            str_database.set(database_load(file[0]["datapath"]))
-            markers.set([i for i in list(str_database()[next(iter(str_database()))].keys()) if not any([e for e in ["Center", "Passage"] if e in i])])
+            _swap_database(database_load(file[0]["datapath"]))
+            # Drop compiled copies of custom databases no worker has used for a while.
+            prune_databases(keep=[init_db.digest])
+            markers.set(list(str_database().markers))
             [ui.update_text(marker, value="") for marker in markers()]
             db_file_change.set(True)
             ui.remove_ui("#inserted-downloader")
@@ -738,58 +916,90 @@ def create_app(db=None):
                 ui.remove_ui("#inserted-downloader")
                 res_click.set(0)
                 return None
-            if res_click() == 0:
-                ui.insert_ui(
-                    ui.div(
-                        {"id": "inserted-downloader"},
-                        ui.download_button(
-                            "download", "Download CSV", width="25%", class_="btn-primary"
-                        ),
-                    ),
-                    selector="#res_card",
-                    where="afterEnd",
-                )
-                res_click.set(1)
+            _show_download()
 
             # isolate input.search_type to prevent trigger when options change.
             with reactive.isolate():
                 if input.search_type() == "STRprofiler Database":
-                    results = _single_query(
-                                    query,
-                                    str_database(),
-                                    input.score_amel_query(),
-                                    input.mix_threshold_query(),
-                                    input.query_filter(),
-                                    input.query_filter_threshold(),
-                                )
+                    # Scores depend only on the query, database and use of Amelogenin; repeat
+                    # queries from any session are served from the process-wide score cache.
+                    db = str_database()
+                    results = _Scores(query, _cached_score_database(query, db, input.score_amel_query()), db)
                 elif input.search_type() == "Cellosaurus Database (CLASTR)":
 
                     malformed_markers = utils.validate_api_markers(query.keys())
                     if malformed_markers:
                         notify_modal(malformed_markers)
 
-                    results = _clastr_query(
-                                    query,
-                                    input.query_filter(),
-                                    input.score_amel_query(),
-                                    input.query_filter_threshold()
-                                )
-                    # TO DO: Does this need to be async?
+                    clastr_task(
+                        query,
+                        input.query_filter(),
+                        input.score_amel_query(),
+                        input.query_filter_threshold()
+                    )
+                    results = clastr_task
 
             return results
 
+        # Results are paged, sorted and filtered server-side; only the visible page is
+        # styled and sent to the browser, however many rows pass the threshold.
+        @reactive.calc
+        def result_page():
+            results = query_results()
+            if results is None:
+                return None
+            # isolate input.search_type to prevent trigger when options change.
+            with reactive.isolate():
+                clastr = input.search_type() == "Cellosaurus Database (CLASTR)"
+            if clastr and (("No CLASTR Result" in results.columns) | ("Error" in results.columns)):
+                return results, 0, 1, 1
+            return _page_results(
+                results,
+                page=input.result_page(),
+                page_size=input.result_page_size(),
+                sort_by=input.result_sort() or None,
+                descending=input.result_sort_desc(),
+                filter_text=input.result_filter(),
+                filter_cols=["accession", "name"] if clastr else ["Sample"],
+            )
+
+        # New results get fresh sort options.
+        @reactive.effect
+        def _():
+            results = query_results()
+            choices = {"": "Score (default)"}
+            if results is not None:
+                labels = {"accession": "Accession", "name": "Name", "score": "Score"}
+                hidden = set(markers()) | {"accession_link", "species", "problem", "No CLASTR Result", "Error"}
+                choices.update({c: labels.get(c, c) for c in results.columns if c not in hidden})
+            with reactive.isolate():
+                selected = input.result_sort() if input.result_sort() in choices else ""
+            ui.update_select("result_sort", choices=choices, selected=selected)
+
+        @render.text
+        def result_page_info():
+            if result_page() is None:
+                return ""
+            page_df, n_rows, n_pages, page = result_page()
+            shown = len(page_df) - 1
+            first = (page - 1) * int(input.result_page_size()) + 1 if shown > 0 else 0
+            last = first + shown - 1 if shown > 0 else 0
+            return f"Showing {first}-{last} of {n_rows} matches (page {page} of {n_pages})"
+
         @output
         @render.table
         def out_result():
-            output_df.set(output_results())
-            if output_df() is not None:
+            output_df.set(query_results())
+            if result_page() is not None:
+                out_df = result_page()[0].copy()
                 # isolate input.search_type to prevent trigger when options change.
                 with reactive.isolate():
                     if input.search_type() == "STRprofiler Database":
-                        out_df = output_df().copy()
+                        highlight = [m for m in markers() if m in out_df.columns]
+                        css = _highlight_non_matches(out_df, highlight)
                         out_df = out_df.style.set_table_attributes(
                             'class="dataframe shiny-table table w-auto"'
-                        ).hide(axis="index").apply(_highlight_non_matches, subset=markers(), axis=0).format(
+                        ).hide(axis="index").apply(lambda _: css, axis=None, subset=highlight).format(
                             {
                                 "Shared Markers": "{0:0.0f}",
                                 "Shared Alleles": "{0:0.0f}",
@@ -800,7 +1010,6 @@ def create_app(db=None):
                             na_rep=""
                         )
                     elif input.search_type() == "Cellosaurus Database (CLASTR)":
-                        out_df = output_df().copy()
                         if ("No CLASTR Result" in out_df.columns) | ("Error" in out_df.columns):
                             return out_df
                         try:
@@ -816,16 +1025,93 @@ def create_app(db=None):
                         cols = [cols[-1]] + cols[:-1]
 
                         out_df = out_df[cols]
+                        highlight = [m for m in markers() if m in out_df.columns]
+                        css = _highlight_non_matches(out_df, highlight)
                         out_df = out_df.style.set_table_attributes(
                             'class="dataframe shiny-table table w-auto"'
-                        ).hide(axis="index").apply(_highlight_non_matches, subset=markers(), axis=0)
+                        ).hide(axis="index").apply(lambda _: css, axis=None, subset=highlight)
             else:
                 out_df = pd.DataFrame({"No input provided.": []})
             return out_df
         # TO DO: Remove results table when changing query methods.
 
+        def _show_download():
+            with reactive.isolate():
+                if res_click() == 0:
+                    ui.insert_ui(
+                        ui.div(
+                            {"id": "inserted-downloader"},
+                            ui.download_button(
+                                "download", "Download CSV", width="25%", class_="btn-primary"
+                            ),
+                        ),
+                        selector="#res_card",
+                        where="afterEnd",
+                    )
+                    res_click.set(1)
+
+        # Live search keeps one incremental scorer per session; each edit rescores only
+        # the markers that changed rather than the whole query.
+        live = {}
+
+        @reactive.calc
+        def live_results():
+            query = {m: input[m]() for m in markers()}
+            if not any(query.values()):
+                return None
+            req(input.query_filter_threshold() is not None, input.mix_threshold_query() is not None)
+            _show_download()
+
+            if isinstance(str_database(), ProfileStore):
+                # Stores are not held as arrays; each edit searches the store's index instead.
+                return _single_query(
+                    query,
+                    str_database(),
+                    input.score_amel_query(),
+                    input.mix_threshold_query(),
+                    input.query_filter(),
+                    input.query_filter_threshold(),
+                )
+            scorer = live.get("scorer")
+            if scorer is None or scorer.database is not str_database() or scorer.use_amel != input.score_amel_query():
+                scorer = live["scorer"] = IncrementalScorer(str_database(), use_amel=input.score_amel_query())
+            return _live_query(
+                scorer,
+                query,
+                input.mix_threshold_query(),
+                input.query_filter(),
+                input.query_filter_threshold(),
+            )
+
+        @reactive.calc
+        def query_results():
+            if input.live_search():
+                if input.search_type() == "STRprofiler Database":
+                    return live_results()
+            results = _resolve(output_results(), clastr_task)
+            if isinstance(results, _Scores):
+                # Score type and threshold changes re-filter the cached scores, without a new search.
+                req(input.query_filter_threshold() is not None, input.mix_threshold_query() is not None)
+                return _filter_scores(
+                    results.scores,
+                    results.query,
+                    input.mix_threshold_query(),
+                    input.query_filter(),
+                    input.query_filter_threshold(),
+                    results.database,
+                )
+            return results
+
+        # Any change of view goes back to the first page. Registered after query_results is defined.
+        @reactive.effect
+        @reactive.event(
+            query_results, input.result_filter, input.result_sort, input.result_sort_desc, input.result_page_size
+        )
+        def _():
+            ui.update_numeric("result_page", value=1)
+
         # Dealing with downloading results, when requested.
-        # Note that output_results() is a reactive Calc result.
+        # Note that query_results() is a reactive Calc result.
         @render.download(
             filename="STR_Query_Results_"
             + date.today().isoformat()
@@ -834,8 +1120,9 @@ def create_app(db=None):
             + ".csv"
         )
         def download():
-            if output_results() is not None:
-                yield output_results().to_csv(index=False)
+            if query_results() is not None:
+                # Streamed from the cached results in blocks of rows.
+                yield from utils._csv_chunks(query_results())
 
         ################
         # CSV BATCH SECTION
@@ -847,7 +1134,7 @@ def create_app(db=None):
         @output
         @render.data_frame
         def out_batch_df():
-            output_df.set(batch_query_results())
+            output_df.set(batch_results())
             if input.search_type_batch() == "STRprofiler Database" or input.search_type_batch() == "Within File Query":
                 try:
                     return render.DataTable(output_df())
@@ -855,13 +1142,12 @@ def create_app(db=None):
                     notify_modal_malformed_input()
                     return render.DataTable(pd.DataFrame({"Failed Query. Fix Input File": []}))
             elif input.search_type_batch() == "Cellosaurus Database (CLASTR)":
-                with warnings.catch_warnings():
-                    # read_excel throws noisy "UserWarning: Workbook contains no default style, apply openpyxl's default"
-                    warnings.simplefilter("ignore")
-                    with io.BytesIO(output_df().content) as fh:
-                        df = pd.io.excel.read_excel(fh, sheet_name=input.selected_results())
-                        df = df.iloc[:, :-1]
-                return render.DataTable(df)
+                if isinstance(output_df(), pd.DataFrame):
+                    return render.DataTable(output_df())
+                # Batch results are parsed once into per-sample tables, so switching samples is a lookup.
+                return render.DataTable(
+                    output_df().get(input.selected_results(), pd.DataFrame({"No CLASTR Result": []}))
+                )
 
         # File input loading
         @reactive.calc
@@ -921,15 +1207,7 @@ def create_app(db=None):
                         notify_modal_malformed_input(non_overlap_markers)
                         return pd.DataFrame({"Failed Query. Fix Input File": []})
 
-                    results = _batch_query(
-                        query_df,
-                        str_database(),
-                        input.score_amel_batch(),
-                        input.mix_threshold_batch(),
-                        input.tan_threshold_batch(),
-                        input.mas_q_threshold_batch(),
-                        input.mas_r_threshold_batch(),
-                    )
+                    results = _Scores(query_df, _batch_scores(query_df, str_database(), input.score_amel_batch()))
 
                 elif input.search_type_batch() == "Cellosaurus Database (CLASTR)":
                     clastr_query = [(lambda d: d.update(description=key) or d)(val) for (key, val) in query_df.items()]
@@ -937,13 +1215,13 @@ def create_app(db=None):
                     if malformed_markers:
                         notify_modal(malformed_markers)
 
-                    results = _clastr_batch_query(
-                                    clastr_query,
-                                    input.batch_query_filter(),
-                                    input.score_amel_batch(),
-                                    input.batch_query_filter_threshold()
-                                )
-                    # TO DO: Does this need to be async?
+                    clastr_batch_task(
+                        clastr_query,
+                        input.batch_query_filter(),
+                        input.score_amel_batch(),
+                        input.batch_query_filter_threshold()
+                    )
+                    results = clastr_batch_task
 
                     ui.insert_ui(
                         ui.div(
@@ -958,20 +1236,37 @@ def create_app(db=None):
                         where="beforeBegin",
                     )
                     # add results selector. With picklist populated by sample name,
-                    # backend selector is 0..n for excel page selection from API return
+                    # used as the key into the per-sample result tables.
 
                 elif input.search_type_batch() == "Within File Query":
-                    results = _file_query(
-                                query_df,
-                                input.score_amel_batch(),
-                                input.mix_threshold_batch(),
-                                input.tan_threshold_batch(),
-                                input.mas_q_threshold_batch(),
-                                input.mas_r_threshold_batch(),
-                            )
+                    results = _Scores(query_df, _file_scores(query_df, input.score_amel_batch()))
 
             return results
 
+        @reactive.calc
+        def batch_results():
+            results = _resolve(batch_query_results(), clastr_batch_task)
+            if isinstance(results, _Scores):
+                if not isinstance(results.scores, dict):
+                    # Scoring failed; pass the error on as before.
+                    return results.scores
+                # Threshold changes re-summarise the cached scores, without re-running the batch.
+                req(all(x is not None for x in [
+                    input.mix_threshold_batch(),
+                    input.tan_threshold_batch(),
+                    input.mas_q_threshold_batch(),
+                    input.mas_r_threshold_batch(),
+                ]))
+                return _summarize_scores(
+                    results.scores,
+                    results.query,
+                    input.mix_threshold_batch(),
+                    input.tan_threshold_batch(),
+                    input.mas_q_threshold_batch(),
+                    input.mas_r_threshold_batch(),
+                )
+            return results
+
         # File input loading
         @reactive.effect
         @reactive.event(input.search_type_batch)
@@ -981,19 +1276,30 @@ def create_app(db=None):
             # TO DO: Remove batch results table when changing methods.
 
         # Dealing with dowloading results, when requested.
-        # Note that batch_query_results() is a reactive Calc result.
-        @render.download(
-            filename=lambda: "STR_Batch_Results_" + date.today().isoformat() + "_" + time.strftime("%Hh-%Mm", time.localtime()) + ".csv"
-            if f"{input.search_type_batch()}" == 'STRprofiler Database' or f"{input.search_type_batch()}" == 'Within File Query'
-            else "STR_Batch_Results_" + date.today().isoformat() + "_" + time.strftime("%Hh-%Mm", time.localtime()) + ".xlsx"
-        )
+        # Note that batch_results() is a reactive Calc result, resolved once any CLASTR task finishes.
+        def _batch_filename():
+            stem = "STR_Batch_Results_" + date.today().isoformat() + "_" + time.strftime("%Hh-%Mm", time.localtime())
+            if input.search_type_batch() == "Cellosaurus Database (CLASTR)":
+                return stem + ".xlsx"
+            return stem + (".csv.gz" if input.gzip_batch() else ".csv")
+
+        @render.download(filename=_batch_filename)
         def download2():
-            if batch_query_results() is not None:
+            results = batch_results()
+            if results is not None:
                 if input.search_type_batch() == "STRprofiler Database" or input.search_type_batch() == "Within File Query":
-                    yield batch_query_results().to_csv(index=False)
+                    # Streamed from the cached results in blocks of rows, optionally gzipped.
+                    chunks = utils._csv_chunks(results)
+                    yield from utils._gzip_chunks(chunks) if input.gzip_batch() else chunks
                 if input.search_type_batch() == "Cellosaurus Database (CLASTR)":
-                    for chunk in batch_query_results().iter_content(chunk_size=128):
-                        yield chunk
+                    if isinstance(results, pd.DataFrame):
+                        yield from utils._csv_chunks(results)
+                    else:
+                        # The workbook is only built when a download is requested, then sent in blocks.
+                        with tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_BYTES) as fh:
+                            _batch_sheets_to_xlsx(list(results.items()), fh)
+                            fh.seek(0)
+                            yield from iter(lambda: fh.read(DOWNLOAD_CHUNK_BYTES), b"")
 
         # Dealing with passing example file to user.
         @render.download()
@@ -0,0 +1,624 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import rich_click as click
+
+import strprofiler.utils as utils
+from strprofiler.database import _database_key
+from strprofiler.profiles import ProfileSet, _is_meta
+from strprofiler.scoring import PreparedQuery, score_profiles
+
+# Bump when the schema changes; stores of other versions must be rebuilt.
+STORE_VERSION = 2
+
+# File suffixes recognized as reference stores rather than database files.
+STORE_SUFFIXES = (".sqlite", ".sqlite3", ".db")
+
+# Profiles are fetched by id in batches of this many (SQLite's default bound-parameter limit is 999).
+_FETCH_BATCH = 900
+
+# Writers wait this long (seconds) for another writer to finish before failing.
+_WRITE_TIMEOUT = 60
+
+# Removals compact the store once this fraction of its pages is free.
+COMPACT_FREE_FRACTION = 0.25
+
+# Ids are never reused (AUTOINCREMENT), so an id held in a results table never names another profile.
+_SCHEMA = """
+CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE samples (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE, profile TEXT NOT NULL);
+CREATE TABLE alleles (marker TEXT NOT NULL, allele TEXT NOT NULL, sample_id INTEGER NOT NULL);
+"""
+
+# Built after the bulk insert, which is much faster than maintaining it row by row.
+_INDEXES = """
+CREATE INDEX alleles_token ON alleles (marker, allele, sample_id);
+"""
+
+
+def is_store(path):
+    """Whether a database path names a SQLite reference store, by its suffix."""
+    return Path(path).suffix.lower() in STORE_SUFFIXES
+
+
+def _tokens(columns, markers, values):
+    """``(marker, allele)`` rows of one profile, each distinct allele of each non-empty marker once."""
+    out = []
+    for c, v in zip(columns, values):
+        if c in markers and v != "":
+            out.extend((c, a) for a in dict.fromkeys(v.split(",")))
+    return out
+
+
+def _profile_rows(df, columns):
+    """``samples`` and ``(marker, allele)`` rows of a frame of profiles, laid out over ``columns``."""
+    markers = {c for c in columns if not _is_meta(c)}
+    values = df.reindex(columns=columns).fillna("").astype(str).values.tolist()
+    samples = [(str(s), json.dumps(v)) for s, v in zip(df.index, values)]
+    return samples, [_tokens(columns, markers, v) for v in values]
+
+
+def _chain_digest(digest, change):
+    """Digest of a store after a change, so caches keyed on the old digest are never hit again."""
+    return hashlib.sha256(json.dumps([digest, change], default=str).encode()).hexdigest()
+
+
+def build_store(paths, path, **ingress_kwargs):
+    """
+    Imports STR database file(s) into a new SQLite reference store, replacing any store at ``path``.
+
+    Each profile is stored whole (for fetching) and as one ``(marker, allele, sample)`` row per allele,
+    indexed by ``(marker, allele)`` for candidate selection.
+
+    :param paths: STR database files in csv, xlsx, tsv, or txt format.
+    :type paths: list
+    :param path: Store file to write.
+    :type path: pathlib.Path
+    :param ingress_kwargs: Options passed to ``str_ingress``.
+    :return: Path of the store.
+    :rtype: pathlib.Path
+    """
+    ingress_kwargs = {
+        "sample_col": "Sample", "marker_col": "Marker", "sample_map": None, "penta_fix": True, **ingress_kwargs
+    }
+    path = Path(path)
+    df = utils.str_ingress(paths, **ingress_kwargs)
+    columns = [str(c) for c in df.columns]
+
+    digest = hashlib.sha256()
+    for p in paths:
+        digest.update(_database_key(p, **ingress_kwargs).encode())
+    digest.update(str(STORE_VERSION).encode())
+
+    # Build beside the target and rename into place, so readers never see a partial store.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, scratch = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=path.suffix)
+    os.close(fd)
+    try:
+        con = sqlite3.connect(scratch)
+        with con:
+            con.executescript(_SCHEMA)
+            con.executemany("INSERT INTO info VALUES (?, ?)", [
+                ("version", str(STORE_VERSION)), ("columns", json.dumps(columns)), ("digest", digest.hexdigest()),
+                ("generation", "0"),
+            ])
+            samples, tokens = _profile_rows(df, columns)
+            con.executemany("INSERT INTO samples VALUES (?, ?, ?)", ((i, *r) for i, r in enumerate(samples)))
+            con.executemany(
+                "INSERT INTO alleles VALUES (?, ?, ?)", ((m, a, i) for i, t in enumerate(tokens) for m, a in t)
+            )
+            con.executescript(_INDEXES)
+        # Updates are appended to the write-ahead log, which readers see without blocking the writer.
+        con.execute("PRAGMA journal_mode=WAL")
+        con.close()
+        os.replace(scratch, path)
+    finally:
+        if os.path.exists(scratch):
+            os.remove(scratch)
+    return path
+
+
+def _connect_writer(path):
+    """Read-write connection to an existing store, for one update."""
+    if not Path(path).is_file():
+        raise ValueError(f"{path} is not a reference store.")
+    con = sqlite3.connect(path, timeout=_WRITE_TIMEOUT, isolation_level=None)
+    info = dict(con.execute("SELECT key, value FROM info"))
+    if info.get("version") != str(STORE_VERSION):
+        con.close()
+        raise ValueError(f"{path} is a reference store of version {info.get('version')}; rebuild it.")
+    con.execute("PRAGMA journal_mode=WAL")
+    return con
+
+
+def _update(con, change):
+    """Records a change in the store's info: its digest and generation. Called inside the change's transaction."""
+    info = dict(con.execute("SELECT key, value FROM info"))
+    con.executemany("INSERT OR REPLACE INTO info VALUES (?, ?)", [
+        ("digest", _chain_digest(info["digest"], change)), ("generation", str(int(info.get("generation", 0)) + 1)),
+    ])
+
+
+def add_profiles(path, profiles, replace=False):
+    """
+    Adds profiles to a reference store in place, updating its allele index and digest in one transaction.
+    Open stores, e.g. those of running app workers, see the new profiles on their next search.
+
+    :param path: Store file.
+    :type path: pathlib.Path
+    :param profiles: pd.df of profiles as from ``str_ingress``, or a ``{sample: {column: alleles}}`` dictionary.
+        Columns new to the store are added, empty for the profiles already in it.
+    :type profiles: pd.DataFrame or dict
+    :param replace: Whether profiles replace stored profiles of the same name, defaults to False
+    :type replace: bool, optional
+    :raises ValueError: If a profile's name is already in the store and ``replace`` is not set.
+    :return: Number of profiles added.
+    :rtype: int
+    """
+    df = pd.DataFrame.from_dict(profiles, orient="index") if isinstance(profiles, Mapping) else profiles
+    names = [str(s) for s in df.index]
+    if len(set(names)) < len(names):
+        raise ValueError("Profiles to add have duplicate sample names.")
+
+    con = _connect_writer(path)
+    try:
+        # Taken up front, so concurrent writers queue rather than fail mid-transaction.
+        con.execute("BEGIN IMMEDIATE")
+        columns = json.loads(dict(con.execute("SELECT key, value FROM info"))["columns"])
+        columns += [str(c) for c in df.columns if str(c) not in columns]
+        existing = _ids(con, names)
+        if existing and not replace:
+            con.execute("ROLLBACK")
+            raise ValueError(f"Sample(s) already in the store: {', '.join(existing)}")
+        _delete(con, list(existing.values()))
+
+        samples, tokens = _profile_rows(df, columns)
+        # Past the largest id ever used, including those of removed profiles.
+        start = con.execute(
+            "SELECT COALESCE(MAX(seq) + 1, 0) FROM sqlite_sequence WHERE name = 'samples'"
+        ).fetchone()[0]
+        con.executemany("INSERT INTO samples VALUES (?, ?, ?)", ((start + i, *r) for i, r in enumerate(samples)))
+        con.executemany(
+            "INSERT INTO alleles VALUES (?, ?, ?)",
+            ((m, a, start + i) for i, t in enumerate(tokens) for m, a in t),
+        )
+        con.execute("UPDATE info SET value = ? WHERE key = 'columns'", (json.dumps(columns),))
+        _update(con, ["add", samples])
+        con.execute("COMMIT")
+    finally:
+        con.close()
+    return len(samples)
+
+
+def remove_profiles(path, samples):
+    """
+    Removes profiles from a reference store in place, updating its allele index and digest in one transaction.
+    The store is compacted once enough of it is free space.
+
+    :param path: Store file.
+    :type path: pathlib.Path
+    :param samples: Names of the profiles to remove.
+    :type samples: list
+    :raises KeyError: If a sample is not in the store; nothing is removed.
+    :return: Number of profiles removed.
+    :rtype: int
+    """
+    samples = list(dict.fromkeys(str(s) for s in samples))
+    con = _connect_writer(path)
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        ids = _ids(con, samples)
+        missing = [s for s in samples if s not in ids]
+        if missing:
+            con.execute("ROLLBACK")
+            raise KeyError(f"Sample(s) not in the store: {', '.join(missing)}")
+        _delete(con, list(ids.values()))
+        _update(con, ["remove", samples])
+        con.execute("COMMIT")
+
+        free, total = (con.execute(f"PRAGMA {p}").fetchone()[0] for p in ("freelist_count", "page_count"))
+    finally:
+        con.close()
+    if total and free / total >= COMPACT_FREE_FRACTION:
+        compact_store(path)
+    return len(ids)
+
+
+def compact_store(path):
+    """
+    Merges a store's write-ahead log of updates into the main file and reclaims the space of removed profiles.
+    Runs automatically as stores change; open stores keep working throughout.
+
+    :param path: Store file.
+    :type path: pathlib.Path
+    """
+    con = _connect_writer(path)
+    try:
+        con.execute("VACUUM")
+        con.execute("ANALYZE")
+        con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        con.close()
+
+
+def _ids(con, samples):
+    """``{sample: id}`` of the named samples in the store."""
+    out = {}
+    for start in range(0, len(samples), _FETCH_BATCH):
+        batch = samples[start:start + _FETCH_BATCH]
+        sql = f"SELECT name, id FROM samples WHERE name IN ({','.join('?' * len(batch))})"
+        out.update(con.execute(sql, batch).fetchall())
+    return out
+
+
+def _delete(con, ids):
+    """Deletes profiles, and their index rows through the index, by id."""
+    columns = json.loads(dict(con.execute("SELECT key, value FROM info"))["columns"])
+    markers = {c for c in columns if not _is_meta(c)}
+    for start in range(0, len(ids), _FETCH_BATCH):
+        batch = ids[start:start + _FETCH_BATCH]
+        marks = ",".join("?" * len(batch))
+        rows = con.execute(f"SELECT id, profile FROM samples WHERE id IN ({marks})", batch).fetchall()
+        con.executemany(
+            "DELETE FROM alleles WHERE marker = ? AND allele = ? AND sample_id = ?",
+            ((m, a, i) for i, profile in rows for m, a in _tokens(columns, markers, json.loads(profile))),
+        )
+        con.execute(f"DELETE FROM samples WHERE id IN ({marks})", batch)
+
+
+class ProfileStore(Mapping):
+    """
+    Read-only view of a SQLite reference store written by :func:`build_store`, for reference sets larger than
+    memory. Behaves like the ``{sample: {column: alleles}}`` mapping of a database, fetching profiles on demand.
+
+    Searches select candidate references in SQL, by how many (marker, allele) pairs they share with the query,
+    and score only those exactly. References sharing no alleles with a query score 0 (or not at all), so with
+    the default ``min_shared=1`` no reference scoring above 0 is missed.
+
+    Updates from :func:`add_profiles` and :func:`remove_profiles`, or a rebuild in place, are seen from the next
+    read on, without reopening the store.
+
+    :param path: Store file.
+    :type path: pathlib.Path
+    :raises ValueError: If the file is not a reference store of the current version.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        # One connection shared by the app's threads; SQLite calls on it are serialized.
+        self._lock = threading.RLock()
+        self._con = None
+        with self._lock:
+            self._open()
+
+    def _open(self):
+        if self._con is not None:
+            self._con.close()
+        try:
+            self._inode = os.stat(self.path).st_ino
+            self._con = sqlite3.connect(
+                f"{self.path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False, isolation_level=None
+            )
+            self._data_version = None
+            self._sync()
+        except (OSError, sqlite3.Error) as e:
+            raise ValueError(f"{self.path} is not a reference store: {e}")
+
+    def _sync(self):
+        """
+        Re-reads the store's info if another process changed it since it was last read: updated in place, or
+        rebuilt and replaced. Cheap when nothing changed, so done before every read outside a snapshot.
+        """
+        if self._con.in_transaction:
+            return
+        try:
+            inode = os.stat(self.path).st_ino
+        except OSError:
+            # Removed; the open file keeps serving.
+            inode = self._inode
+        if inode != self._inode:
+            self._open()
+            return
+        data_version = self._con.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._read_info(data_version)
+
+    def _read_info(self, data_version):
+        info = dict(self._con.execute("SELECT key, value FROM info"))
+        if info.get("version") != str(STORE_VERSION):
+            raise ValueError(f"{self.path} is a reference store of version {info.get('version')}; rebuild it.")
+        self._data_version = data_version
+        self._columns = json.loads(info["columns"])
+        self._meta_columns = [c for c in self._columns if _is_meta(c)]
+        self._markers = [c for c in self._columns if c not in self._meta_columns]
+        self._digest = info["digest"]
+        self._generation = int(info.get("generation", 0))
+
+    @contextmanager
+    def _snapshot(self):
+        """
+        Holds one read transaction, so that every read within sees the store as of a single update, even as
+        other processes change it. Nested snapshots share the outer one.
+        """
+        with self._lock:
+            if self._con.in_transaction:
+                yield
+                return
+            self._sync()
+            self._con.execute("BEGIN")
+            try:
+                # The first read starts the snapshot; info is read within it to match.
+                self._read_info(self._con.execute("PRAGMA data_version").fetchone()[0])
+                yield
+            finally:
+                self._con.execute("COMMIT")
+
+    def _current(self, attribute):
+        with self._lock:
+            self._sync()
+            return getattr(self, attribute)
+
+    @property
+    def columns(self):
+        return self._current("_columns")
+
+    @property
+    def meta_columns(self):
+        return self._current("_meta_columns")
+
+    @property
+    def markers(self):
+        return self._current("_markers")
+
+    @property
+    def digest(self):
+        """Content hash of the store, changed by every update."""
+        return self._current("_digest")
+
+    @property
+    def generation(self):
+        """Number of updates since the store was built."""
+        return self._current("_generation")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            self._sync()
+            return self._con.execute(sql, params).fetchall()
+
+    def _profile(self, profile, columns):
+        """A stored profile's values over ``columns``; profiles stored before columns were added lack them."""
+        values = json.loads(profile)
+        return (values + [""] * len(columns))[:len(columns)]
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM samples")[0][0]
+
+    def __iter__(self):
+        # Names are read a batch at a time, so iterating never holds the whole store in memory.
+        last = -1
+        while True:
+            rows = self._query("SELECT id, name FROM samples WHERE id > ? ORDER BY id LIMIT ?", (last, _FETCH_BATCH))
+            yield from (name for _, name in rows)
+            if len(rows) < _FETCH_BATCH:
+                return
+            last = rows[-1][0]
+
+    def __getitem__(self, sample):
+        rows = self._query("SELECT profile FROM samples WHERE name = ?", (sample,))
+        if not rows:
+            raise KeyError(sample)
+        columns = self.columns
+        return dict(zip(columns, self._profile(rows[0][0], columns)))
+
+    def __repr__(self):
+        return f"<ProfileStore {self.path}: {len(self)} samples, {len(self.markers)} markers>"
+
+    def frame(self, ids, missing_ok=False):
+        """
+        Fetches profiles by id as a pd.df with a ``Sample`` column, indexed by id.
+
+        :param ids: Profile ids.
+        :type ids: array-like
+        :param missing_ok: Whether to skip ids no longer in the store, e.g. removed since they were found,
+            rather than fail, defaults to False
+        :type missing_ok: bool, optional
+        :raises KeyError: If an id is not in the store and ``missing_ok`` is not set.
+        :return: The profiles, in the order of ``ids``.
+        :rtype: pd.DataFrame
+        """
+        ids = [int(i) for i in np.asarray(ids).reshape(-1)]
+        with self._snapshot():
+            fetched = {}
+            for start in range(0, len(ids), _FETCH_BATCH):
+                batch = ids[start:start + _FETCH_BATCH]
+                sql = f"SELECT id, name, profile FROM samples WHERE id IN ({','.join('?' * len(batch))})"
+                fetched.update((i, (name, profile)) for i, name, profile in self._query(sql, batch))
+            columns = self._columns
+        missing = [i for i in ids if i not in fetched]
+        if missing and not missing_ok:
+            raise KeyError(missing[0])
+        ids = [i for i in ids if i in fetched]
+        df = pd.DataFrame(
+            [self._profile(fetched[i][1], columns) for i in ids], index=ids, columns=columns, dtype=object
+        )
+        df.insert(0, "Sample", [fetched[i][0] for i in ids])
+        return df
+
+    def take(self, ids, meta_columns=None):
+        """
+        Fetches profiles by id.
+
+        :param ids: Profile ids.
+        :type ids: array-like
+        :param meta_columns: Columns held as metadata rather than scored, as for ``ProfileSet.from_frame``
+        :type meta_columns: list, optional
+        :raises KeyError: If an id is not in the store.
+        :return: The profiles, in the order of ``ids``.
+        :rtype: strprofiler.profiles.ProfileSet
+        """
+        return ProfileSet.from_frame(self.frame(ids).set_index("Sample"), meta_columns=meta_columns)
+
+    def candidates(self, query, use_amel=False, amel_col="AMEL", min_shared=1):
+        """
+        Ids of the profiles sharing at least ``min_shared`` (marker, allele) pairs with the query, found in SQL
+        through the ``(marker, allele)`` index.
+
+        :param query: Alleles for the query sample, or a PreparedQuery.
+        :type query: dict or PreparedQuery
+        :param use_amel: Whether amelogenin alleles count, defaults to False
+        :type use_amel: bool, optional
+        :param amel_col: Name of amelogenin marker, defaults to "AMEL"
+        :type amel_col: str, optional
+        :param min_shared: Minimum number of shared alleles, defaults to 1
+        :type min_shared: int, optional
+        :return: Sorted profile ids.
+        :rtype: numpy.ndarray
+        """
+        if not isinstance(query, PreparedQuery):
+            query = PreparedQuery(query, use_amel=use_amel, amel_col=amel_col)
+        markers = set(self.markers)
+        tokens = [(m, a) for m, alleles in query.alleles.items() if m in markers for a in sorted(alleles)]
+        if not tokens:
+            return np.zeros(0, dtype=np.int64)
+        sql = (
+            f"WITH q(marker, allele) AS (VALUES {','.join(['(?, ?)'] * len(tokens))}) "
+            "SELECT a.sample_id FROM q JOIN alleles a ON a.marker = q.marker AND a.allele = q.allele "
+            "GROUP BY a.sample_id HAVING COUNT(*) >= ? ORDER BY a.sample_id"
+        )
+        rows = self._query(sql, [v for t in tokens for v in t] + [min_shared])
+        return np.array([i for i, in rows], dtype=np.int64)
+
+    def search(self, query, use_amel=False, amel_col="AMEL", min_shared=1, meta_columns=None):
+        """
+        Scores a query against its candidate profiles, exactly as ``score_profiles`` would.
+
+        :param query: Alleles for the query sample, or a PreparedQuery (whose own Amelogenin settings then apply).
+        :type query: dict or PreparedQuery
+        :param use_amel: Whether to include amelogenin in scoring, defaults to False
+        :type use_amel: bool, optional
+        :param amel_col: Name of amelogenin marker, defaults to "AMEL"
+        :type amel_col: str, optional
+        :param min_shared: Minimum number of shared alleles for a candidate, defaults to 1
+        :type min_shared: int, optional
+        :param meta_columns: Columns of the candidates held as metadata rather than scored, defaults to Center/Passage
+        :type meta_columns: list, optional
+        :return: Candidate ids, the candidate profiles, and their ``SCORE_FIELDS`` arrays (plus ``valid``).
+        :rtype: tuple
+        """
+        if not isinstance(query, PreparedQuery):
+            query = PreparedQuery(query, use_amel=use_amel, amel_col=amel_col)
+        # Candidates are fetched from the store as it was when they were found.
+        with self._snapshot():
+            ids = self.candidates(query, min_shared=min_shared)
+            profiles = self.take(ids, meta_columns=meta_columns)
+        return ids, profiles, score_profiles(query, profiles)
+
+    def close(self):
+        """Closes the store's connection."""
+        with self._lock:
+            self._con.close()
+
+
+def _ingress_options(f):
+    """Adds the STR file options of ``build`` and ``add``."""
+    f = click.option(
+        "-pfix",
+        "--penta_fix",
+        help="""Whether to try to harmonize PentaE/D allele spelling.""",
+        default=True,
+        show_default=True,
+        type=bool,
+    )(f)
+    f = click.option(
+        "-mcol",
+        "--marker_col",
+        help="""Name of marker column in STR file(s).
+              Only used if format is 'wide'.""",
+        default="Marker",
+        show_default=True,
+        type=str,
+    )(f)
+    return click.option(
+        "-scol",
+        "--sample_col",
+        help="Name of sample column in STR file(s).",
+        default="Sample",
+        show_default=True,
+        type=str,
+    )(f)
+
+
+@click.group(name="db")
+@click.version_option()
+def db():
+    """Builds and maintains SQLite reference stores for databases larger than memory."""
+
+
+@db.command(name="build")
+@click.option(
+    "-o",
+    "--output",
+    required=True,
+    help="Path of the reference store to write, e.g. reference.sqlite.",
+    type=click.Path(),
+)
+@_ingress_options
+@click.argument("input_files", required=True, type=click.Path(exists=True), nargs=-1)
+def build(input_files, output, sample_col="Sample", marker_col="Marker", penta_fix=True):
+    """Imports STR database file(s) into a SQLite reference store."""
+    path = build_store(input_files, output, sample_col=sample_col, marker_col=marker_col, penta_fix=penta_fix)
+    store = ProfileStore(path)
+    print(f"Wrote {len(store)} profiles to {path}.")
+    store.close()
+
+
+@db.command(name="add")
+@click.option(
+    "-r",
+    "--replace",
+    help="Whether added profiles replace stored profiles of the same name, rather than failing.",
+    default=False,
+    show_default=True,
+    type=bool,
+)
+@_ingress_options
+@click.argument("store", required=True, type=click.Path(exists=True, dir_okay=False))
+@click.argument("input_files", required=True, type=click.Path(exists=True), nargs=-1)
+def add(store, input_files, replace=False, sample_col="Sample", marker_col="Marker", penta_fix=True):
+    """Adds the profiles of STR file(s) to a reference store, in place."""
+    df = utils.str_ingress(input_files, sample_col=sample_col, marker_col=marker_col, sample_map=None,
+                           penta_fix=penta_fix)
+    try:
+        n = add_profiles(store, df, replace=replace)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    print(f"Added {n} profiles to {store}.")
+
+
+@db.command(name="remove")
+@click.argument("store", required=True, type=click.Path(exists=True, dir_okay=False))
+@click.argument("samples", required=True, nargs=-1)
+def remove(store, samples):
+    """Removes the named samples from a reference store, in place."""
+    try:
+        n = remove_profiles(store, samples)
+    except KeyError as e:
+        raise click.ClickException(e.args[0])
+    print(f"Removed {n} profiles from {store}.")
+
+
+@db.command(name="compact")
+@click.argument("store", required=True, type=click.Path(exists=True, dir_okay=False))
+def compact(store):
+    """Merges pending updates into a reference store's main file and reclaims free space."""
+    compact_store(store)
+    print(f"Compacted {store}.")
@@ -2,12 +2,14 @@ import pandas as pd
 import rich_click as click
 from pathlib import Path
 from datetime import datetime
-from collections import OrderedDict
+import numpy as np
 from math import nan
 import sys
-from shiny import run_app
-from strprofiler.shiny_app.shiny_app import create_app
 import strprofiler.utils as utils
+from strprofiler.profiles import ProfileSet
+from strprofiler.scoring import PreparedQuery, score_profiles
+from strprofiler.lsh import MinHashIndex, approximate_scores
+from strprofiler.store import ProfileStore, is_store
 
 
 @click.command(name="compare")
@@ -54,7 +56,8 @@ import strprofiler.utils as utils
 @click.option(
     "-db",
     "--database",
-    help="Path to an STR database file in csv, xlsx, tsv, or txt format.",
+    help="""Path to an STR database file in csv, xlsx, tsv, or txt format, or a SQLite reference store
+              (.sqlite, .sqlite3, .db) from `strprofiler db build`.""",
     type=click.Path(exists=True),
 )
 @click.option(
@@ -98,6 +101,32 @@ import strprofiler.utils as utils
     show_default=True,
     type=bool,
 )
+@click.option(
+    "-lshb",
+    "--lsh_bands",
+    default=0,
+    help="""Number of MinHash LSH bands for approximate search; only candidate references are scored and
+              reported. More bands raise recall and cost. 0 for exact search of every reference.""",
+    show_default=True,
+    type=click.IntRange(min=0),
+)
+@click.option(
+    "-lshr",
+    "--lsh_rows",
+    default=4,
+    help="""MinHash values per LSH band for approximate search. More rows mean fewer, closer candidates.""",
+    show_default=True,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "-mins",
+    "--min_shared",
+    default=1,
+    help="""Minimum alleles a SQLite store reference must share with a sample to be scored and reported.
+              1 misses no reference scoring above 0.""",
+    show_default=True,
+    type=click.IntRange(min=1),
+)
 @click.option(
     "-o",
     "--output_dir",
@@ -122,6 +151,9 @@ def strprofiler(
     marker_col="Marker",
     penta_fix=True,
     score_amel=False,
+    lsh_bands=0,
+    lsh_rows=4,
+    min_shared=1,
 ):
     """STRprofiler compares STR profiles to each other."""
 
@@ -140,7 +172,10 @@ def strprofiler(
     print("Sample column: " + sample_col, file=log_file)
     print("Marker column: " + marker_col, file=log_file)
     print("Penta fix: " + str(penta_fix), file=log_file)
-    print("Use amelogenin for scoring: " + str(score_amel) + "\n", file=log_file)
+    print("Use amelogenin for scoring: " + str(score_amel), file=log_file)
+    print("LSH bands: " + str(lsh_bands) + " (exact search)" * (lsh_bands == 0), file=log_file)
+    print("LSH rows: " + str(lsh_rows), file=log_file)
+    print("Store minimum shared alleles: " + str(min_shared) + "\n", file=log_file)
     print("Full command:", file=log_file)
 
     print(" ".join(sys.argv) + "\n", file=log_file)
@@ -170,19 +205,37 @@ def strprofiler(
         log_file.close()
         return
 
+    store = None
+    if database is not None and is_store(database):
+        if lsh_bands:
+            print("LSH search is not available for SQLite reference stores, exiting.")
+            print("LSH search is not available for SQLite reference stores, exiting.", file=log_file)
+            log_file.close()
+            return
+        # Stores are searched through their allele index, fetching only each sample's candidates.
+        store = ProfileStore(database)
+
     # Database ingress, if present
     # Set 'reference' for subsequent query to either database or inputs all to all
-    if database is not None:
-        df_db = utils.str_ingress(
+    if store is not None:
+        reference_df = None
+    elif database is not None:
+        reference_df = utils.str_ingress(
             paths=[database],
             sample_col=sample_col,
             marker_col=marker_col,
             sample_map=None,
             penta_fix=penta_fix,
         )
-        reference_samps = df_db.to_dict(orient="index")
     else:
-        reference_samps = samps
+        reference_df = df
+    # score_query compares every column the profiles share, Center/Passage included, so all are encoded.
+    reference = None if store is not None else ProfileSet.from_frame(reference_df, meta_columns=[])
+    # Identical samples score identically, so each distinct profile is scored once.
+    scored = {}
+    index = None
+    if lsh_bands and store is None:
+        index = MinHashIndex(reference, bands=lsh_bands, rows=lsh_rows, use_amel=score_amel)
 
     # Iterate through samples and compare to each other.
     # comparing either to inputs to database or inputs all to all
@@ -205,24 +258,38 @@ def strprofiler(
         }
         q_out.update(q)
 
-        # Put query sample first.
-        samp_comps = [q_out]
-
-        for sa in reference_samps.keys():
-            if sa != s:
-                r = reference_samps[sa]
-                print("Comparing " + s + " to " + sa, file=log_file)
-                scores = utils.score_query(query=q, reference=r, use_amel=score_amel)
-
-                # Create dict of scores for each sample comparison.
-                samp_out = OrderedDict({"Sample": sa})
-                samp_out.update(scores)
-                samp_out.update(r)
+        # Score against every reference (or every LSH or store candidate) at once, then join in reference
+        # alleles column-wise.
+        query = PreparedQuery(q, use_amel=score_amel)
+        if query.key not in scored:
+            if store is not None:
+                _, candidates, scores = store.search(query, min_shared=min_shared, meta_columns=[])
+                scored[query.key] = candidates.samples, candidates.to_frame(), scores
+            elif index is None:
+                scored[query.key] = reference.samples, reference_df, score_profiles(query, reference)
+            else:
+                rows, scores = approximate_scores(query, index)
+                scored[query.key] = reference.samples[rows], reference_df.iloc[rows], scores
+        ref_samples, ref_alleles, scores = scored[query.key]
+        others = ref_samples != s
+        keep = ref_samples[others]
+        scores = {k: v[others] for k, v in scores.items()}
+        log_file.writelines("Comparing " + s + " to " + sa + "\n" for sa in keep.tolist())
+        if not scores["valid"].all():
+            sa = keep[~scores["valid"]][0]
+            raise ZeroDivisionError("No shared markers between " + s + " and " + sa + ".")
 
-                samp_comps.append(samp_out)
-
-        # Create DataFrame of scores for each sample comparison.
-        full_samp_out = pd.DataFrame(samp_comps)
+        # Put query sample first.
+        n = len(keep)
+        score_cols = {
+            "Sample": np.array([s] + keep.tolist(), dtype=object),
+            "mixed": np.array([mixed] + [nan] * n, dtype=object),
+            "query_sample": np.concatenate([[True], scores["query_sample"]]),
+        }
+        for k in list(q_out)[3:10]:
+            score_cols[k] = np.concatenate([[nan], scores[k].astype(float)])
+        alleles = pd.concat([pd.DataFrame([q]), ref_alleles.iloc[others].reset_index(drop=True)], ignore_index=True)
+        full_samp_out = pd.concat([pd.DataFrame(score_cols), alleles], axis=1)
         full_samp_out.sort_values(
             by="tanabe_score", ascending=False, inplace=True, na_position="first"
         )
@@ -258,6 +325,8 @@ def strprofiler(
         Path(output_dir, "full_summary.strprofiler." + dt_string + ".html"), "w"
     ).write(html_df)
 
+    if store is not None:
+        store.close()
     log_file.close()
 
 
@@ -271,5 +340,9 @@ def strprofiler(
 @click.version_option()
 def app(database=None):
     """STRprofiler shiny application for interactive comparisons & querying of STR profiles."""
+    # Imported here so the other subcommands do not load shiny and its dependencies.
+    from shiny import run_app
+    from strprofiler.shiny_app.shiny_app import create_app
+
     str_app = create_app(db=database)
     run_app(str_app)
@@ -3,6 +3,8 @@ import numpy as np
 from datetime import datetime
 from importlib.metadata import version
 import sys
+import os
+import zlib
 from pathlib import Path
 from collections import OrderedDict
 
@@ -35,6 +37,57 @@ def _clean_element(x):
     return ",".join(sorted_elements)
 
 
+def _user_cache_dir(*parts):
+    """
+    Returns (and creates) a directory under the user cache dir for strprofiler.
+    Honours STRPROFILER_CACHE_DIR, then XDG_CACHE_HOME, falling back to ~/.cache/strprofiler.
+    """
+    root = os.environ.get("STRPROFILER_CACHE_DIR")
+    if not root:
+        root = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache", "strprofiler")
+    path = Path(root, *parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+# Rows per block when streaming tables as CSV.
+CSV_CHUNK_ROWS = 10000
+
+
+def _csv_chunks(df, chunk_rows=CSV_CHUNK_ROWS, header=True, columns=None):
+    """
+    Yields a DataFrame as CSV text in blocks of rows, so large tables are never rendered to a single string.
+    The concatenated chunks equal ``df.to_csv(index=False)``.
+
+    :param df: Table to write.
+    :type df: pandas.DataFrame
+    :param chunk_rows: Rows per chunk, defaults to CSV_CHUNK_ROWS
+    :type chunk_rows: int, optional
+    :param header: Whether to emit the header line first, defaults to True
+    :type header: bool, optional
+    :param columns: Columns to write, reindexing (with blanks) if given, defaults to None
+    :type columns: list, optional
+    :return: Generator of CSV text chunks.
+    :rtype: generator
+    """
+    if columns is not None:
+        df = df.reindex(columns=columns)
+    if header:
+        yield df.iloc[:0].to_csv(index=False)
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=False)
+
+
+def _gzip_chunks(chunks, level=6):
+    """Gzip-compresses an iterable of text (or bytes) chunks, yielding compressed bytes as they fill."""
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = z.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield z.flush()
+
+
 def _pentafix(samps_dict, reverse=False):
     """Takes a dictionary of alleles and returns a dictionary with common Penta markers renamed for consistency."""
     if not reverse:
@@ -174,7 +227,7 @@ def _make_html(dataframe: pd.DataFrame):
 
 
 def str_ingress(
-    paths, sample_col="Sample", marker_col="Marker", sample_map=None, penta_fix=True
+    paths, sample_col="Sample", marker_col="Marker", sample_map=None, penta_fix=True, categorical=False
 ):
     """Reads in a list of paths and returns a pandas DataFrame of STR alleles in long format.
 
@@ -190,6 +243,9 @@ def str_ingress(
     :type sample_map: pandas.DataFrame, optional
     :param penta_fix: Whether to try to coerce "Penta" alleles to a common spelling, defaults to True
     :type penta_fix: bool, optional
+    :param categorical: Whether to return columns as category dtype, storing each distinct
+        allele string once, defaults to False
+    :type categorical: bool, optional
     :return: A pandas DataFrame of STR alleles in long format.
     :rtype: pandas.DataFrame
     """
@@ -279,6 +335,9 @@ def str_ingress(
     # Remove Nans.
     allele_df = allele_df.replace({np.nan: ""})
 
+    if categorical:
+        allele_df = allele_df.astype("category")
+
     return allele_df
 
 
@@ -0,0 +1,15 @@
+import asyncio
+from shiny import reactive
+from shiny._connection import MockConnection
+from shiny.session import Session, session_context
+from strprofiler.shiny_app.shiny_app import create_app
+
+
+def test_server_starts():
+
+    # Registers every reactive of a session, as a new browser connection would, then runs them once.
+    app = create_app()
+    session = Session(app, "test", MockConnection())
+    with session_context(session):
+        app.server(session.input, session.output, session)
+    asyncio.run(reactive.flush())
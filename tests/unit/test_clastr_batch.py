@@ -0,0 +1,188 @@
+import strprofiler.shiny_app.clastr_api as ca
+import strprofiler.shiny_app.clastr_cache as cc
+import pytest
+import pandas as pd
+import requests
+import json
+import threading
+
+
+@pytest.fixture(autouse=True)
+def limiter(monkeypatch):
+    # Keep the process-wide rate limit from slowing the tests down.
+    monkeypatch.setattr(ca, "_limiter", ca._TokenBucket(1000, 1000))
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b""):
+        self.status_code = status_code
+        self.content = content
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(str(self.status_code), response=self)
+
+
+def _xlsx(chunk):
+    sheets = [
+        (item["description"], pd.DataFrame({"Accession": ["CVCL_" + item["description"]], "Trailing": [""]}))
+        for item in chunk
+    ]
+    return ca._batch_sheets_to_xlsx(sheets)
+
+
+query = [{"description": "S" + str(i), "CSF1PO": "11,12", "outputFormat": "xlsx"} for i in range(7)]
+
+
+def test_batch_chunking(monkeypatch):
+    posted = []
+    lock = threading.Lock()
+    fails = {"S3": 1}
+
+    def fake_post(url, data=None, timeout=None):
+        chunk = json.loads(data)
+        with lock:
+            posted.append([item["description"] for item in chunk])
+            # First attempt at the chunk holding S3 fails with a transient error.
+            if any(fails.get(item["description"], 0) for item in chunk):
+                for item in chunk:
+                    fails.pop(item["description"], None)
+                return FakeResponse(503)
+        return FakeResponse(200, _xlsx(chunk))
+
+    monkeypatch.setattr(ca.requests, "post", fake_post)
+    monkeypatch.setattr(ca.time, "sleep", lambda s: None)
+
+    results = ca._clastr_batch_post(query, chunk_size=3, max_workers=2, retries=2)
+
+    # Chunks come back in input order, and only the failing chunk is retried.
+    assert [[item["description"] for item in chunk] for chunk, _ in results] == [
+        ["S0", "S1", "S2"], ["S3", "S4", "S5"], ["S6"]
+    ]
+    assert sorted(posted) == sorted([["S0", "S1", "S2"], ["S3", "S4", "S5"], ["S3", "S4", "S5"], ["S6"]])
+
+    sheets = [sheet for chunk, result in results for sheet in ca._chunk_sheets(chunk, result)[0]]
+    assert [name for name, _ in sheets] == ["S" + str(i) for i in range(7)]
+
+    tidy = ca._batch_sheets_to_tidy(sheets)
+    assert list(tidy["Query"]) == ["S" + str(i) for i in range(7)]
+    assert list(tidy["Accession"]) == ["CVCL_S" + str(i) for i in range(7)]
+
+
+def test_batch_chunk_failure(monkeypatch):
+    def fake_post(url, data=None, timeout=None):
+        chunk = json.loads(data)
+        if chunk[0]["description"] == "S0":
+            return FakeResponse(400)
+        return FakeResponse(200, _xlsx(chunk))
+
+    monkeypatch.setattr(ca.requests, "post", fake_post)
+    monkeypatch.setattr(ca.time, "sleep", lambda s: None)
+
+    sheets, failed = ca._clastr_batch_sheets(query, chunk_size=4, max_workers=4, retries=3, use_cache=False)
+    assert len(failed) == 1
+    assert isinstance(failed[0][1], requests.exceptions.HTTPError)
+
+    # Samples from the failed chunk are kept, in order, with the error recorded.
+    assert [name for name, _ in sheets] == ["S" + str(i) for i in range(7)]
+    assert list(sheets[0][1].columns) == ["Error"]
+    assert list(sheets[4][1]["Accession"]) == ["CVCL_S4"]
+
+
+def test_batch_sheets_matched_by_name(monkeypatch, tmp_path):
+    monkeypatch.setenv("STRPROFILER_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(cc, "_cache", None)
+
+    def fake_post(url, data=None, timeout=None):
+        chunk = json.loads(data)
+        # Sheets come back out of order, and the chunk holding S1 is missing a sheet.
+        if chunk[0]["description"] == "S0":
+            chunk = chunk[:-1]
+        return FakeResponse(200, _xlsx(chunk[::-1]))
+
+    monkeypatch.setattr(ca.requests, "post", fake_post)
+
+    # Distinct profiles, so each sample has its own cache entry.
+    distinct = [dict(item, CSF1PO=str(10 + i)) for i, item in enumerate(query)]
+    sheets, failed = ca._clastr_batch_sheets(distinct, chunk_size=3, max_workers=2, retries=0)
+    assert [name for name, _ in sheets] == ["S" + str(i) for i in range(7)]
+    # The short chunk fails as a whole; every other sample keeps its own result.
+    assert [[item["description"] for item in chunk] for chunk, _ in failed] == [["S0", "S1", "S2"]]
+    assert all(list(df.columns) == ["Error"] for _, df in sheets[:3])
+    assert [df["Accession"].item() for _, df in sheets[3:]] == ["CVCL_S" + str(i) for i in range(3, 7)]
+
+    # Only matched results are cached.
+    cache = cc._get_cache()
+    assert cache.get(cache.key(distinct[0])) is None
+    assert b"CVCL_S4" in cache.get(cache.key(distinct[4]))
+
+
+def test_batch_json(monkeypatch, tmp_path):
+    monkeypatch.setenv("STRPROFILER_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(cc, "_cache", None)
+    posted = []
+
+    def fake_post(url, data=None, timeout=None):
+        chunk = json.loads(data)
+        assert all(item["outputFormat"] == "json" for item in chunk)
+        posted.extend(item["description"] for item in chunk)
+        entries = [{
+            "description": item["description"],
+            "cellosaurusRelease": "48.0",
+            "results": [{
+                "accession": "CVCL_" + item["description"],
+                "name": item["description"],
+                "species": "Homo sapiens (Human)",
+                "bestScore": 90.0,
+                "profiles": [{"score": 90.0, "markers": [
+                    {"name": "CSF1PO", "alleles": [{"value": "11"}, {"value": "12"}]},
+                    {"name": "Penta D", "alleles": [{"value": "9"}]},
+                ]}],
+            }],
+        } for item in chunk]
+        return FakeResponse(200, json.dumps(entries).encode())
+
+    monkeypatch.setattr(ca.requests, "post", fake_post)
+
+    batch = [{"description": "S" + str(i), "CSF1PO": "11,12", "PentaD": "9"} for i in range(5)]
+    results = ca._clastr_batch_query([dict(item) for item in batch], "Tanabe", False, 80)
+
+    # Parsed once into per-sample tables, in input order, with the query sample first.
+    assert list(results) == ["S" + str(i) for i in range(5)]
+    assert list(results["S3"]["accession"]) == ["Query", "CVCL_S3"]
+    assert list(results["S3"]["PentaD"]) == ["9", "9"]
+
+    # Batch returns record the release, as single queries do; repeat submissions are served from the cache.
+    assert cc._get_cache().release == "48.0"
+    ca._clastr_batch_query([dict(item) for item in batch], "Tanabe", False, 80)
+    assert len(posted) == 5
+
+    xlsx = ca._batch_sheets_to_xlsx(list(results.items()))
+    assert [name for name, _ in ca._read_batch_sheets(xlsx)] == list(results)
+
+
+def test_sheet_names(monkeypatch):
+    long = "A" * 40
+    names = [long, long + "B", "x/y:z", "Plain"]
+    assert ca._sheet_names(names) == ["A" * 31, "A" * 27 + " (2)", "x_y_z", "Plain"]
+
+    # Samples whose names collide as sheet names keep their own sheets, in and out of the workbook.
+    batch = [{"description": name, "CSF1PO": str(10 + i), "outputFormat": "xlsx"} for i, name in enumerate(names)]
+
+    def fake_post(url, data=None, timeout=None):
+        return FakeResponse(200, _xlsx(json.loads(data)))
+
+    monkeypatch.setattr(ca.requests, "post", fake_post)
+    sheets, failed = ca._clastr_batch_sheets(batch, use_cache=False)
+    assert not failed
+    assert [(name, df["Accession"].item()) for name, df in sheets] == [(n, "CVCL_" + n) for n in names]
+    assert [df["Accession"].item() for _, df in ca._read_batch_sheets(ca._batch_sheets_to_xlsx(sheets))] == [
+        "CVCL_" + n for n in names
+    ]
+
+    # Sheets named otherwise are taken in order, as long as there is one per sample.
+    renamed = [dict(item, description="Other" + str(i)) for i, item in enumerate(batch)]
+    monkeypatch.setattr(ca.requests, "post", lambda *args, **kwargs: FakeResponse(200, _xlsx(renamed)))
+    sheets, failed = ca._clastr_batch_sheets(batch, use_cache=False)
+    assert not failed
+    assert [df["Accession"].item() for _, df in sheets] == ["CVCL_Other" + str(i) for i in range(4)]
@@ -0,0 +1,105 @@
+import strprofiler.shiny_app.clastr_api as ca
+import strprofiler.shiny_app.clastr_cache as cc
+import pytest
+import pandas as pd
+import json
+import time
+
+
+@pytest.fixture(autouse=True)
+def limiter(monkeypatch):
+    # Keep the process-wide rate limit from slowing the tests down.
+    monkeypatch.setattr(ca, "_limiter", ca._TokenBucket(1000, 1000))
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return json.loads(self.content)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("STRPROFILER_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(cc, "_cache", None)
+    return cc._get_cache()
+
+
+def test_cache_key(cache):
+    params = {"algorithm": 1, "includeAmelogenin": False, "scoreFilter": 80}
+    a = dict({"Amelogenin": "X, Y", "PentaD": "11,13", "TH01": "9.3,6.0", "vWA": ""}, **params)
+    b = dict({"Amelogenin": "Y,X", "Penta D": "13,11", "TH01": "6,9.3", "description": "b"}, **params)
+
+    # Normalized profiles share a key, different parameters do not.
+    assert cache.key(a) == cache.key(b)
+    assert cache.key(a) != cache.key(dict(a, algorithm=2))
+
+    # A new Cellosaurus release invalidates older entries.
+    old_key = cache.key(a)
+    cache.set_release("48.0")
+    assert cache.key(a) != old_key
+
+
+def test_cache_ttl_lru(tmp_path):
+    cache = cc.ClastrCache(tmp_path / "cache.sqlite", ttl=60, max_bytes=25)
+    cache.put("a", b"0123456789")
+    cache.put("b", b"0123456789")
+    assert cache.get("a") == b"0123456789"
+
+    # "b" is now least recently used and is evicted first.
+    cache.put("c", b"0123456789")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert len(cache) == 2
+
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.get("a") is None
+
+
+def test_clastr_query_cached(cache, monkeypatch):
+    posted = []
+
+    def fake_post(url, data=None, timeout=None):
+        posted.append(data)
+        return FakeResponse(json.dumps({"cellosaurusRelease": "48.0", "results": []}).encode())
+
+    monkeypatch.setattr(ca.requests, "post", fake_post)
+
+    for _ in range(2):
+        res = ca._clastr_query({"Amelogenin": "X", "TH01": "6,9"}, "Tanabe", False, 80)
+        assert list(res.columns) == ["No CLASTR Result"]
+    assert len(posted) == 1
+
+    ca._clastr_query({"Amelogenin": "X", "TH01": "6,9"}, "Tanabe", False, 80, use_cache=False)
+    assert len(posted) == 2
+
+
+def test_clastr_batch_cached(cache, monkeypatch):
+    posted = []
+
+    def fake_post(url, data=None, timeout=None):
+        chunk = json.loads(data)
+        posted.extend(item["description"] for item in chunk)
+        sheets = [(item["description"], pd.DataFrame({"Accession": ["CVCL_" + item["TH01"]]})) for item in chunk]
+        return FakeResponse(ca._batch_sheets_to_xlsx(sheets))
+
+    monkeypatch.setattr(ca.requests, "post", fake_post)
+
+    query = [{"description": "S" + str(i), "TH01": str(i), "algorithm": 1, "outputFormat": "xlsx"} for i in range(4)]
+    ca._clastr_batch_sheets(query[:2], chunk_size=1)
+    assert posted == ["S0", "S1"]
+
+    # Only uncached samples are submitted, and results come back in input order.
+    sheets, failed = ca._clastr_batch_sheets(query, chunk_size=1)
+    assert sorted(posted) == ["S0", "S1", "S2", "S3"]
+    assert not failed
+    assert [name for name, _ in sheets] == ["S0", "S1", "S2", "S3"]
+    assert [df["Accession"][0] for _, df in sheets] == ["CVCL_0", "CVCL_1", "CVCL_2", "CVCL_3"]
@@ -0,0 +1,105 @@
+import strprofiler.shiny_app.clastr_api as ca
+import pytest
+import requests
+import json
+import threading
+import time
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(str(self.status_code), response=self)
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def test_coalescing(monkeypatch):
+    monkeypatch.setattr(ca, "_limiter", ca._TokenBucket(1000, 1000))
+    posted = []
+    started = threading.Event()
+
+    def fake_post(url, data=None, timeout=None):
+        posted.append(data)
+        started.set()
+        time.sleep(0.2)
+        return FakeResponse(200, json.dumps({"results": []}).encode())
+
+    monkeypatch.setattr(ca.requests, "post", fake_post)
+
+    results = []
+
+    def run(query):
+        results.append(ca._clastr_query(query, "Tanabe", False, 80, use_cache=False))
+
+    # Equivalent profiles submitted concurrently share a single upstream request.
+    threads = [threading.Thread(target=run, args=({"Amelogenin": "X", "TH01": "6,9"},))]
+    threads[0].start()
+    started.wait()
+    threads += [
+        threading.Thread(target=run, args=({"Amelogenin": "X", "TH01": "9, 6"},)) for _ in range(4)
+    ]
+    for t in threads[1:]:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(posted) == 1
+    assert len(results) == 5
+    assert all(list(r.columns) == ["No CLASTR Result"] for r in results)
+
+    # Once finished, a new request goes upstream again.
+    run({"Amelogenin": "X", "TH01": "6,9"})
+    assert len(posted) == 2
+
+
+def test_token_bucket():
+    bucket = ca._TokenBucket(rate=20, capacity=2)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # Two tokens are available immediately, the remaining four arrive at 20/s.
+    assert time.monotonic() - start >= 0.18
+
+
+def test_rate_limited_retry(monkeypatch):
+    monkeypatch.setattr(ca, "_limiter", ca._TokenBucket(1000, 1000))
+    monkeypatch.setattr(ca.time, "sleep", lambda s: None)
+    responses = [FakeResponse(429, headers={"Retry-After": "1"}), FakeResponse(200, b"{}")]
+    monkeypatch.setattr(ca.requests, "post", lambda url, data=None, timeout=None: responses.pop(0))
+
+    r = ca._clastr_post(ca.CLASTR_BATCH_URL, [])
+    assert r.status_code == 200
+
+
+def test_unlimited_rate():
+    bucket = ca._TokenBucket(rate=0, capacity=1)
+    start = time.monotonic()
+    for _ in range(100):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.5
+    with pytest.raises(ValueError):
+        ca._TokenBucket(rate=-1, capacity=1)
+
+
+def test_rate_limit_not_retried_per_chunk(monkeypatch):
+    monkeypatch.setattr(ca, "_limiter", ca._TokenBucket(1000, 1000))
+    monkeypatch.setattr(ca.time, "sleep", lambda s: None)
+    posted = []
+
+    def fake_post(url, data=None, timeout=None):
+        posted.append(data)
+        return FakeResponse(429)
+
+    monkeypatch.setattr(ca.requests, "post", fake_post)
+
+    # A chunk still rate limited once _clastr_post gives up fails without further attempts.
+    with pytest.raises(requests.exceptions.HTTPError):
+        ca._post_batch_chunk([], retries=3)
+    assert len(posted) == ca.RATE_LIMIT_RETRIES + 1
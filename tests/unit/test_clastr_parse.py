@@ -0,0 +1,152 @@
+from strprofiler.shiny_app.clastr_api import _parse_clastr_results
+from strprofiler.utils import _pentafix
+import pytest
+import random
+import pandas as pd
+import numpy as np
+
+flatten_json = pytest.importorskip("flatten_json")
+
+MARKERS = ["Amelogenin", "CSF1PO", "D5S818", "D7S820", "D13S317", "D21S11", "FGA",
+           "Penta D", "Penta E", "TH01", "TPOX", "vWA"]
+QUERY_MARKERS = ["Amelogenin", "CSF1PO", "D5S818", "FGA", "PentaD", "PentaE", "TH01", "vWA"]
+
+
+def _legacy_parse(query, results):
+    """Previous flatten/melt/pivot implementation of the CLASTR result parser, kept as a reference."""
+    query_df = pd.DataFrame({k: [v] for k, v in query.items()})
+    query_df["accession"] = "Query"
+
+    df = pd.DataFrame([flatten_json.flatten(d) for d in results])
+
+    markers = df.filter(regex="^profiles_*_.*_value").T
+    markers[["A", "profileID", "C", "markerID", "E", "F", "G"]] = (
+        markers.index.str.split("_", n=7, expand=False).tolist()
+    )
+    markers.drop(["A", "C", "E", "F", "G"], axis=1, inplace=True)
+    melted_markers = pd.melt(markers, id_vars=["profileID", "markerID"], var_name="resultID", value_name="allele")
+
+    scores = df.filter(regex="^profiles_*_.*_score").T
+    scores[["A", "profileID", "C"]] = scores.index.str.split("_", n=3, expand=False).tolist()
+    scores.drop(["A", "C"], axis=1, inplace=True)
+    melted_scores = pd.melt(scores, id_vars=["profileID"], var_name="resultID", value_name="score").dropna()
+
+    allele_cat_markers = pd.concat([
+        melted_markers[["resultID", "profileID", "markerID"]],
+        melted_markers.groupby(["resultID", "profileID", "markerID"], as_index=True)
+        .transform(lambda x: ",".join(map(str, x)).replace(",nan", "").replace("nan", ""))
+    ], axis=1).drop_duplicates(subset=["resultID", "profileID", "markerID"])
+
+    marker_names = df.filter(regex="^profiles_*_.*_name").T
+    marker_names[["A", "profileID", "C", "markerID", "E"]] = (
+        marker_names.index.str.split("_", n=5, expand=False).tolist()
+    )
+    marker_names.drop(["A", "C", "E"], axis=1, inplace=True)
+    melted_markers = pd.melt(marker_names, id_vars=["profileID", "markerID"],
+                             var_name="resultID", value_name="markerName").dropna()
+    melted_markers = melted_markers.drop_duplicates(subset=["profileID", "markerID", "resultID"])
+
+    markers_names_alleles = pd.merge(allele_cat_markers, melted_markers, how="inner",
+                                     on=["profileID", "markerID", "resultID"])
+    pivot_markers_names_alleles = markers_names_alleles.pivot(index=["profileID", "resultID"],
+                                                              columns="markerName", values="allele")
+
+    try:
+        merged = pd.merge(df[["accession", "name", "species", "bestScore", "problem"]],
+                          pivot_markers_names_alleles, left_index=True, right_on="resultID")
+    except KeyError:
+        merged = pd.merge(df[["accession", "name", "species", "bestScore"]],
+                          pivot_markers_names_alleles, left_index=True, right_on="resultID")
+
+    merged["accession_link"] = "https://web.expasy.org/cellosaurus/" + merged["accession"]
+    merged = _pentafix(merged)
+    merged_scored = pd.merge(merged, melted_scores, left_on=["profileID", "resultID"],
+                             right_on=["profileID", "resultID"])
+
+    merged_scored["multi_group"] = merged_scored.groupby("accession")["accession"].transform("size") > 1
+    best = merged_scored["multi_group"] & (merged_scored["bestScore"] == merged_scored["score"])
+    merged_scored["new"] = np.where(best,
+                                    merged_scored["accession"] + " (Best)",
+                                    np.where(merged_scored["bestScore"] != merged_scored["score"],
+                                             merged_scored["accession"] + " (Worst)",
+                                             merged_scored["accession"]))
+    merged_scored["accession"] = merged_scored["new"]
+
+    query_added = pd.concat([query_df, merged_scored.drop(["new", "bestScore", "multi_group"], axis=1)])
+    query_added = query_added.reset_index(drop=True)
+    query_added["score"] = query_added["score"].map("{0:.2f}".format).replace("nan", "")
+
+    front = ["accession", "name", "species", "score", "accession_link"]
+    if "problem" in query_added.columns:
+        front.append("problem")
+    return query_added[front + [c for c in query_added if c not in front]].fillna("")
+
+
+def _allele(rng, marker):
+    if marker == "Amelogenin":
+        return rng.choice(["X", "Y"])
+    return str(rng.randint(5, 35)) + rng.choice(["", "", ".2", ".3"])
+
+
+def _random_results(rng):
+    results = []
+    for i, accession in enumerate(rng.sample(range(10000), rng.randint(1, 8))):
+        scores = sorted((round(rng.uniform(50, 100), 2) for _ in range(rng.choice([1, 1, 2]))), reverse=True)
+        if len(scores) == 2 and rng.random() < 0.2:
+            scores[1] = scores[0]
+
+        profiles = []
+        for score in scores:
+            markers = []
+            for k, marker in enumerate(rng.sample(MARKERS, rng.randint(1, len(MARKERS)))):
+                # Every profile has alleles for at least one marker.
+                n_alleles = rng.randint(1 if k == 0 else 0, 3)
+                markers.append({
+                    "name": marker,
+                    "conflicted": False,
+                    "searched": True,
+                    "sources": [],
+                    "alleles": [
+                        {"value": _allele(rng, marker), "matched": rng.random() < 0.5} for _ in range(n_alleles)
+                    ],
+                })
+            profiles.append({"score": score, "markerNumber": len(markers), "alleleNumber": 0, "markers": markers})
+
+        result = {
+            "accession": "CVCL_%04d" % accession,
+            "name": "Line" + str(i),
+            "species": "Homo sapiens (Human)",
+            "bestScore": scores[0],
+            "problematic": False,
+            "profiles": profiles,
+        }
+        if rng.random() < 0.3:
+            result["problematic"] = True
+            result["problem"] = "Problematic cell line: Contaminated."
+        results.append(result)
+    return results
+
+
+def _normalize(df):
+    # The old parser leaked its internal join keys and could emit empty marker columns
+    # depending on marker positions in other results; neither carries information.
+    df = df.drop(columns=[c for c in ["profileID", "resultID"] if c in df.columns])
+    keep = ["accession", "name", "species", "score", "accession_link", "problem"]
+    return df[[c for c in df.columns if c in keep or (df[c] != "").any()]].reset_index(drop=True)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_parse_matches_legacy(seed):
+    rng = random.Random(seed)
+    query = {m: ",".join(sorted({_allele(rng, m) for _ in range(rng.randint(0, 2))}))
+             for m in rng.sample(QUERY_MARKERS, 5)}
+    results = _random_results(rng)
+
+    expected = _normalize(_legacy_parse(dict(query), results))
+    parsed = _parse_clastr_results(dict(query), results)
+
+    pd.testing.assert_frame_equal(_normalize(parsed), expected, check_dtype=False)
+
+
+def test_parse_empty():
+    assert list(_parse_clastr_results({"TH01": "6,9"}, []).columns) == ["No CLASTR Result"]
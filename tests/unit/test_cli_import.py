@@ -0,0 +1,53 @@
+import subprocess
+import sys
+import time
+import pytest
+
+HEAVY = ["shiny", "shinyswatch", "faicons", "starlette", "jinja2", "requests"]
+
+
+def _run(code):
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+
+
+def _import_time(module, repeats=3):
+    # Best of a few cold interpreter starts, to damp scheduler noise.
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _run("import " + module)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+@pytest.mark.parametrize("command", ["compare", "clastr", "app"])
+def test_lazy_subcommands(command):
+
+    # Resolving a subcommand only imports what that subcommand needs.
+    out = _run(
+        "import sys, json\n"
+        "import rich_click as click\n"
+        "from strprofiler.cli import cli\n"
+        f"cmd = cli.get_command(click.Context(cli), {command!r})\n"
+        "print(cmd.name)\n"
+        f"print(json.dumps([m for m in {HEAVY!r} if m in sys.modules]))\n"
+    )
+    name, loaded = out.splitlines()
+    assert name == command
+
+    if command == "compare":
+        assert loaded == "[]"
+    elif command == "clastr":
+        assert "requests" in loaded and "shiny" not in loaded
+    else:
+        # shiny is only imported when the app actually launches.
+        assert "shiny" not in loaded
+
+
+def test_cli_import_time():
+
+    # Import-time benchmark: the CLI entry point must not pay for the shiny app.
+    cli_time = _import_time("strprofiler.cli")
+    app_time = _import_time("strprofiler.shiny_app.shiny_app")
+    print(f"strprofiler.cli: {cli_time * 1000:.0f} ms, shiny app: {app_time * 1000:.0f} ms")
+    assert cli_time < app_time
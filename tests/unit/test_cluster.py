@@ -0,0 +1,97 @@
+import strprofiler.utils as sp
+from strprofiler.profiles import ProfileSet
+from strprofiler.cluster import similarity_clusters
+import pandas as pd
+import pytest
+from pathlib import Path
+
+THIS_DIR = Path(__file__).parent
+
+app_database = Path(THIS_DIR / "../../strprofiler/shiny_app/www/main_database.csv")
+exp_database = Path(THIS_DIR / "../Example_app_database.csv")
+
+
+@pytest.fixture(scope="module")
+def frame():
+    df = sp.str_ingress([app_database], sample_col="Sample", marker_col="Marker", penta_fix=True).iloc[:200]
+    df.loc["Copy"] = df.iloc[11]
+    return df
+
+
+def _components(profiles, score, threshold, n_query):
+    # Brute force: score every pair with score_query, then flood-fill the graph.
+    as_dict = [{m: p[m] for m in profiles.markers} for p in profiles.values()]
+    fields = ["tanabe_score"] if score == "tanabe" else ["masters_query_score", "masters_ref_score"]
+    links = {i: set() for i in range(len(as_dict))}
+    for i in range(n_query):
+        for j in range(i + 1, len(as_dict)):
+            try:
+                scores = sp.score_query(as_dict[i], as_dict[j])
+            except ZeroDivisionError:
+                continue
+            if any(scores[f] >= threshold for f in fields):
+                links[i].add(j)
+                links[j].add(i)
+    seen, out = set(), []
+    for i in links:
+        if i in seen or not links[i]:
+            continue
+        stack, comp = [i], set()
+        while stack:
+            x = stack.pop()
+            if x not in comp:
+                comp.add(x)
+                stack.extend(links[x])
+        seen |= comp
+        out.append(comp)
+    return sorted(sorted(c) for c in out)
+
+
+@pytest.mark.parametrize("score,threshold", [("tanabe", 70), ("tanabe", 90), ("masters", 80)])
+@pytest.mark.parametrize("n_query", [None, 60])
+def test_matches_brute_force(frame, tmp_path, score, threshold, n_query):
+
+    profiles = ProfileSet.from_frame(frame)
+    edges_path = tmp_path / "edges.csv"
+    out = similarity_clusters(
+        profiles, score=score, threshold=threshold, n_query=n_query, block_size=37, edges_path=edges_path
+    )
+    expected = _components(profiles, score, threshold, n_query or len(profiles))
+    assert sorted(sorted(g["Row"]) for _, g in out.groupby("Cluster")) == expected
+
+    # Clusters are numbered largest first.
+    assert (out.groupby("Cluster")["Size"].first().diff().dropna() <= 0).all()
+    assert (out.groupby("Cluster").size() == out.groupby("Cluster")["Size"].first()).all()
+
+    # Only passing edges are written, each pair once.
+    edges = pd.read_csv(edges_path)
+    assert not edges.duplicated(["Sample A", "Sample B"]).any()
+    if score == "tanabe":
+        assert (edges["tanabe_score"] >= threshold).all()
+    else:
+        assert (edges[["masters_query_score", "masters_ref_score"]].max(axis=1) >= threshold).all()
+    if n_query is not None:
+        samples = set(profiles.samples[:n_query].tolist())
+        assert (edges["Sample A"].isin(samples) | edges["Sample B"].isin(samples)).all()
+
+
+def test_duplicates_cluster(frame):
+
+    out = similarity_clusters(ProfileSet.from_frame(frame), threshold=100)
+    copy = out.loc[out["Sample"] == "Copy", "Cluster"].item()
+    assert frame.index[11] in out.loc[out["Cluster"] == copy, "Sample"].tolist()
+
+
+def test_cli(tmp_path):
+
+    from strprofiler.cluster import cluster
+
+    cluster.callback(
+        input_files=[exp_database], database=app_database, output_dir=tmp_path, score="tanabe", threshold=80,
+        sample_col="Sample",
+    )
+    out = pd.read_csv(tmp_path / "clusters.strprofiler.csv")
+    assert list(out.columns) == ["Cluster", "Size", "Sample", "Source"]
+    # Every cluster is anchored by an input sample.
+    assert out.groupby("Cluster")["Source"].apply(lambda s: (s == "input").any()).all()
+    assert (tmp_path / "edges.strprofiler.csv").exists()
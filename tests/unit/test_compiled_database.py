@@ -0,0 +1,129 @@
+import strprofiler.utils as sp
+import strprofiler.database as spdb
+import numpy as np
+import pytest
+import shutil
+import subprocess
+import sys
+import os
+from pathlib import Path
+
+THIS_DIR = Path(__file__).parent
+
+app_database = Path(THIS_DIR / "../../strprofiler/shiny_app/www/main_database.csv")
+exp_database = Path(THIS_DIR / "../Example_app_database.csv")
+
+
+def _ingress(path):
+    return sp.str_ingress([path], sample_col="Sample", marker_col="Marker", sample_map=None, penta_fix=True)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("STRPROFILER_CACHE_DIR", str(tmp_path))
+    return tmp_path / "databases"
+
+
+@pytest.mark.parametrize("path", [app_database, exp_database])
+def test_roundtrip(path, cache):
+
+    # The encoded database decodes to exactly what str_ingress produces, in the same column order.
+    ref = _ingress(path).to_dict(orient="index")
+    db = spdb.load_database(path)
+
+    assert len(db) == len(ref)
+    assert list(db) == list(ref)
+    for s in ref:
+        assert db[s] == ref[s]
+        assert list(db[s]) == list(ref[s])
+    assert "Center" not in db.markers and "Passage" not in db.markers
+
+
+def test_cached_load(cache, monkeypatch):
+
+    first = spdb.load_database(app_database)
+    assert len(list(cache.iterdir())) == 1
+
+    # Later loads memory-map the compiled copy without parsing the file.
+    def _fail(*args, **kwargs):
+        raise AssertionError("database was parsed again")
+
+    monkeypatch.setattr(sp, "str_ingress", _fail)
+    second = spdb.load_database(app_database)
+
+    assert isinstance(second.codes.base, np.memmap)
+    assert not second.codes.flags.writeable
+    assert second.digest == first.digest
+    assert dict(second) == dict(first)
+
+
+def test_stale_and_corrupt(cache, tmp_path):
+
+    path = tmp_path / "db.csv"
+    shutil.copy(exp_database, path)
+    first = spdb.load_database(path)
+
+    # Editing the file changes its hash, so it is compiled afresh.
+    with open(path, "a") as f:
+        f.write("\nExtra_Sample,JAX,P1,X,10,11,9,18,\"13,15\"\n")
+    second = spdb.load_database(path)
+    assert second.digest != first.digest
+    assert "Extra_Sample" in second
+    assert dict(second) == _ingress(path).to_dict(orient="index")
+
+    # A corrupted compiled copy fails validation and is rebuilt.
+    target = cache / second.digest
+    codes = np.load(target / "codes.npy")
+    codes[0, 0, 0] += 1
+    np.save(target / "codes.npy", codes)
+    with pytest.raises(ValueError):
+        spdb.EncodedDatabase.load(target)
+    assert dict(spdb.load_database(path)) == _ingress(path).to_dict(orient="index")
+
+
+def test_no_cache(cache, monkeypatch):
+
+    monkeypatch.setenv("STRPROFILER_DB_CACHE", "0")
+    db = spdb.load_database(exp_database)
+    assert not cache.exists() or not any(cache.iterdir())
+    assert dict(db) == _ingress(exp_database).to_dict(orient="index")
+
+
+def test_workers_share_and_prune(cache, tmp_path):
+
+    path = tmp_path / "custom.csv"
+    shutil.copy(exp_database, path)
+    db = spdb.load_database(path)
+    target = cache / db.digest
+
+    # Every array a worker reads is a read-only map of the compiled files.
+    for a in spdb.ARRAYS:
+        assert isinstance(getattr(db, a).base, np.memmap)
+    assert db.index("Sample_B") == list(db).index("Sample_B")
+    assert "Sample_B" in db and "missing" not in db
+
+    # Another worker attaches to the same compiled copy and holds it while in use.
+    worker = subprocess.Popen(
+        [sys.executable, "-c",
+         "import sys, strprofiler.database as d; db = d.load_database(sys.argv[1]); "
+         "print(db.digest, flush=True); sys.stdin.read()",
+         str(path)],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=dict(os.environ),
+    )
+    try:
+        assert worker.stdout.readline().strip() == db.digest
+        db.close()
+        # Attached databases survive pruning regardless of age.
+        assert spdb.prune_databases(max_age=0) == 0
+        assert target.exists()
+    finally:
+        worker.communicate("")
+
+    # Once released everywhere, idle databases are pruned unless kept.
+    assert spdb.prune_databases(max_age=0, keep=[db.digest]) == 0
+    assert spdb.prune_databases(max_age=3600) == 0
+    assert spdb.prune_databases(max_age=0) == 1
+    assert not target.exists()
+
+    # A pruned database is transparently compiled again.
+    assert dict(spdb.load_database(path)) == _ingress(path).to_dict(orient="index")
@@ -0,0 +1,92 @@
+import strprofiler.shiny_app.calc_functions as cf
+import strprofiler.utils as sp
+from strprofiler.profiles import ProfileSet
+from strprofiler.scoring import PreparedQuery, profile_key, profile_hash
+import pandas as pd
+import pytest
+from pathlib import Path
+
+THIS_DIR = Path(__file__).parent
+
+app_database = Path(THIS_DIR / "../../strprofiler/shiny_app/www/main_database.csv")
+exp_database = Path(THIS_DIR / "../Example_app_database.csv")
+
+
+@pytest.fixture(scope="module")
+def database():
+    df = sp.str_ingress([app_database], sample_col="Sample", marker_col="Marker", penta_fix=True)
+    return df.to_dict(orient="index"), ProfileSet.from_frame(df)
+
+
+def test_profile_key():
+
+    a = PreparedQuery({"TH01": "9.3,6", "CSF1PO": "12", "FGA": "", "AMEL": "X"})
+    b = PreparedQuery({"CSF1PO": "12", "TH01": "6,9.3,6", "AMEL": "X,Y"})
+    assert a.key == b.key == "CSF1PO=12;TH01=6,9.3"
+    assert a.hash == b.hash == profile_hash(profile_key({"TH01": ["6", "9.3"], "CSF1PO": ["12"]}))
+
+    # Amelogenin counts only when scored.
+    assert PreparedQuery(a.query, use_amel=True).key != PreparedQuery(b.query, use_amel=True).key
+
+
+@pytest.mark.parametrize("use_amel", [False, True])
+def test_find_identical(database, use_amel):
+
+    as_dict, db = database
+    for sample in list(db)[::97]:
+        found = db.find_identical(as_dict[sample], use_amel=use_amel, amel_col="Amelogenin")
+        assert sample in found
+
+        # Exactly the profiles with the same alleles at every scored marker; each scores 100 against the query.
+        def scored(p):
+            return {m: set(v.split(",")) for m, v in p.items() if v and m in db.markers
+                    and (use_amel or m != "Amelogenin")}
+
+        expected = [o for o, r in as_dict.items() if scored(r) == scored(as_dict[sample])]
+        assert sorted(found) == sorted(expected)
+        for o in found:
+            scores = sp.score_query(as_dict[sample], as_dict[o], use_amel=use_amel, amel_col="Amelogenin")
+            assert scores["tanabe_score"] == scores["masters_query_score"] == scores["masters_ref_score"] == 100
+
+    query = dict(as_dict[db.samples[0]], TH01="999")
+    assert db.find_identical(query) == []
+
+
+def test_duplicate_queries_scored_once(database, monkeypatch):
+
+    as_dict, db = database
+    samples = list(as_dict)[:3]
+    queries = {"a": as_dict[samples[0]], "b": as_dict[samples[1]], "a_again": dict(as_dict[samples[0]]),
+               "c": as_dict[samples[2]]}
+    expected = cf._batch_scores(queries, db, False)
+
+    calls = []
+    score = cf.score_profiles
+    monkeypatch.setattr(cf, "score_profiles", lambda *a, **k: calls.append(a) or score(*a, **k))
+    scores = cf._batch_scores(queries, db, False)
+
+    assert len(calls) == 3
+    assert scores["a_again"]["Sample"].iloc[0] == "a_again"
+    assert scores["a"]["Sample"].iloc[0] == "a"
+    for s in queries:
+        pd.testing.assert_frame_equal(scores[s], expected[s])
+    pd.testing.assert_frame_equal(scores["a_again"].iloc[1:], scores["a"].iloc[1:])
+
+
+def test_duplicate_file_samples(monkeypatch):
+
+    queries = sp.str_ingress([exp_database]).to_dict(orient="index")
+    first = next(iter(queries))
+    queries["Copy"] = dict(queries[first])
+    expected = cf._file_scores(queries, False)
+
+    calls = []
+    score = cf.score_profiles
+    monkeypatch.setattr(cf, "score_profiles", lambda *a, **k: calls.append(a) or score(*a, **k))
+    scores = cf._file_scores(queries, False)
+
+    assert len(calls) == len(queries) - 1
+    for s in queries:
+        pd.testing.assert_frame_equal(scores[s], expected[s])
+    # Each copy is compared with the other, which matches it exactly.
+    assert scores["Copy"]["Sample"].iloc[1] == first and scores["Copy"]["tanabe_score"].iloc[1] == 100
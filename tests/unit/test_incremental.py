@@ -0,0 +1,62 @@
+import strprofiler.shiny_app.calc_functions as cf
+import strprofiler.utils as sp
+import strprofiler.database as spdb
+from strprofiler.scoring import IncrementalScorer, SCORE_FIELDS
+import pandas as pd
+import pytest
+import random
+from pathlib import Path
+
+THIS_DIR = Path(__file__).parent
+
+app_database = Path(THIS_DIR / "../../strprofiler/shiny_app/www/main_database.csv")
+
+
+@pytest.fixture(scope="module")
+def database(tmp_path_factory):
+    return spdb.load_database(app_database, cache_dir=tmp_path_factory.mktemp("databases"))
+
+
+@pytest.mark.parametrize("use_amel", [False, True])
+def test_matches_score_query(database, use_amel):
+
+    rng = random.Random(7)
+    samples = list(database)
+    scorer = IncrementalScorer(database, use_amel=use_amel)
+    query = {m: "" for m in database.markers}
+
+    # Edit a few markers at a time, including unseen and untrimmed alleles.
+    for _ in range(25):
+        for m in rng.sample(database.markers, 3):
+            query[m] = rng.choice(["", "12", "12, 13", "X,Y", "9.3,7", "999", database[rng.choice(samples)][m]])
+        changed = scorer.update(query)
+        assert len(changed) <= 3
+        scores = scorer.scores()
+
+        for i in rng.sample(range(len(database)), 100):
+            try:
+                expected = sp.score_query(query, database.row(i), use_amel=use_amel, amel_col="Amelogenin")
+            except ZeroDivisionError:
+                assert not scores["valid"][i]
+                continue
+            assert scores["valid"][i]
+            assert {k: scores[k][i] for k in SCORE_FIELDS} == expected
+
+
+@pytest.mark.parametrize("query_filter", ["Tanabe", "Masters Query", "Masters Reference"])
+def test_live_query(database, query_filter):
+
+    query = {m: database[list(database)[11]][m] for m in database.markers}
+    scorer = IncrementalScorer(database)
+
+    def _by_sample(df):
+        return df.sort_values("Sample").reset_index(drop=True)
+
+    for threshold in [0, 60]:
+        for edit in [{}, {"TH01": "6,9.3"}, {"TPOX": ""}]:
+            query.update(edit)
+            pd.testing.assert_frame_equal(
+                _by_sample(cf._live_query(scorer, query, 3, query_filter, threshold)),
+                _by_sample(cf._single_query(query, dict(database), False, 3, query_filter, threshold)),
+                check_dtype=False,
+            )
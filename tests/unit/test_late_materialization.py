@@ -0,0 +1,128 @@
+import strprofiler.shiny_app.calc_functions as cf
+import strprofiler.utils as sp
+import strprofiler.database as spdb
+from strprofiler.profiles import ProfileSet
+from strprofiler.scoring import SCORE_FIELDS
+import pandas as pd
+import pytest
+import random
+from collections import OrderedDict
+from math import nan
+from pathlib import Path
+
+THIS_DIR = Path(__file__).parent
+
+app_database = Path(THIS_DIR / "../../strprofiler/shiny_app/www/main_database.csv")
+
+
+def _legacy_single_query(query, str_database, use_amel, three_allele_threshold, query_filter, query_filter_threshold):
+    # The single query as it was before scores were computed as arrays: one full row per reference.
+    q_out = {
+        "Sample": "Query", "mixed": False, "query_sample": True,
+        "n_shared_markers": nan, "n_shared_alleles": nan, "n_query_alleles": nan, "n_reference_alleles": nan,
+        "tanabe_score": nan, "masters_query_score": nan, "masters_ref_score": nan, "Center": nan, "Passage": nan,
+    }
+    q_out.update(query)
+    samp_comps = [q_out]
+    for sa in str_database.keys():
+        r = str_database[sa]
+        try:
+            scores = sp.score_query(query=query, reference=r, use_amel=use_amel, amel_col="Amelogenin")
+        except ZeroDivisionError:
+            scores = dict.fromkeys(SCORE_FIELDS, False)
+        samp_out = OrderedDict({"Sample": sa})
+        samp_out.update(scores)
+        samp_out.update(r)
+        samp_comps.append(samp_out)
+    full_samp_out = pd.DataFrame(samp_comps)
+
+    query_filter_name = cf.SCORE_COLUMNS[query_filter]
+    drop_cols = [c for c in cf.SCORE_COLUMNS.values() if c != query_filter_name] + [
+        "query_sample", "n_query_alleles", "n_reference_alleles",
+    ]
+    full_samp_out.iloc[0, full_samp_out.columns.get_loc("mixed")] = sp.mixing_check(
+        alleles=query, three_allele_threshold=three_allele_threshold
+    )
+    full_samp_out.sort_values(by=query_filter_name, ascending=False, inplace=True, na_position="first")
+    full_samp_out = full_samp_out.round({"tanabe_score": 2, "masters_query_score": 2, "masters_ref_score": 2})
+    full_samp_out = full_samp_out[
+        (full_samp_out[query_filter_name] >= query_filter_threshold) | (full_samp_out.index == 0)
+    ]
+    full_samp_out.drop(columns=drop_cols, inplace=True)
+    return full_samp_out.rename(columns={
+        "mixed": "Mixed Sample", "n_shared_markers": "Shared Markers", "n_shared_alleles": "Shared Alleles",
+        "tanabe_score": "Tanabe Score", "masters_query_score": "Masters Query Score",
+        "masters_ref_score": "Masters Ref Score",
+    })
+
+
+@pytest.fixture(scope="module")
+def databases(tmp_path_factory):
+    df = sp.str_ingress([app_database], sample_col="Sample", marker_col="Marker", penta_fix=True)
+    # A profile sharing no markers with anything exercises the unscorable-reference rows.
+    df.loc["Empty"] = ""
+    db = ProfileSet.from_frame(df)
+    return df.to_dict(orient="index"), db
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_matches_legacy(databases, seed):
+
+    as_dict, as_profiles = databases
+    rng = random.Random(seed)
+    query = {m: as_dict[rng.choice(list(as_dict))][m] for m in as_profiles.markers}
+    for m in rng.sample(as_profiles.markers, 4):
+        query[m] = rng.choice(["", "12", "X,Y", "9.3,7", "999"])
+
+    use_amel = bool(seed % 2)
+    for query_filter in ["Tanabe", "Masters Query", "Masters Reference"]:
+        for threshold in [0, 50, 80]:
+            expected = _legacy_single_query(query, as_dict, use_amel, 3, query_filter, threshold)
+            pd.testing.assert_frame_equal(
+                cf._single_query(query, as_dict, use_amel, 3, query_filter, threshold), expected
+            )
+            pd.testing.assert_frame_equal(
+                cf._single_query(query, as_profiles, use_amel, 3, query_filter, threshold), expected
+            )
+
+
+def test_compiled_database(tmp_path):
+
+    db = spdb.load_database(app_database, cache_dir=tmp_path)
+    query = {m: db[list(db)[5]][m] for m in db.markers}
+    pd.testing.assert_frame_equal(
+        cf._single_query(query, db, False, 3, "Tanabe", 60),
+        _legacy_single_query(query, dict(db), False, 3, "Tanabe", 60),
+    )
+
+    # Scores are kept without allele columns; alleles are joined only for the returned rows.
+    scores = cf._score_database(query, db, False)
+    assert not set(db.columns) & set(scores.columns)
+
+
+def test_cli_compare(tmp_path):
+
+    from strprofiler.strprofiler import strprofiler as compare
+
+    exp_database = THIS_DIR / "../Example_app_database.csv"
+    compare.callback(
+        input_files=[exp_database], database=app_database, output_dir=tmp_path, sample_col="Sample",
+        sample_map=None, tan_threshold=80, mas_q_threshold=80, mas_r_threshold=80, mix_threshold=3,
+    )
+    queries = sp.str_ingress([exp_database]).to_dict(orient="index")
+    refs = sp.str_ingress([app_database]).to_dict(orient="index")
+
+    path = next(tmp_path.glob("Sample_A.strprofiler.*.csv"))
+    out = pd.read_csv(path)
+    text = pd.read_csv(path, dtype=str, keep_default_na=False)
+    assert out["Sample"].iloc[0] == "Sample_A" and out["query_sample"].iloc[0]
+    assert len(out) == len(refs) + 1
+    assert (out["tanabe_score"].iloc[1:].diff().dropna() <= 0).all()
+
+    # Every row carries its scores (as score_query computes them, over all shared columns) and its alleles.
+    fields = [k for k in SCORE_FIELDS if k != "query_sample"]
+    for i in random.Random(0).sample(range(1, len(out)), 50):
+        sample = out["Sample"].iloc[i]
+        expected = sp.score_query(queries["Sample_A"], refs[sample])
+        assert out.loc[i, fields].tolist() == pytest.approx([expected[k] for k in fields])
+        assert text.loc[i, list(refs[sample])].to_dict() == refs[sample]
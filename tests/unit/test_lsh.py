@@ -0,0 +1,73 @@
+import strprofiler.utils as sp
+from strprofiler.profiles import ProfileSet
+from strprofiler.scoring import score_profiles
+from strprofiler.lsh import MinHashIndex, approximate_scores, benchmark
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+
+THIS_DIR = Path(__file__).parent
+
+app_database = Path(THIS_DIR / "../../strprofiler/shiny_app/www/main_database.csv")
+
+
+@pytest.fixture(scope="module")
+def database():
+    df = sp.str_ingress([app_database], sample_col="Sample", marker_col="Marker", penta_fix=True)
+    return df, ProfileSet.from_frame(df)
+
+
+def test_candidates_rescored_exactly(database):
+
+    df, db = database
+    index = MinHashIndex(db, bands=32, rows=4, amel_col="Amelogenin")
+    for i in range(0, len(db), 101):
+        query = {m: df.iloc[i][m] for m in db.markers}
+        rows, scores = approximate_scores(query, index)
+
+        # A profile always collides with itself, and with its duplicates.
+        assert i in rows
+        identical = db.find_identical(query, amel_col="Amelogenin")
+        assert set(identical) <= set(db.samples[rows].tolist())
+
+        exact = score_profiles(query, db, amel_col="Amelogenin")
+        for k in exact:
+            np.testing.assert_array_equal(scores[k], exact[k][rows])
+
+    # Unknown markers and alleles are still tokens of the query.
+    assert len(index.candidates({"NotAMarker": "1", "TH01": "999"})) < len(db)
+
+
+def test_recall_tradeoff():
+
+    results = benchmark(n_profiles=3000, n_queries=20, settings=((4, 8), (32, 4), (64, 2)))
+    lsh = results[results["mode"] == "lsh"]
+    assert (lsh["recall"].diff().dropna() >= 0).all() and lsh["recall"].iloc[-1] > 0.9
+    assert (lsh["candidates"].diff().dropna() > 0).all()
+    assert (lsh["candidates"] < 3000).all()
+
+
+def test_cli_compare(database, tmp_path):
+
+    from strprofiler.strprofiler import strprofiler as compare
+
+    # Queries are database profiles with a marker changed.
+    df, _ = database
+    queries = df.iloc[[3, 300, 900]].copy()
+    queries.index = ["Sample_A", "Sample_B", "Sample_C"]
+    queries["TH01"] = "7"
+    queries.to_csv(tmp_path / "queries.csv", index_label="Sample")
+    kwargs = dict(
+        input_files=[tmp_path / "queries.csv"], database=app_database, sample_col="Sample", sample_map=None,
+        tan_threshold=80, mas_q_threshold=80, mas_r_threshold=80, mix_threshold=3,
+    )
+    compare.callback(output_dir=tmp_path / "exact", **kwargs)
+    compare.callback(output_dir=tmp_path / "lsh", lsh_bands=32, lsh_rows=4, **kwargs)
+
+    exact = pd.read_csv(next((tmp_path / "exact").glob("Sample_A.strprofiler.*.csv"))).set_index("Sample")
+    approx = pd.read_csv(next((tmp_path / "lsh").glob("Sample_A.strprofiler.*.csv"))).set_index("Sample")
+    # Only candidates are reported, with their exact scores; the top matches are among them.
+    assert len(approx) < len(exact)
+    pd.testing.assert_frame_equal(approx, exact.loc[approx.index])
+    assert set(exact.index[1:4]) <= set(approx.index)
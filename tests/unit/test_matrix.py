@@ -0,0 +1,85 @@
+import strprofiler.utils as sp
+from strprofiler.profiles import ProfileSet
+from strprofiler.matrix import MATRIX_SCORES, UINT8_MISSING, pairwise_matrices
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+
+THIS_DIR = Path(__file__).parent
+
+app_database = Path(THIS_DIR / "../../strprofiler/shiny_app/www/main_database.csv")
+
+
+@pytest.fixture(scope="module")
+def profiles():
+    df = sp.str_ingress([app_database], sample_col="Sample", marker_col="Marker", penta_fix=True).iloc[:150]
+    # A duplicate and a profile sharing no markers with anything.
+    df.loc["Copy"] = df.iloc[7]
+    df.loc["Empty"] = ""
+    return ProfileSet.from_frame(df)
+
+
+def _expected(profiles, use_amel):
+    as_dict = {s: {m: p[m] for m in profiles.markers} for s, p in profiles.items()}
+    out = {s: np.full((len(profiles), len(profiles)), np.nan) for s in MATRIX_SCORES}
+    for i, q in enumerate(as_dict.values()):
+        for j, r in enumerate(as_dict.values()):
+            try:
+                scores = sp.score_query(q, r, use_amel=use_amel, amel_col="Amelogenin")
+            except ZeroDivisionError:
+                continue
+            for s in MATRIX_SCORES:
+                out[s][i, j] = scores[s]
+    return out
+
+
+@pytest.mark.parametrize("use_amel", [False, True])
+@pytest.mark.parametrize("block_size", [None, 17, 64])
+def test_matches_score_query(profiles, tmp_path, use_amel, block_size):
+
+    paths = pairwise_matrices(profiles, tmp_path, use_amel=use_amel, amel_col="Amelogenin", block_size=block_size)
+    expected = _expected(profiles, use_amel)
+    for s, path in paths.items():
+        matrix = np.load(path, mmap_mode="r")
+        assert matrix.dtype == np.float32 and matrix.shape == (len(profiles), len(profiles))
+        np.testing.assert_array_equal(matrix, expected[s].astype(np.float32))
+
+    assert (tmp_path / "samples.txt").read_text().splitlines() == profiles.samples.tolist()
+    header = json.loads((tmp_path / "matrix.json").read_text())
+    assert header["samples"] == len(profiles) and ("Amelogenin" in header["markers"]) == use_amel
+
+
+def test_uint8(profiles, tmp_path):
+
+    paths = pairwise_matrices(
+        profiles, tmp_path, amel_col="Amelogenin", dtype="uint8", scores=("tanabe_score",), block_size=40
+    )
+    assert list(paths) == ["tanabe_score"]
+    matrix = np.load(paths["tanabe_score"])
+    expected = _expected(profiles, False)["tanabe_score"]
+    missing = np.isnan(expected)
+    assert (matrix[missing] == UINT8_MISSING).all()
+    assert np.abs(matrix[~missing] - expected[~missing]).max() <= 0.5
+
+
+def test_memory_budget(profiles, tmp_path):
+
+    # A small budget means small tiles, with the same result.
+    big = pairwise_matrices(profiles, tmp_path / "big", amel_col="Amelogenin")
+    small = pairwise_matrices(profiles, tmp_path / "small", amel_col="Amelogenin", memory=1)
+    for s in MATRIX_SCORES:
+        np.testing.assert_array_equal(np.load(big[s]), np.load(small[s]))
+
+
+def test_cli(tmp_path):
+
+    from strprofiler.matrix import matrix
+
+    exp_database = THIS_DIR / "../Example_app_database.csv"
+    matrix.callback(input_files=[exp_database], output_dir=tmp_path, amel_col="Amelogenin", dtype="uint8")
+    samples = (tmp_path / "samples.txt").read_text().splitlines()
+    tanabe = pd.DataFrame(np.load(tmp_path / "tanabe_score.npy"), index=samples, columns=samples)
+    assert (np.diag(tanabe) == 100).all()
+    assert (tanabe.values == tanabe.values.T).all()
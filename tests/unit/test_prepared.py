@@ -0,0 +1,103 @@
+import strprofiler.shiny_app.calc_functions as cf
+import strprofiler.utils as sp
+import strprofiler.database as spdb
+from strprofiler.profiles import ProfileSet
+from strprofiler.scoring import PreparedQuery, SCORE_FIELDS, score_profiles
+import pandas as pd
+import pytest
+import random
+from collections import OrderedDict
+from math import nan
+from pathlib import Path
+
+THIS_DIR = Path(__file__).parent
+
+app_database = Path(THIS_DIR / "../../strprofiler/shiny_app/www/main_database.csv")
+
+
+@pytest.fixture(scope="module")
+def database():
+    df = sp.str_ingress([app_database], sample_col="Sample", marker_col="Marker", penta_fix=True)
+    return df.to_dict(orient="index")
+
+
+def _profile(database, sample):
+    return {k: v for k, v in database[sample].items() if k not in ["Center", "Passage"]}
+
+
+@pytest.mark.parametrize("amel_col", ["AMEL", "Amelogenin"])
+@pytest.mark.parametrize("use_amel", [False, True])
+def test_matches_score_query(database, use_amel, amel_col):
+
+    rng = random.Random(3)
+    reference = ProfileSet.from_dict(database, meta_columns=[])
+    samples = list(database)
+
+    for _ in range(10):
+        query = _profile(database, rng.choice(samples))
+        for m in rng.sample(list(query), 4):
+            query[m] = rng.choice(["", "12", "12, 13", "X,Y", "X", "9.3,7", "999", "8,8"])
+        # Parsed once, then scored against every reference.
+        prepared = PreparedQuery(query, use_amel=use_amel, amel_col=amel_col)
+        scores = score_profiles(prepared, reference)
+
+        for i in rng.sample(range(len(samples)), 100):
+            try:
+                expected = sp.score_query(query, database[samples[i]], use_amel=use_amel, amel_col=amel_col)
+            except ZeroDivisionError:
+                assert not scores["valid"][i]
+                continue
+            assert {k: scores[k][i] for k in SCORE_FIELDS} == expected
+
+
+def _legacy_batch_scores(query_df, str_database, use_amel, skip_self=False):
+    # Batch scoring as it was: score_query for every pair, one full row per reference.
+    out = {}
+    for s, q in query_df.items():
+        q_out = {
+            "Sample": s, "mixed": False, "query_sample": True,
+            "n_shared_markers": nan, "n_shared_alleles": nan, "n_query_alleles": nan, "n_reference_alleles": nan,
+            "tanabe_score": nan, "masters_query_score": nan, "masters_ref_score": nan,
+        }
+        q_out.update(q)
+        samp_comps = [q_out]
+        for sa, r in str_database.items():
+            if skip_self and sa == s:
+                continue
+            samp_out = OrderedDict({"Sample": sa})
+            samp_out.update(sp.score_query(query=q, reference=r, use_amel=use_amel))
+            samp_out.update(r)
+            samp_comps.append(samp_out)
+        full_samp_out = pd.DataFrame(samp_comps)
+        full_samp_out.sort_values(by="tanabe_score", ascending=False, inplace=True, na_position="first")
+        out[s] = full_samp_out
+    return out
+
+
+@pytest.mark.parametrize("use_amel", [False, True])
+def test_batch_matches_legacy(database, use_amel, tmp_path):
+
+    rng = random.Random(5)
+    query_df = {s: _profile(database, s) for s in rng.sample(list(database), 8)}
+    query_df["Edited"] = dict(query_df[next(iter(query_df))], TH01="6,9.3", TPOX="")
+    compiled = spdb.load_database(app_database, cache_dir=tmp_path)
+
+    thresholds = (3, 60, 70, 80)
+    expected = cf._summarize_scores(_legacy_batch_scores(query_df, database, use_amel), query_df, *thresholds)
+    for str_database in [database, compiled]:
+        pd.testing.assert_frame_equal(cf._batch_query(query_df, str_database, use_amel, *thresholds), expected)
+
+    expected = cf._summarize_scores(
+        _legacy_batch_scores(query_df, query_df, use_amel, skip_self=True), query_df, *thresholds
+    )
+    pd.testing.assert_frame_equal(cf._file_query(query_df, use_amel, *thresholds), expected)
+
+
+def test_prepared_once(database):
+
+    # The reference side is prepared once and kept with the profiles.
+    reference = ProfileSet.from_dict(database)
+    assert reference.prepared is reference.prepared
+    assert reference.prepared.present.flags.c_contiguous
+    # Identical profiles share one column.
+    assert reference.prepared.present.shape == (len(reference.markers), reference.units.max() + 1)
@@ -0,0 +1,109 @@
+import strprofiler.utils as sp
+from strprofiler.profiles import ProfileSet, Vocabulary
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+
+THIS_DIR = Path(__file__).parent
+
+app_database = Path(THIS_DIR / "../../strprofiler/shiny_app/www/main_database.csv")
+exp_database = Path(THIS_DIR / "../Example_app_database.csv")
+
+
+def _ingress(path):
+    return sp.str_ingress([path], sample_col="Sample", marker_col="Marker", sample_map=None, penta_fix=True)
+
+
+@pytest.mark.parametrize("path", [app_database, exp_database])
+def test_frame_roundtrip(path):
+
+    df = _ingress(path)
+    profiles = ProfileSet.from_frame(df)
+
+    pd.testing.assert_frame_equal(profiles.to_frame(), df)
+    assert profiles.to_dict() == df.to_dict(orient="index")
+    assert dict(profiles) == df.to_dict(orient="index")
+    assert list(profiles) == list(df.index)
+    assert "Center" in profiles.meta_columns and "Center" not in profiles.markers
+
+
+def test_dict_roundtrip():
+
+    profiles = {
+        "A": {"Amelogenin": "X,Y", "TH01": "6,9.3", "CSF1PO": ""},
+        "B": {"Amelogenin": "X", "TH01": "9.3", "CSF1PO": "10,12"},
+        # Missing markers decode as empty.
+        "C": {"TH01": "7"},
+    }
+    ps = ProfileSet.from_dict(profiles)
+
+    assert ps.columns == ["Amelogenin", "TH01", "CSF1PO"]
+    assert ps["A"] == profiles["A"]
+    assert ps["C"] == {"Amelogenin": "", "TH01": "7", "CSF1PO": ""}
+    assert ProfileSet.from_dict(ps.to_dict()).to_dict() == ps.to_dict()
+
+    # Codes are shared per marker; alleles are sets, so repeats collapse.
+    assert ps.alleles[ps.markers.index("TH01")] == ["6", "9.3", "7"]
+    assert ProfileSet.from_dict({"D": {"TH01": "8,8,9"}})["D"] == {"TH01": "8,9"}
+    assert ps.allele_counts.tolist() == [[2, 2, 0], [1, 1, 2], [0, 1, 0]]
+
+
+def test_take_and_lookup():
+
+    ps = ProfileSet.from_frame(_ingress(exp_database))
+    sub = ps.take([2, 0])
+
+    assert list(sub) == [ps.samples[2], ps.samples[0]]
+    assert sub[ps.samples[0]] == ps[ps.samples[0]]
+    assert ps.index(ps.samples[3]) == 3
+    assert "missing" not in ps
+    with pytest.raises(KeyError):
+        ps["missing"]
+
+
+def test_compact():
+
+    ps = ProfileSet.from_frame(_ingress(app_database))
+    assert not hasattr(ps, "__dict__")
+    assert ps.codes.dtype == np.int16 and ps.codes.flags.c_contiguous
+
+    # Marker names are interned once rather than repeated per profile.
+    assert all(m is c for m, c in zip(ps.markers, [c for c in ps.columns if c in ps.markers]))
+    print(f"{len(ps)} profiles in {ps.nbytes / 1e6:.2f} MB")
+    assert ps.nbytes < 200 * len(ps) * len(ps.markers)
+
+
+def test_shared_vocabulary():
+
+    db = ProfileSet.from_frame(_ingress(app_database))
+    query = ProfileSet.from_frame(_ingress(exp_database), vocab=db.vocab)
+
+    # Codes line up with the database's, so equal alleles compare as equal integers.
+    shared = [m for m in query.markers if m in db.markers]
+    assert shared
+    for m in shared:
+        j, k = query.markers.index(m), db.markers.index(m)
+        assert query.marker_ids[j] == db.marker_ids[k]
+        assert query.alleles[j] is db.alleles[k]
+    assert query.to_dict() == _ingress(exp_database).to_dict(orient="index")
+
+    # Encoding the query did not disturb the database's codes.
+    assert db.to_dict() == _ingress(app_database).to_dict(orient="index")
+
+    # A compiled vocabulary rebuilds with the same codes.
+    rebuilt = Vocabulary.from_alleles(db.markers, db.alleles)
+    assert [rebuilt.allele_codes(m) for m in db.markers] == db.allele_index
+
+
+def test_categorical():
+
+    df = _ingress(app_database)
+    cat = sp.str_ingress([app_database], categorical=True)
+    assert all(isinstance(t, pd.CategoricalDtype) for t in cat.dtypes)
+    assert cat.astype(str).equals(df)
+
+    view = ProfileSet.from_frame(cat).to_frame(categorical=True)
+    assert all(isinstance(t, pd.CategoricalDtype) for t in view.dtypes)
+    pd.testing.assert_frame_equal(view.astype(str), df)
+    assert view.memory_usage(deep=True).sum() < df.memory_usage(deep=True).sum() / 4
@@ -0,0 +1,82 @@
+import strprofiler.shiny_app.calc_functions as cf
+import strprofiler.utils as sp
+import strprofiler.database as spdb
+from strprofiler.profiles import ProfileSet
+from strprofiler.scoring import IncrementalScorer, score_profiles
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+
+THIS_DIR = Path(__file__).parent
+
+app_database = Path(THIS_DIR / "../../strprofiler/shiny_app/www/main_database.csv")
+
+
+@pytest.fixture(scope="module")
+def database():
+    # Copies of the first profiles under new names and Center/Passage, interleaved with the originals.
+    df = sp.str_ingress([app_database], sample_col="Sample", marker_col="Marker", penta_fix=True)
+    copies = df.iloc[:40].copy()
+    copies.index = [s + "_copy" for s in copies.index]
+    copies["Center"] = "Elsewhere"
+    copies["Passage"] = "99"
+    return pd.concat([df.iloc[:20], copies, df.iloc[20:]])
+
+
+def test_units(database):
+
+    db = ProfileSet.from_frame(database)
+    units = db.units
+    assert units[0] == 0 and (np.diff(np.maximum.accumulate(units)) <= 1).all()
+
+    # Copies share their original's unit however their metadata differ.
+    copies = [s for s in database.index if s.endswith("_copy")]
+    assert len(copies) == 40
+    for s in copies:
+        assert units[db.index(s)] == units[db.index(s[:-len("_copy")])]
+    assert len(db.prepared) == units.max() + 1 < len(db)
+
+    # Allele order within a cell does not matter.
+    ps = ProfileSet.from_dict({"A": {"TH01": "6,9.3"}, "B": {"TH01": "9.3,6"}, "C": {"TH01": "6"}})
+    assert ps.units.tolist() == [0, 0, 1]
+
+
+@pytest.mark.parametrize("use_amel", [False, True])
+def test_scores_expanded(database, use_amel):
+
+    db = ProfileSet.from_frame(database)
+    as_dict = database.to_dict(orient="index")
+    query = {m: as_dict[database.index[5]][m] for m in db.markers}
+
+    scores = score_profiles(query, db, use_amel=use_amel, amel_col="Amelogenin")
+    assert len(scores["tanabe_score"]) == len(db)
+    for i in range(0, len(db), 37):
+        expected = sp.score_query(query, db[db.samples[i]], use_amel=use_amel, amel_col="Amelogenin")
+        assert scores["tanabe_score"][i] == expected["tanabe_score"]
+        assert scores["n_shared_alleles"][i] == expected["n_shared_alleles"]
+
+    scorer = IncrementalScorer(db, use_amel=use_amel)
+    scorer.update(query)
+    live = scorer.scores()
+    for k in scores:
+        np.testing.assert_array_equal(live[k], scores[k])
+
+
+def test_result_table(database, tmp_path):
+
+    path = tmp_path / "database.csv"
+    database.to_csv(path, index_label="Sample")
+    db = spdb.load_database(path, cache_dir=tmp_path / "cache")
+    assert db.units.tolist() == ProfileSet.from_frame(database).units.tolist()
+
+    # Every sample of a matching unit is listed, with its own Center/Passage.
+    query = {m: database.iloc[3][m] for m in db.markers}
+    out = cf._single_query(query, db, False, 3, "Tanabe", 100).set_index("Sample")
+    original = database.index[3]
+    assert {original, original + "_copy"} <= set(out.index)
+    assert out.loc[original + "_copy", "Center"] == "Elsewhere"
+    assert out.loc[original, "Center"] == database.loc[original, "Center"]
+
+    batch = cf._batch_query({"q": query}, db, False, 3, 80, 80, 80)
+    assert original in batch["Tanabe Matches"].iloc[0] and original + "_copy" in batch["Tanabe Matches"].iloc[0]
@@ -0,0 +1,61 @@
+from strprofiler.shiny_app.shiny_app import _page_results, _highlight_non_matches
+import numpy as np
+import pandas as pd
+import pytest
+from math import nan
+
+
+@pytest.fixture
+def results():
+    rng = np.random.default_rng(0)
+    n = 1000
+    df = pd.DataFrame({
+        "Sample": ["Query"] + [f"Ref_{i:04d}" for i in range(n)],
+        "Tanabe Score": [nan] + list(np.round(rng.uniform(0, 100, n), 2)),
+        "CSF1PO": ["10,12"] + list(rng.choice(["10,12", "11", "12"], n)),
+        "TH01": ["7"] + list(rng.choice(["7", "9.3", ""], n)),
+    })
+    return df
+
+
+def test_paging(results):
+
+    page, n_rows, n_pages, p = _page_results(results, page=3, page_size=50)
+    assert (n_rows, n_pages, p) == (1000, 20, 3)
+    # Query row pinned first, followed by the requested slice.
+    assert list(page["Sample"]) == ["Query"] + list(results["Sample"][101:151])
+
+    # Out-of-range pages are clamped.
+    assert _page_results(results, page=99, page_size=300)[3] == 4
+    assert len(_page_results(results, page=4, page_size=300)[0]) == 1 + 100
+
+
+def test_sort_filter(results):
+
+    page, n_rows, _, _ = _page_results(results, page_size=10, sort_by="Tanabe Score", descending=True)
+    assert page["Sample"].iloc[0] == "Query"
+    assert list(page["Tanabe Score"].iloc[1:]) == sorted(results["Tanabe Score"].iloc[1:], reverse=True)[:10]
+
+    page, n_rows, _, _ = _page_results(results, filter_text="ref_00", filter_cols=["Sample"], page_size=500)
+    assert n_rows == 100
+    assert page["Sample"].iloc[1:].str.startswith("Ref_00").all()
+
+    # CLASTR scores are strings, but sort numerically.
+    clastr = pd.DataFrame({"name": ["Query", "a", "b", "c"], "score": ["", "9.50", "100.00", "80.00"]})
+    page = _page_results(clastr, sort_by="score", descending=True)[0]
+    assert list(page["name"]) == ["Query", "b", "c", "a"]
+
+
+def test_highlight(results):
+
+    page = _page_results(results, page=2, page_size=25)[0]
+    css = _highlight_non_matches(page, ["CSF1PO", "TH01"])
+
+    # Same result as the former per-column Styler function.
+    for m in ["CSF1PO", "TH01"]:
+        expected = [
+            "text-align:center" if v == page[m].iloc[0] else "text-align:center;background-color:#ec7a80"
+            for v in page[m]
+        ]
+        assert list(css[m]) == expected
+    assert css.shape == (26, 2)
@@ -0,0 +1,66 @@
+import strprofiler.shiny_app.calc_functions as cf
+import strprofiler.database as spdb
+import pandas as pd
+import pytest
+from pathlib import Path
+
+THIS_DIR = Path(__file__).parent
+
+app_database = Path(THIS_DIR / "../../strprofiler/shiny_app/www/main_database.csv")
+exp_database = Path(THIS_DIR / "../Example_app_database.csv")
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("STRPROFILER_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(cf, "_score_cache", cf._ScoreCache(maxsize=2))
+    return cf._score_cache
+
+
+def _profile(database, sample):
+    return {k: v for k, v in database[sample].items() if k not in ["Center", "Passage"]}
+
+
+def test_repeat_query(cache, monkeypatch):
+
+    database = spdb.load_database(app_database)
+    query = _profile(database, list(database)[0])
+    first = cf._single_query(query, database, False, 3, "Tanabe", 50)
+    assert len(cache) == 1
+
+    # Repeats, in any allele order, skip scoring entirely.
+    def _fail(*args, **kwargs):
+        raise AssertionError("query was scored again")
+
+    monkeypatch.setattr(cf, "_score_database", _fail)
+    pd.testing.assert_frame_equal(cf._single_query(query, database, False, 3, "Tanabe", 50), first)
+
+    reordered = dict(query, D21S11=",".join(reversed(query["D21S11"].split(","))))
+    assert reordered["D21S11"] != query["D21S11"]
+    again = cf._single_query(reordered, database, False, 3, "Masters Query", 0)
+    assert again["D21S11"].iloc[0] == reordered["D21S11"]
+
+    # Scoring parameters are part of the key.
+    with pytest.raises(AssertionError):
+        cf._single_query(query, database, True, 3, "Tanabe", 50)
+
+
+def test_database_change(cache):
+
+    database = spdb.load_database(app_database)
+    other = spdb.load_database(exp_database)
+    query = {m: "" for m in database.markers}
+    query.update({"Amelogenin": "X,Y", "CSF1PO": "12", "TH01": "7,9.3"})
+
+    cf._cached_score_database(query, database, False)
+    assert cf._score_key(query, database.digest, False) != cf._score_key(query, other.digest, False)
+    cf._cached_score_database(query, other, False)
+    cf._cached_score_database(dict(query, CSF1PO="11"), other, False)
+
+    # Bounded: the least recently used entry was evicted.
+    assert len(cache) == 2
+    assert cache.get(cf._score_key(query, database.digest, False)) is None
+
+    # Plain dictionaries have no content hash and bypass the cache.
+    cf._cached_score_database(query, dict(database), False)
+    assert len(cache) == 2
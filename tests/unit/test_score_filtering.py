@@ -0,0 +1,54 @@
+import strprofiler.shiny_app.calc_functions as cf
+import strprofiler.utils as sp
+import pandas as pd
+import pytest
+from pathlib import Path
+
+THIS_DIR = Path(__file__).parent
+
+app_database = Path(THIS_DIR / "../../strprofiler/shiny_app/www/main_database.csv")
+
+
+@pytest.fixture(scope="module")
+def database():
+    df = sp.str_ingress([app_database], sample_col="Sample", marker_col="Marker", penta_fix=True)
+    return df.to_dict(orient="index")
+
+
+def _profile(database, sample):
+    return {k: v for k, v in database[sample].items() if k not in ["Center", "Passage"]}
+
+
+@pytest.mark.parametrize("use_amel", [False, True])
+def test_refilter_single(database, use_amel):
+
+    query = _profile(database, list(database)[3])
+    scores = cf._score_database(query, database, use_amel)
+    before = scores.copy()
+
+    # Any score type / threshold combination is served from one scoring pass.
+    for query_filter in ["Tanabe", "Masters Query", "Masters Reference"]:
+        for threshold in [0, 40, 80]:
+            for mix in [0, 3]:
+                pd.testing.assert_frame_equal(
+                    cf._filter_scores(scores, query, mix, query_filter, threshold, database),
+                    cf._single_query(query, database, use_amel, mix, query_filter, threshold),
+                )
+    pd.testing.assert_frame_equal(scores, before)
+
+
+def test_resummarize_batch(database):
+
+    query_df = {s: _profile(database, s) for s in list(database)[:5]}
+    scores = cf._batch_scores(query_df, database, False)
+    file_scores = cf._file_scores(query_df, False)
+
+    for thresholds in [(3, 80, 80, 80), (0, 50, 60, 70)]:
+        pd.testing.assert_frame_equal(
+            cf._summarize_scores(scores, query_df, *thresholds),
+            cf._batch_query(query_df, database, False, *thresholds),
+        )
+        pd.testing.assert_frame_equal(
+            cf._summarize_scores(file_scores, query_df, *thresholds),
+            cf._file_query(query_df, False, *thresholds),
+        )
@@ -0,0 +1,121 @@
+import strprofiler.shiny_app.calc_functions as cf
+import strprofiler.utils as sp
+from strprofiler.database import load_database
+from strprofiler.profiles import ProfileSet
+from strprofiler.scoring import score_profiles
+from strprofiler.store import ProfileStore, build_store, db
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+from pathlib import Path
+
+THIS_DIR = Path(__file__).parent
+
+app_database = Path(THIS_DIR / "../../strprofiler/shiny_app/www/main_database.csv")
+
+
+@pytest.fixture(scope="module")
+def database():
+    df = sp.str_ingress([app_database], sample_col="Sample", marker_col="Marker", penta_fix=True)
+    return df, ProfileSet.from_frame(df)
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    path = build_store([app_database], tmp_path_factory.mktemp("store") / "reference.sqlite")
+    store = ProfileStore(path)
+    yield store
+    store.close()
+
+
+def test_mapping(database, store):
+
+    df, _ = database
+    assert len(store) == len(df)
+    # Names are iterated in fetch batches, and lazily.
+    assert list(store) == df.index.tolist()
+    assert next(iter(store)) == df.index[0]
+    assert store.markers == [c for c in df.columns if c not in ("Center", "Passage")]
+    assert store[df.index[5]] == df.iloc[5].to_dict()
+    with pytest.raises(KeyError):
+        store["NotASample"]
+
+    # Profiles are fetched in the order asked for, across fetch batches.
+    ids = np.array([1000, 3, 950, 3] + list(range(1200, 1250)))
+    pd.testing.assert_frame_equal(store.take(ids).to_frame(), ProfileSet.from_frame(df.iloc[ids]).to_frame())
+
+
+@pytest.mark.parametrize("use_amel", [False, True])
+def test_search_matches_scan(database, store, use_amel):
+
+    df, profiles = database
+    for i in range(0, len(df), 151):
+        query = {m: df.iloc[i][m] for m in profiles.markers}
+        ids, candidates, scores = store.search(query, use_amel=use_amel, amel_col="Amelogenin")
+        assert candidates.samples.tolist() == df.index[ids].tolist()
+
+        # Candidates score exactly as in a full scan, and every reference scoring above 0 is a candidate.
+        exact = score_profiles(query, profiles, use_amel=use_amel, amel_col="Amelogenin")
+        for k in exact:
+            np.testing.assert_array_equal(scores[k], exact[k][ids])
+        assert set(np.flatnonzero(exact["valid"] & (exact["tanabe_score"] > 0))) <= set(ids.tolist())
+
+        # Requiring more shared alleles narrows the candidates.
+        assert set(store.candidates(query, amel_col="Amelogenin", min_shared=15)) < set(ids.tolist())
+
+
+def test_app_results(database, store):
+
+    df, _ = database
+    compiled = load_database(app_database, use_cache=False)
+    query = df.iloc[42].to_dict()
+    args = (False, 3, "Tanabe", 60)
+    expected = cf._single_query(query, compiled, *args)
+    pd.testing.assert_frame_equal(cf._single_query(query, store, *args), expected)
+
+    batch = {"A": df.iloc[42].to_dict(), "B": df.iloc[700].to_dict(), "C": df.iloc[42].to_dict()}
+    pd.testing.assert_frame_equal(
+        cf._batch_query(batch, store, False, 3, 60, 60, 60), cf._batch_query(batch, compiled, False, 3, 60, 60, 60)
+    )
+
+
+def test_cli(tmp_path):
+
+    path = tmp_path / "reference.sqlite"
+    result = CliRunner().invoke(db, ["build", "-o", str(path), str(app_database)])
+    assert result.exit_code == 0, result.output
+    assert "Wrote 1258 profiles" in result.output
+
+    # Rebuilding replaces the store in place.
+    assert CliRunner().invoke(db, ["build", "-o", str(path), str(app_database)]).exit_code == 0
+    assert len(ProfileStore(path)) == 1258
+    assert not list(tmp_path.glob(".tmp-*"))
+
+    with pytest.raises(ValueError):
+        ProfileStore(app_database)
+
+
+def test_cli_compare(database, tmp_path):
+
+    from strprofiler.strprofiler import strprofiler as compare
+
+    df, _ = database
+    queries = df.iloc[[3, 300]].copy()
+    queries.index = ["Sample_A", "Sample_B"]
+    queries["TH01"] = "7"
+    queries.to_csv(tmp_path / "queries.csv", index_label="Sample")
+    build_store([app_database], tmp_path / "reference.sqlite")
+    kwargs = dict(
+        input_files=[tmp_path / "queries.csv"], sample_col="Sample", sample_map=None,
+        tan_threshold=80, mas_q_threshold=80, mas_r_threshold=80, mix_threshold=3,
+    )
+    compare.callback(output_dir=tmp_path / "csv", database=app_database, **kwargs)
+    compare.callback(output_dir=tmp_path / "store", database=tmp_path / "reference.sqlite", min_shared=10, **kwargs)
+
+    exact = pd.read_csv(next((tmp_path / "csv").glob("Sample_A.strprofiler.*.csv"))).set_index("Sample")
+    stored = pd.read_csv(next((tmp_path / "store").glob("Sample_A.strprofiler.*.csv"))).set_index("Sample")
+    # Only candidates are reported, with their exact scores and alleles.
+    assert len(stored) < len(exact)
+    pd.testing.assert_frame_equal(stored, exact.loc[stored.index])
+    assert set(exact.index[1:4]) <= set(stored.index)
@@ -0,0 +1,188 @@
+import strprofiler.shiny_app.calc_functions as cf
+import strprofiler.utils as sp
+from strprofiler.store import ProfileStore, build_store, add_profiles, remove_profiles, compact_store, db
+import numpy as np
+import sqlite3
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+from pathlib import Path
+
+THIS_DIR = Path(__file__).parent
+
+app_database = Path(THIS_DIR / "../../strprofiler/shiny_app/www/main_database.csv")
+
+
+@pytest.fixture(scope="module")
+def frame():
+    return sp.str_ingress([app_database], sample_col="Sample", marker_col="Marker", penta_fix=True)
+
+
+@pytest.fixture
+def path(frame, tmp_path):
+    # A store of the first 1000 profiles; the rest are added by the tests.
+    frame.iloc[:1000].to_csv(tmp_path / "base.csv", index_label="Sample")
+    return build_store([tmp_path / "base.csv"], tmp_path / "reference.sqlite")
+
+
+def _results(store, frame, rows):
+    """Candidate names and scores of some queries, independent of store ids."""
+    out = []
+    for i in rows:
+        _, candidates, scores = store.search(frame.iloc[i].to_dict(), amel_col="Amelogenin")
+        out.append(pd.DataFrame({k: scores[k] for k in scores}, index=candidates.samples).sort_index())
+    return out
+
+
+def test_updates_match_rebuild(frame, path, tmp_path):
+
+    store = ProfileStore(path)
+    digest = store.digest
+    assert add_profiles(path, frame.iloc[1000:]) == len(frame) - 1000
+    assert remove_profiles(path, frame.index[[3, 500, 1100]]) == 3
+
+    # The open store sees both updates, under a new digest.
+    assert len(store) == len(frame) - 3
+    assert store.generation == 2 and store.digest != digest
+    assert frame.index[1200] in store and frame.index[500] not in store
+
+    expected = frame.drop(frame.index[[3, 500, 1100]])
+    expected.to_csv(tmp_path / "full.csv", index_label="Sample")
+    rebuilt = ProfileStore(build_store([tmp_path / "full.csv"], tmp_path / "rebuilt.sqlite"))
+    rows = [0, 3, 777, 1100, 1250]
+    for a, b in zip(_results(store, frame, rows), _results(rebuilt, frame, rows)):
+        pd.testing.assert_frame_equal(a, b)
+
+    # Compaction leaves the contents alone.
+    compact_store(path)
+    for a, b in zip(_results(store, frame, rows), _results(rebuilt, frame, rows)):
+        pd.testing.assert_frame_equal(a, b)
+
+
+def test_add_conflicts(frame, path):
+
+    store = ProfileStore(path)
+    changed = frame.iloc[[10]].copy()
+    changed["TH01"] = "99"
+    with pytest.raises(ValueError):
+        add_profiles(path, changed)
+    assert store[frame.index[10]]["TH01"] == frame.iloc[10]["TH01"] and store.generation == 0
+
+    add_profiles(path, changed, replace=True)
+    assert store[frame.index[10]]["TH01"] == "99"
+    assert len(store) == 1000
+    # The replaced profile's index rows went with it.
+    assert len(store.candidates({"TH01": "99"})) == 1
+    assert 10 not in store.candidates({"TH01": frame.iloc[10]["TH01"]}, min_shared=1).tolist()
+
+
+def test_remove_missing(frame, path):
+
+    with pytest.raises(KeyError):
+        remove_profiles(path, [frame.index[0], "NotASample"])
+    assert len(ProfileStore(path)) == 1000
+
+
+def test_new_columns(frame, path):
+
+    store = ProfileStore(path)
+    add_profiles(path, {"New": {"TH01": "7", "D99S1": "10,11"}})
+    assert store.columns[-1] == "D99S1" and "D99S1" in store.markers
+    # Earlier profiles have the new marker empty, and the new profile every other marker empty.
+    assert store[frame.index[0]]["D99S1"] == ""
+    assert store["New"]["CSF1PO"] == "" and store["New"]["D99S1"] == "10,11"
+    assert store.take([0, 1000]).to_frame().loc["New", "D99S1"] == "10,11"
+    assert store.candidates({"D99S1": "11"}).tolist() == [1000]
+
+
+def test_removal_compacts(frame, path):
+
+    store = ProfileStore(path)
+    remove_profiles(path, frame.index[:600])
+    # Enough of the store was freed for it to be compacted.
+    con = sqlite3.connect(path)
+    assert con.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    con.close()
+    assert len(store) == 400
+
+
+def test_rebuild_seen(frame, path, tmp_path):
+
+    store = ProfileStore(path)
+    build_store([app_database], path)
+    assert len(store) == len(frame)
+
+
+def test_score_cache(frame, path):
+
+    store = ProfileStore(path)
+    query = frame.iloc[1100].to_dict()
+    before = cf._cached_score_database(query, store, False)
+    add_profiles(path, frame.iloc[[1100]])
+    after = cf._cached_score_database(query, store, False)
+    assert frame.index[1100] not in before["Sample"].tolist()
+    assert after.loc[after["Sample"] == frame.index[1100], "tanabe_score"].item() == 100
+    assert np.isin(before["Sample"], after["Sample"]).all()
+
+
+def test_cli(frame, path, tmp_path):
+
+    frame.iloc[1000:1010].to_csv(tmp_path / "new.csv", index_label="Sample")
+    runner = CliRunner()
+    result = runner.invoke(db, ["add", str(path), str(tmp_path / "new.csv")])
+    assert result.exit_code == 0, result.output
+    assert "Added 10 profiles" in result.output
+
+    # Adding again fails unless replacing.
+    assert runner.invoke(db, ["add", str(path), str(tmp_path / "new.csv")]).exit_code == 1
+    assert runner.invoke(db, ["add", "-r", "True", str(path), str(tmp_path / "new.csv")]).exit_code == 0
+
+    result = runner.invoke(db, ["remove", str(path), frame.index[0], frame.index[1005]])
+    assert result.exit_code == 0, result.output
+    assert "Removed 2 profiles" in result.output
+    assert runner.invoke(db, ["remove", str(path), "NotASample"]).exit_code == 1
+
+    assert runner.invoke(db, ["compact", str(path)]).exit_code == 0
+    assert len(ProfileStore(path)) == 1008
+
+
+def test_ids_not_reused(frame, path):
+
+    store = ProfileStore(path)
+    remove_profiles(path, frame.index[[999]])
+    add_profiles(path, frame.iloc[[1000]])
+    # The new profile takes a fresh id rather than the removed one's.
+    assert store.candidates(frame.iloc[1000].to_dict()).tolist()[-1] == 1000
+    with pytest.raises(KeyError):
+        store.take([999])
+    assert store.frame([998, 999, 1000], missing_ok=True)["Sample"].tolist() == frame.index[[998, 1000]].tolist()
+
+
+def test_search_snapshot(frame, path, monkeypatch):
+
+    # A removal between finding candidates and fetching them doesn't reach the search.
+    store = ProfileStore(path)
+    query = frame.iloc[5].to_dict()
+    candidates = ProfileStore.candidates
+
+    def remove_after(self, *args, **kwargs):
+        ids = candidates(self, *args, **kwargs)
+        remove_profiles(path, frame.index[[5]])
+        return ids
+
+    monkeypatch.setattr(ProfileStore, "candidates", remove_after)
+    ids, profiles, scores = store.search(query)
+    assert frame.index[5] in profiles.samples.tolist()
+    assert frame.index[5] not in store
+
+
+def test_results_after_removal(frame, path):
+
+    # Results found before a removal still show, without the removed profile's alleles.
+    store = ProfileStore(path)
+    query = frame.iloc[5].to_dict()
+    scores = cf._score_database(query, store, False)
+    remove_profiles(path, frame.index[[5]])
+    joined = cf._join_alleles(scores, query, store)
+    assert joined.loc[6, "Sample"] == frame.index[5] and pd.isna(joined.loc[6, "TH01"])
+    assert joined.loc[1, "TH01"] == frame.iloc[0]["TH01"]
@@ -0,0 +1,65 @@
+import strprofiler.utils as sp
+import strprofiler.shiny_app.clastr_api as ca
+import gzip
+import io
+import json
+import random
+import pandas as pd
+import pytest
+
+from test_clastr_parse import _random_results
+
+
+def _frame(n):
+    return pd.DataFrame({
+        "Sample": [f"S{i}" for i in range(n)],
+        "Score": [i / 3 for i in range(n)],
+        "TH01": ["6,9.3" if i % 2 else "" for i in range(n)],
+    })
+
+
+@pytest.mark.parametrize("n", [0, 1, 7, 50])
+def test_csv_chunks(n):
+
+    # Chunked output is byte-for-byte the one-shot CSV.
+    df = _frame(n)
+    chunks = list(sp._csv_chunks(df, chunk_rows=7))
+    assert "".join(chunks) == df.to_csv(index=False)
+    assert len(chunks) == 1 + -(-n // 7)
+
+
+def test_gzip_chunks():
+
+    df = _frame(100)
+    data = b"".join(sp._gzip_chunks(sp._csv_chunks(df, chunk_rows=7)))
+    assert gzip.decompress(data).decode() == df.to_csv(index=False)
+
+
+def _sheets(seed):
+    rng = random.Random(seed)
+    query = {"TH01": "6,9.3", "TPOX": "8,11"}
+    return [
+        (f"Query{i}", ca._parse_clastr_results(dict(query), json.loads(json.dumps(_random_results(rng)))))
+        for i in range(3)
+    ]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_sheets_csv_chunks(seed):
+
+    sheets = _sheets(seed)
+    expected = ca._batch_sheets_to_tidy(sheets).to_csv(index=False)
+    assert "".join(ca._batch_sheets_to_csv_chunks(sheets)) == expected
+
+
+def test_batch_sheets_xlsx_file(tmp_path):
+
+    sheets = _sheets(0)
+    path = tmp_path / "out.xlsx"
+    ca._batch_sheets_to_xlsx(sheets, path)
+
+    from_file = pd.read_excel(path, sheet_name=None)
+    from_bytes = pd.read_excel(io.BytesIO(ca._batch_sheets_to_xlsx(sheets)), sheet_name=None)
+    assert list(from_file) == [name for name, _ in sheets]
+    for name in from_file:
+        pd.testing.assert_frame_equal(from_file[name], from_bytes[name])